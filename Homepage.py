@@ -0,0 +1,4 @@
+from utils import warmup
+
+# 服务启动后第一次打开应用时，在后台预加载分词词典与重型模块，之后打开各页面无需等待
+warmup.start()
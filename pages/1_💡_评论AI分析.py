@@ -1,7 +1,13 @@
 import streamlit as st
-from openai import OpenAI
 import pandas as pd
+import os
 import re
+from itertools import islice
+
+from utils import (compress, dataset_cache, dataset_session, hedging, incremental, jobs, llm, llm_pool,
+                   metrics, near_duplicates, sampling, surrogate, tokens, visual_ratio)
+
+metrics.sidebar_toggle("评论AI分析")
 
 # 设置 Streamlit  标题
 st.title("评论分析工具")
@@ -10,12 +16,20 @@ st.title("评论分析工具")
 api_key = st.text_input("API 密钥", type="password")
 base_url = st.text_input("Base URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 
-# 上传 CSV 文件
-uploaded_file = st.file_uploader("上传评论数据表", type="csv")
+# 使用各页面共享的评论数据表
+dataset = dataset_session.dataset_picker()
 
 # 输入模型名称
 model_name = st.text_input("模型名称", "qwen-turbo")
 
+# 模型级联：先用上面较快、较便宜的模型并限制回答长度，无法解析或含糊的回答再交给更强的模型
+with st.expander("模型级联"):
+    cascade = st.checkbox("启用模型级联", value=False)
+    st.caption("回答统一规范为“是”/“否”；启用多端点时，升级请求只发往模型为升级模型的端点，"
+               "没有这样的端点时用各端点的密钥和地址请求升级模型")
+    fallback_model = st.text_input("升级模型（较强）", "qwen-plus") if cascade else None
+    label_max_tokens = st.number_input("首轮回答最大 Token 数", value=4, min_value=1, step=1) if cascade else None
+
 # 输入系统提示语
 system_prompt = st.text_area("系统提示语", "You are a helpful assistant.")
 
@@ -25,22 +39,49 @@ user_prompt_template = st.text_area("用户提示语模板",
                                     "期望了解观众是否有在关注视频中的画面信息（而不是关注配音或者口播内容）。请你帮我分类每一条评论是否与画面信息相关。"
                                     "只需回答‘是’or‘否’。中括号包裹的是表情包，可以忽略。\n\n评论：{comment}\n分类：")
 
+# 合并模式：一次请求同时得到分类和关键词分析，“关键词划分”页面不再需要重新发送视觉类评论
+with st.expander("合并模式（分类与关键词分析一次完成）"):
+    combined = st.checkbox("一次请求同时返回分类和关键词分析（JSON）", value=False)
+    combined_prompt_template = st.text_area(
+        "合并提示语模板",
+        "以下内容出自网络视频评论区。我是这个视频的作者，本期的视觉设计是：数据分析、数据、可视化、八爪鱼、数据建模，"
+        "期望了解观众是否有在关注视频中的画面信息（而不是关注配音或者口播内容）。请判断这条评论是否与画面信息相关，"
+        "相关时再对评论进行关键词分析。中括号包裹的是表情包，可以忽略。\n"
+        "只返回 JSON：{{\"分类\": \"是\" 或 \"否\", \"关键词分析\": \"相关时填写关键词分析结果，否则留空\"}}\n\n"
+        "评论：{comment}", disabled=not combined)
+    st.caption("结果同时写入 classification 和 keyword_analysis 两列；JSON 无法解析的回答记为“无法分类”")
+
 # 输入其他参数
 temperature = st.slider("Temperature", 0.0, 1.0, 0.8)
 top_p = st.slider("Top P", 0.0, 1.0, 0.8)
-max_comment_length = st.number_input("最大评论长度", value=1000, step=1)
+max_comment_tokens = st.number_input("最大评论 Token 数", value=500, min_value=1, step=1)
+compress_labels = st.multiselect("发送前移除或压缩的内容", compress.rule_labels(), default=compress.rule_labels())
+compress_rules = compress.rules_from_labels(compress_labels)
+concurrency = st.number_input("并发请求数", min_value=1, max_value=64, value=1, step=1)
+retries = st.number_input("限流/超时重试次数", min_value=0, max_value=10, value=3, step=1)
+request_timeout = st.number_input("单次请求超时（秒）", min_value=1.0, value=60.0, step=5.0)
+rpm = st.number_input("每分钟请求数上限（0 表示不限）", min_value=0, value=0, step=10)
+tpm = st.number_input("每分钟 Token 数上限（0 表示不限）", min_value=0, value=0, step=1000)
+# 多个端点分担请求时，并发请求数为各端点并发上限之和
+endpoints = llm_pool.endpoint_editor(api_key, base_url, model_name)
+if endpoints:
+    concurrency = sum(spec[3] for spec in endpoints)
+# 启用多端点时主请求的模型由各端点决定；模型级联的升级请求发往提供升级模型的端点
+request_model = None if endpoints else model_name
+hedge = hedging.hedge_settings()
 
 # 输入输出文件名
 output_filename = st.text_input("输出文件名", "classified_comments_with_likes.csv")
 
-if uploaded_file is not None:
-    # 读取上传的 CSV 文件1
-    st.write("正在读取上传的 CSV 文件...")
-    data = pd.read_csv(uploaded_file)
-
+if dataset is not None:
     # 让用户选择分析所在的列
-    comment_column = st.selectbox("选择评论内容所在列", data.columns)
-    likes_column = st.selectbox("选择点赞数所在列", data.columns)
+    comment_column = dataset_session.role_column('comment', "选择评论内容所在列")
+    likes_column = dataset_session.role_column('likes', "选择点赞数所在列")
+
+    with metrics.stage("读取数据表") as s:
+        # 结果需要保留全部列；共享的数据需要复制后再修改
+        data = dataset_session.load_frame().copy()
+        s.rows = len(data)
 
     data[comment_column] = data[comment_column].fillna('')  # 用空字符串填充缺失值
     data[comment_column] = data[comment_column].astype(str)  # 转换为字符串
@@ -50,104 +91,343 @@ if uploaded_file is not None:
     st.write("CSV 文件读取完毕，预览数据：")
     st.dataframe(data.head())  # 显示前五行数据
 
+    # 增量模式：复用上次的分类结果，只分析新增或被修改的评论
+    previous_labels = [None] * len(comments)
+    previous_analyses = [None] * len(comments)
+    with st.expander("增量模式"):
+        previous_file = st.file_uploader("上传上次的分类结果", type=["csv", "xlsx"], key="previous_output")
+        no_column = "（无）"
+        id_column = st.selectbox("评论 ID 列（没有时按评论内容 + 作者匹配）", [no_column] + list(data.columns))
+        author_column = st.selectbox("作者列", [no_column] + list(data.columns))
+        if previous_file is not None:
+            with metrics.stage("匹配上次结果") as s:
+                previous = dataset_cache.read_columns(dataset_cache.cache_upload(previous_file))
+                key_columns = [c for c in (comment_column, id_column, author_column, 'classification',
+                                           'keyword_analysis' if combined else no_column) if c != no_column]
+                missing_columns = [c for c in key_columns if c not in previous.columns]
+                if missing_columns:
+                    st.error(f"上次的分类结果缺少列：{', '.join(map(str, missing_columns))}")
+                else:
+                    match_columns = dict(id_column=None if id_column == no_column else id_column,
+                                         author_column=None if author_column == no_column else author_column)
+                    previous_labels = incremental.reuse_labels(data, previous, comment_column, **match_columns)
+                    if combined:
+                        # 合并模式下视觉类评论还需要有可复用的关键词分析，否则重新发送
+                        previous_analyses = incremental.reuse_labels(data, previous, comment_column,
+                                                                     label_column='keyword_analysis', **match_columns)
+                        previous_labels = [None if label == llm.LABEL_YES and analysis is None else label
+                                           for label, analysis in zip(previous_labels, previous_analyses)]
+                s.rows = len(previous)
+            reused = sum(label is not None for label in previous_labels)
+            st.write(f"复用上次结果 {reused} 条，需要重新分析 {len(comments) - reused} 条")
+
+    # 近似重复评论（刷屏、复制粘贴）聚为一簇，每簇只把一条代表评论发给大模型，结果同步给簇内其他评论；
+    # 每条评论保留自己的点赞数，加权占比仍按全部评论计算
+    cluster_ids = None
+    with st.expander("近似重复评论"):
+        dedupe = st.checkbox("每个近似重复簇只分析一条代表评论（点赞最多的一条）", value=False)
+        duplicate_threshold = st.slider("近似重复相似度阈值", 0.5, 1.0, 0.8, 0.05, key="duplicate_threshold")
+        if dedupe:
+            with metrics.stage("近似重复聚类", rows=len(comments)):
+                cluster_ids = near_duplicates.for_column(dataset['path'], comment_column, duplicate_threshold)
+            clusters = near_duplicates.summary(cluster_ids, comments, data[likes_column])
+            st.write(f"{int(clusters['评论数'].sum())} 条评论属于 {len(clusters)} 个近似重复簇，"
+                     f"可少发送 {int(clusters['评论数'].sum()) - len(clusters)} 条")
+            st.dataframe(clusters.head(20), hide_index=True)
+
+    def pending_rows():
+        # 需要发送的评论行号，以及 {行号: 代表行号}（未启用近似重复合并时为空）
+        rows = [i for i, label in enumerate(previous_labels) if label is None]
+        if cluster_ids is None:
+            return rows, {}
+        representative = near_duplicates.representatives(
+            cluster_ids, visual_ratio.numeric_likes(data[likes_column]).to_numpy(), rows)
+        return sorted(set(representative.values())), representative
+
     # 定义预处理函数
-    def preprocess_comment(comment):
+    def preprocess_comment(comment, rules=None):
         if not isinstance(comment, str):
             comment = str(comment)
+        comment = compress.compress(comment, compress_rules if rules is None else rules)  # 表情、@、链接等不再发送
         comment = re.sub(r'[^\w\s,.:?!]', '', comment)  # 移除除了字母、数字、空格和基本标点符号外的所有字符
         comment = comment.strip()  # 去除前后空格
-        return comment[:max_comment_length]
+        return tokens.truncate_to_tokens(comment, max_comment_tokens)  # 按 token 预算截断
+
+    def prepare_comments(rows):
+        # 预处理待分析的评论；压缩后为空的评论不再发送，返回 {行号: 发送内容} 和压缩报告
+        rows = [i for i in rows if not llm.is_skippable(comments[i])]
+        prepared = {i: preprocess_comment(comments[i]) for i in rows}
+        baseline = [preprocess_comment(comments[i], rules=()) for i in rows]
+        return {i: text for i, text in prepared.items() if text}, compress.report(baseline, list(prepared.values()))
+
+    def report_lines(report):
+        return [f"提示压缩：{report['comments']} 条评论的输入 Token 从 {report['tokens_before']} 降至 "
+                f"{report['tokens_after']}（节省 {report['saved_ratio']:.1%}），"
+                f"{report['emptied']} 条压缩后为空不再发送"]
+
+    # 定义分析函数，请求出错信息和升级到更强模型的结果先收集起来
+    errors = []
+    escalations = []
 
-    # 定义分析函数
     def analyze_comment(client, comment):
-        messages = [
-            {'role': 'system', 'content': system_prompt},
-            {'role': 'user', 'content': user_prompt_template.format(comment=comment)}
-        ]
-        try:
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p
-            )
-            classification = completion.choices[0].message.content.strip()
-        except Exception as e:
-            error_message = str(e)
-            if "data_inspection_failed" in error_message:
-                classification = "不适当内容"
-            else:
-                st.error(f"分析评论时出错: {e}")
-                classification = "无法分类"
-        return classification
+        return llm.classify_comment(client, comment, request_model, system_prompt, user_prompt_template,
+                                    temperature, top_p, retries=retries, limiter=limiter,
+                                    on_error=errors.append, max_tokens=label_max_tokens,
+                                    fallback_model=fallback_model,
+                                    on_escalate=lambda answer, label: escalations.append(label))
+
+    def analyze_combined(client, comment):
+        return llm.classify_and_analyze(client, comment, request_model, system_prompt, combined_prompt_template,
+                                        temperature, top_p, retries=retries, limiter=limiter,
+                                        on_error=errors.append, fallback_model=fallback_model,
+                                        on_escalate=lambda answer, label: escalations.append(label))
+
+    def log_requests(job):
+        for e in errors[:5]:
+            job.log(f"分析评论时出错: {e}")
+        if len(errors) > 5:
+            job.log(f"另有 {len(errors) - 5} 条请求出错")
+        if escalations:
+            unresolved = sum(label is None for label in escalations)
+            job.log(f"模型级联：{len(escalations)} 条回答无法解析或含糊，已交给 {fallback_model} 重新分类，"
+                    f"其中 {unresolved} 条仍无法解析")
+        if hedge:
+            job.log(hedging.describe(client.stats()))
 
     @st.cache_resource
-    def init_client(api_key, base_url):
-        return OpenAI(api_key=api_key, base_url=base_url)
+    def init_client(api_key, base_url, timeout):
+        return llm.init_client(api_key, base_url, timeout=timeout)
 
-    client = init_client(api_key, base_url)
+    def get_client():
+        # 启用多端点时使用客户端池，由池选择端点和模型；启用对冲时每次运行单独统计对冲请求（用完后关闭）
+        client = llm_pool.get_pool(endpoints, request_timeout) if endpoints else init_client(
+            api_key, base_url, request_timeout)
+        if hedge:
+            client = hedging.HedgedClient(client, *hedge, max_workers=2 * concurrency)
+        return client
 
-    if st.button("运行分析"):
-        if api_key and base_url:
-            st.write("初始化 OpenAI 客户端...")
-
-            # 处理评论并显示进度条
-            classifications = []
-            log_window = st.empty()  # 创建一个占位符窗口
-            st.write("开始处理评论...")
-            progress_bar = st.progress(0)
-
-            for i, comment in enumerate(comments):
-                if not comment.strip() or comment == ',,,,':  # 如果评论为空或仅包含逗号，则跳过
-                    log_window.text(f"跳过空评论 {i + 1}/{len(comments)}")
-                    classifications.append("未处理")
-                    continue
-
-                log_window.text(f"正在预处理评论 {i + 1}/{len(comments)}: {comment[:50]}...")
-                clean_comment = preprocess_comment(comment)
-                log_window.text(f"正在分析评论 {i + 1}/{len(comments)}: {clean_comment[:50]}...")
-                classification = analyze_comment(client, clean_comment)
-                log_window.text(f"评论 {i + 1}/{len(comments)} 的分类结果: {classification}")
-                classifications.append(classification)
-                progress_bar.progress((i + 1) / len(comments))
-
-            st.write("评论处理完成，正在保存分类结果...")
-
-            # 将分类结果添加到数据表中
-            data['classification'] = classifications
-
-            # 保存分类结果到新的数据表
-            data.to_csv(output_filename, index=False)
-            st.success(f"分类结果已保存到: {output_filename}")
+    # OpenAI 客户端在提交任务或验证时才创建（openai 模块导入较慢）
+    limiter = llm.RateLimiter(rpm, tpm)
+
+    # 运行前预估 token、费用与耗时
+    with st.expander("费用与耗时预估"):
+        price_input = st.number_input("输入单价（元/千 Token）", value=0.0003, min_value=0.0, format="%.4f")
+        price_output = st.number_input("输出单价（元/千 Token）", value=0.0006, min_value=0.0, format="%.4f")
+        output_tokens = st.number_input("每条评论预计输出 Token 数", value=2, min_value=1, step=1)
+        expected_latency = st.number_input("单次请求平均耗时（秒）", value=1.0, min_value=0.01)
+        if st.button("计算预估"):
+            prepared, report = prepare_comments(pending_rows()[0])
+            for line in report_lines(report):
+                st.write(line)
+            estimate = tokens.estimate_run(tokens.count_tokens_batch(list(prepared.values())),
+                                           tokens.prompt_overhead(system_prompt, user_prompt_template),
+                                           output_tokens, price_input, price_output,
+                                           concurrency, rpm, tpm, expected_latency)
+            st.write(f"请求数: {estimate['requests']}")
+            st.write(f"输入 Token: {estimate['input_tokens']}，输出 Token: {estimate['output_tokens']}")
+            st.write(f"预计费用: {estimate['cost']:.2f} 元")
+            st.write(f"预计耗时: {estimate['eta_seconds'] / 60:.1f} 分钟（瓶颈：{estimate['bottleneck']}）")
+
+    # 在少量样本上分别发送压缩前后的评论，检查分类结果是否一致
+    with st.expander("提示压缩验证"):
+        validation_size = st.number_input("验证样本数（只抽取压缩后内容有变化的评论）", value=50, min_value=1, step=10)
+        if st.button("验证压缩效果"):
+            changed = list(islice((i for i, comment in enumerate(comments) if not llm.is_skippable(comment)
+                                   and preprocess_comment(comment) != preprocess_comment(comment, rules=())),
+                                  validation_size))
+
+            def compare(i):
+                compressed = preprocess_comment(comments[i])
+                before = analyze_comment(client, preprocess_comment(comments[i], rules=()))
+                after = analyze_comment(client, compressed) if compressed else llm.LABEL_SKIPPED
+                return before, after
+
+            client = get_client()
+            try:
+                pairs = llm.run_concurrent(compare, changed, concurrency=concurrency)
+            finally:
+                hedging.release(client)
+            if pairs:
+                # 只比较是否判为“是”：压缩后为空的评论不再发送，相当于“否”
+                matches = sum((before == '是') == (after == '是') for before, after in pairs)
+                st.write(f"{len(pairs)} 条样本中压缩前后分类一致 {matches} 条（{matches / len(pairs):.1%}）")
+                st.dataframe(pd.DataFrame({'评论': [comments[i] for i in changed],
+                                           '压缩后': [preprocess_comment(comments[i]) for i in changed],
+                                           '压缩前分类': [before for before, _ in pairs],
+                                           '压缩后分类': [after for _, after in pairs]}))
+            else:
+                st.write("没有压缩后内容发生变化的评论")
+
+    # 两级分类：本地模型处理大部分评论，只有置信度不足的评论交给大模型
+    with st.expander("两级分类（本地模型 + 大模型）"):
+        two_tier = st.checkbox("启用两级分类", value=False)
+        seed_size = st.number_input("种子样本数（由大模型标注后训练本地模型）", value=300, min_value=10, step=50)
+        holdout_size = st.number_input("留出评估样本数", value=100, min_value=0, step=50)
+        band_low, band_high = st.slider("不确定区间（本地模型判为“是”的概率）", 0.0, 1.0, (0.2, 0.8))
+        retrain_every = st.number_input("每轮送大模型的评论数（之后重新训练）", value=200, min_value=10, step=50)
+
+    # 抽样估算：只需要视觉类评论加权占比时，按点赞数分层抽样分类，给出置信区间，不必分类全部评论
+    with st.expander("抽样估算加权占比"):
+        estimate_only = st.checkbox("只估算视觉类评论加权占比（分层抽样，不分类全部评论）", value=False)
+        census_size = st.number_input("点赞最多的评论全部分类（条）", value=100, min_value=0, step=50)
+        n_strata = st.number_input("其余有点赞的评论按点赞数分层（层数）", value=4, min_value=1, max_value=10, step=1)
+        target_width = st.number_input("目标置信区间宽度（百分点）", value=5.0, min_value=0.1, step=0.5) / 100
+        sample_batch = st.number_input("每轮抽样评论数", value=200, min_value=10, step=50)
+        max_sample = st.number_input("最多分类评论数（0 表示不限）", value=0, min_value=0, step=500)
+
+    def run_estimate(job, classifications, prepared, classify_batch):
+        # 分层抽样估算：每轮按 Neyman 分配抽取一批评论交给大模型，直到 95% 自助法置信区间足够窄；
+        # 增量模式下已有结果的评论直接复用，不再发送
+        valid = visual_ratio.validity_mask(data[comment_column])
+        likes = visual_ratio.numeric_likes(data[likes_column]).where(valid, 0).to_numpy()
+
+        def label_rows(rows):
+            batch, _ = prepare_comments([i for i in rows if previous_labels[i] is None])
+            prepared.update(batch)
+            classify_batch(list(batch))
+            return [classifications[i] for i in rows]
+
+        def on_round(state):
+            job.progress(state['已分类'], int((likes > 0).sum()),
+                         f"已分类 {state['已分类']} 条，加权占比 {state['加权占比']:.2%}"
+                         f"（{state['下限']:.2%} ~ {state['上限']:.2%}，已剔除 {state['已剔除']} 条）")
 
-            st.write("分类结果预览：")
-            st.dataframe(data.head())  # 显示前五行分类结果数据
+        with metrics.stage("抽样估算"):
+            result = sampling.estimate(likes, label_rows, census_size, n_strata, target_width, sample_batch,
+                                       max_calls=max_sample or None, cancelled=job.cancelled, on_round=on_round)
 
-            # 筛选视觉类评论
-            st.write("正在计算视觉类评论的加权占比...")
-            visual_comments = data[
-                (data['classification'] == '是') & (data[comment_column].str.strip() != '') & (data[comment_column] != ',,,,')]
+        job.log(f"有点赞的有效评论 {int((likes > 0).sum())} 条，已分类 {len(result['labels'])} 条")
+        job.log(f"视觉类评论加权占比估计: {result['ratio']:.2%}，"
+                f"95% 置信区间 {result['low']:.2%} ~ {result['high']:.2%}"
+                f"（{result['excluded']} 条评论的结果不是“是/否”，未计入估计）")
+        for row in result['table'].to_dict('records'):
+            job.log(f"{row['层']}：{row['评论数']} 条评论，已分类 {row['已分类']} 条，剔除 {row['已剔除']} 条")
+        log_requests(job)
 
-            # 计算视觉类评论总点赞数
-            visual_likes = visual_comments[likes_column].sum()
+        # 只保存抽中的评论及其所在层
+        sampled = sorted(result['labels'])
+        sample = data.iloc[sampled].assign(classification=[result['labels'][i] for i in sampled],
+                                           抽样层=result['strata'][sampled])
+        sample_filename = f"{os.path.splitext(output_filename)[0]}_抽样.csv"
+        sample.to_csv(sample_filename, index=False)
+        job.log(f"抽样分类结果已保存到: {sample_filename}")
+        return os.path.abspath(sample_filename)
 
-            # 计算所有评论的总点赞数
-            filtered_data = data[(data[comment_column].str.strip() != '') & (data[comment_column] != ',,,,')]
-            total_likes = filtered_data[likes_column].sum()
+    def run_job(job):
+        # 在后台线程中运行，不能调用 Streamlit 组件；进度和说明写入任务表，由页面定时读取
+        # 空评论、仅包含逗号或压缩后为空的评论保持“未处理”；增量模式下已有结果的评论直接复用；
+        # 取消任务后未发送的评论同样保持“未处理”
+        classifications = [label or llm.LABEL_SKIPPED for label in previous_labels]
+        prepared = {}
+        analyses = {}  # 合并模式下本次得到的关键词分析
 
-            # 计算视觉类评论加权占比
-            weighted_visual_ratio = visual_likes / total_likes if total_likes != 0 else 0
+        def label_row(i):
+            if not combined:
+                return analyze_comment(client, prepared[i])
+            label, analyses[i] = analyze_combined(client, prepared[i])
+            return label
 
-            # 计算详细数据
-            total_comments = len(filtered_data)
-            visual_comments_count = len(visual_comments)
+        def classify_batch(rows):
+            # rows 为数据表中的行号，返回对应评论的大模型分类结果（未发送的为 None）
+            def on_done(done, index, classification):
+                i = rows[index]
+                classifications[i] = classification
+                job.progress(done, len(rows), f"评论 {i + 1}/{len(comments)} 的分类结果: {classification}")
 
-            # 显示详细数据
-            st.write(f"总评论数: {total_comments}")
-            st.write(f"视觉类评论数: {visual_comments_count}")
-            st.write(f"总点赞数: {total_likes}")
-            st.write(f"视觉类评论点赞数: {visual_likes}")
-            st.write(f"视觉类评论加权占比: {weighted_visual_ratio:.2%}")
+            results = llm.run_concurrent(label_row, rows, concurrency=concurrency, on_done=on_done,
+                                         cancelled=job.cancelled)
+            return results  # 取消任务后未发送的评论为 None
 
+        if estimate_only:
+            return run_estimate(job, classifications, prepared, classify_batch)
+
+        rows, representative = pending_rows()
+        if representative:
+            job.log(f"近似重复评论合并：{len(representative)} 条待分析评论只需发送 {len(rows)} 条代表评论")
+        batch, report = prepare_comments(rows)
+        prepared.update(batch)
+        pending = list(prepared)
+        for line in report_lines(report):
+            job.log(line)
+
+        sources = None
+        with metrics.stage("模型分类", rows=len(pending)):
+            if two_tier:
+                texts = [prepared[i] for i in pending]
+                result = surrogate.two_tier(texts, lambda indices: classify_batch([pending[j] for j in indices]),
+                                            seed_size, holdout_size, band_low, band_high, retrain_every,
+                                            cancelled=job.cancelled)
+                sources = [None] * len(comments)
+                for i, label, source in zip(pending, result['labels'], result['sources']):
+                    if label is not None:  # 取消任务后未分类的评论保持“未处理”
+                        classifications[i], sources[i] = label, source
+            else:
+                classify_batch(pending)
+
+        if two_tier:
+            job.log(f"大模型分类 {result['llm_calls']} 条，本地模型分类 {result['local']} 条，"
+                    f"重新训练 {result['rounds']} 轮")
+            if result['cancelled']:
+                job.log("任务已取消，两级分类提前停止")
+            if result['model'] is None:
+                job.log("种子样本中只有一种分类结果，未训练本地模型，全部评论已交给大模型")
+            elif result['holdout']:
+                job.log(f"留出集 {result['holdout']['count']} 条上本地模型与大模型的一致率: "
+                        f"{result['holdout']['agreement']:.2%}"
+                        f"（只用种子样本训练时为 {result['seed_holdout']['agreement']:.2%}）")
+            else:
+                job.log("留出评估样本数为 0（或留出样本没有“是/否”结果），未评估本地模型的一致率")
+
+        # 代表评论的分类结果同步给同一簇的其他评论
+        for i, j in representative.items():
+            classifications[i] = classifications[j]
+            if j in analyses:
+                analyses[i] = analyses[j]
+            if sources is not None:
+                sources[i] = sources[j]
+
+        log_requests(job)
+
+        # 将分类结果添加到数据表中
+        data['classification'] = classifications
+        if combined:
+            # 未发送的视觉类评论（本地模型分类、取消任务等）关键词分析保持“未处理”
+            data['keyword_analysis'] = [
+                analyses.get(i, previous if previous is not None else
+                             llm.LABEL_SKIPPED if classifications[i] == llm.LABEL_YES else '')
+                for i, previous in enumerate(previous_analyses)]
+        if sources is not None:
+            data['分类来源'] = sources
+        if cluster_ids is not None:
+            data['近似重复簇'] = cluster_ids
+            data['簇大小'] = near_duplicates.cluster_sizes(cluster_ids)
+
+        # 保存分类结果到新的数据表
+        with metrics.stage("保存结果", rows=len(data)):
+            data.to_csv(output_filename, index=False)
+        job.log(f"分类结果已保存到: {output_filename}")
+
+        # 计算视觉类评论加权占比（有效评论与视觉类评论掩码只计算一次）
+        summary = visual_ratio.summarize_single(data, comment_column, likes_column)
+        job.log(f"总评论数: {summary['总评论数']}")
+        job.log(f"视觉类评论数: {summary['视觉类评论数']}")
+        job.log(f"总点赞数: {summary['总点赞数']}")
+        job.log(f"视觉类评论点赞数: {summary['视觉类评论点赞数']}")
+        job.log(f"视觉类评论加权占比: {summary['视觉类评论加权占比']:.2%}")
+        return os.path.abspath(output_filename)
+
+    if st.button("运行分析"):
+        if endpoints or (api_key and base_url):
+            # 提交到后台任务队列，页面重跑或切换页面不会中断分析
+            client = get_client()
+            job = jobs.get_manager().submit(f"评论分类 {dataset['name']}", "评论AI分析",
+                                            hedging.releasing(client, run_job))
+            st.success(f"已提交后台任务 {job.id}，可在下方查看进度")
         else:
             st.error("请提供 API 密钥和 Base URL")
+
+    jobs.job_panel("评论AI分析")
+    if endpoints:
+        llm_pool.stats_panel(llm_pool.get_pool(endpoints, request_timeout))
+
+metrics.render_sidebar()
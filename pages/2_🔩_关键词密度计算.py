@@ -1,79 +1,66 @@
 import streamlit as st
-import pandas as pd
-import jieba
 from io import BytesIO
-from jieba import analyse
 
-# 加载自定义词典
-jieba.load_userdict("LDA/SogouLabDic.txt")
-jieba.load_userdict("LDA/dict_baidu_utf8.txt")
-jieba.load_userdict("LDA/dict_pangu.txt")
-jieba.load_userdict("LDA/dict_sougou_utf8.txt")
-jieba.load_userdict("LDA/dict_tencent_utf8.txt")
-jieba.load_userdict("LDA/my_dict.txt")
-
-# 加载停用词
-stopwords = {}.fromkeys(
-    [line.rstrip() for line in open('LDA/Stopword.txt')])
-
-
-# 分词和停用词过滤
-def preprocess_text(text):
-    seg = jieba.cut(text)
-    return [i for i in seg if i not in stopwords]
+from utils import (dataset_session, keyword_discovery, keyword_stats, metrics, near_duplicates, segment,
+                   token_store, visual_ratio)
 
+metrics.sidebar_toggle("关键词密度计算")
 
 # 设置 Streamlit 标题
 st.title("视觉类评论关键词密度分析")
 
-# 上传 CSV 文件
-uploaded_file = st.file_uploader("上传分类结果数据表", type="csv")
-
-# 输入关键词
-keywords = st.text_input("输入关键词（多个关键词用空格分隔）", "数据 可视化")
+# 使用各页面共享的分类结果数据表
+dataset = dataset_session.dataset_picker()
+if dataset is not None:
+    classification_column = dataset_session.role_column('classification')
+    comment_column = dataset_session.role_column('comment')
+    segmenter_name = segment.segmenter_picker()
+    duplicate_weights = near_duplicates.weight_picker(dataset['path'], comment_column)
+
+    # 在当前数据的样本上比较各分词方式的速度与内存，便于在速度和质量之间取舍
+    with st.expander("分词方式基准测试"):
+        sample_size = st.number_input("样本评论数", value=2000, min_value=100, step=500)
+        if st.button("运行基准测试"):
+            with metrics.stage("分词基准测试", rows=sample_size):
+                sample = dataset_session.load_frame([comment_column])[comment_column].dropna().astype(str)
+                st.dataframe(segment.benchmark(sample.head(sample_size).tolist()), hide_index=True)
+
+    # 对比视觉类评论与其他评论，推荐关键词并可填入下方的关键词输入框
+    keyword_discovery.suggestion_panel(dataset['path'], comment_column, classification_column, 'density_keywords',
+                                       segmenter_name=segmenter_name)
+
+# 输入关键词（可由上方的关键词推荐填入）
+st.session_state.setdefault('density_keywords', "数据 可视化")
+keywords = st.text_input("输入关键词（多个关键词用空格分隔）", key='density_keywords')
 
 # 文件名输入框
 file_name = st.text_input("输入要保存的文件名（不包括扩展名）", "分析结果")
 
 # 分析按钮
 if st.button("启动分析"):
-    if uploaded_file is not None:
-        # 读取上传的 CSV 文件
-        st.write("正在读取上传的 CSV 文件...")
-        data = pd.read_csv(uploaded_file)
-        st.write("CSV 文件读取完毕")
+    if dataset is not None:
+        # 只读取分类列和评论内容列
+        with metrics.stage("读取所需列") as s:
+            data = dataset_session.load_frame([classification_column, comment_column])
+            s.rows = len(data)
 
         # 获取视觉类评论
-        visual_comments = data[data['classification'] == '是']
+        is_visual = visual_ratio.is_visual(data[classification_column]).to_numpy()
 
         # 分割关键词
         keywords_list = keywords.split()
 
-        # 初始化计数
-        keyword_density = {keyword: 0 for keyword in keywords_list}
-        total_words = 0
+        # 分词结果按数据表缓存（整列分词一次，之后直接内存映射读取），只统计视觉类评论
+        with metrics.stage("分词", rows=len(data)):
+            store = token_store.for_column(dataset['path'], comment_column, segment.get_segmenter(segmenter_name))
+        with metrics.stage("关键词计数", rows=int(is_visual.sum())):
+            density_data, total_words = keyword_stats.keyword_density(store, keywords_list, rows=is_visual,
+                                                                      weights=duplicate_weights)
 
-        # 计算关键词密度
-        for _, row in visual_comments.iterrows():
-            comment = row['评论内容']
-            words = preprocess_text(comment)
-            total_words += len(words)
-            for keyword in keywords_list:
-                keyword_density[keyword] += words.count(keyword)
-
-        # 计算并显示每个关键词的密度
-        keyword_density_percentage = {keyword: (count / total_words) * 100 for keyword, count in
-                                      keyword_density.items()}
-
-        st.write(f"总视觉类评论数: {len(visual_comments)}")
+        st.write(f"总视觉类评论数: {int(is_visual.sum())}")
         st.write(f"总词数: {total_words}")
 
         st.write("关键词密度分析结果:")
-        density_data = pd.DataFrame({
-            "关键词": list(keyword_density.keys()),
-            "出现次数": list(keyword_density.values()),
-            "关键词密度 (%)": [f"{density:.2f}" for density in keyword_density_percentage.values()]
-        })
 
         st.write(density_data)
 
@@ -85,3 +72,5 @@ if st.button("启动分析"):
 
     else:
         st.error("请先上传数据表")
+
+metrics.render_sidebar()
@@ -1,67 +1,32 @@
 import streamlit as st
 import pandas as pd
-import pyLDAvis
-import pyLDAvis.gensim_models as gensimvis
-import matplotlib.pyplot as plt
-from gensim.corpora import Dictionary
-from gensim.models import LdaModel
-from gensim.matutils import Sparse2Corpus
-from sklearn.feature_extraction.text import CountVectorizer
-from wordcloud import WordCloud
-import jieba
-from jieba import analyse
 import io
+import os
 import re
 import string
 
-# 加载自定义词典
-jieba.load_userdict("LDA/SogouLabDic.txt")
-jieba.load_userdict("LDA/dict_baidu_utf8.txt")
-jieba.load_userdict("LDA/dict_pangu.txt")
-jieba.load_userdict("LDA/dict_sougou_utf8.txt")
-jieba.load_userdict("LDA/dict_tencent_utf8.txt")
-jieba.load_userdict("LDA/my_dict.txt")
+from utils import dataset_session, lda_registry, metrics, near_duplicates, segment, token_store, topic_model
 
-# 加载停用词
-stopwords = {}.fromkeys(
-    [line.rstrip() for line in open('LDA/Stopword.txt')])
-
-
-# 分词和停用词过滤
-def preprocess_text(text):
-    seg = jieba.cut(text)
-    return ' '.join([i for i in seg if i not in stopwords])
+# gensim、pyLDAvis、matplotlib、wordcloud 和 jieba 词典都在用到它们的阶段才加载，打开页面时不再等待
+metrics.sidebar_toggle("LDA主题建模")
 
 
 # 关键词提取
 def extract_keywords(text):
-    keywords = analyse.extract_tags(text, allowPOS=(
+    keywords = segment.extract_tags(text, allowPOS=(
         'ns', 'nr', 'nt', 'nz', 'nl', 'n', 'vn', 'vd', 'vg', 'v', 'vf', 'a', 'an', 'i'))
     return ' '.join(keywords)
 
 
-# 主题建模
-def perform_topic_modeling_gensim(data, n_topics=5):
-    vectorizer = CountVectorizer(preprocessor=preprocess_text, max_df=0.95, min_df=2, stop_words='english')
-    doc_term_matrix = vectorizer.fit_transform(data)
-
-    # 转换为gensim可用的格式
-    corpus = Sparse2Corpus(doc_term_matrix, documents_columns=False)
-    id2word = Dictionary.from_corpus(corpus,
-                                     id2word=dict((i, s) for i, s in enumerate(vectorizer.get_feature_names_out())))
-
-    lda = LdaModel(corpus=corpus, num_topics=n_topics, id2word=id2word, random_state=0)
-
-    return lda, id2word, corpus
-
-
 # 显示主题词云
 def display_word_cloud(lda, id2word):
+    plt = metrics.import_module("matplotlib.pyplot")
+    WordCloud = metrics.import_module("wordcloud").WordCloud
     for idx, topic in enumerate(lda.get_topics()):
         plt.figure(figsize=(10, 6))
         word_freq = dict(zip(id2word.values(), topic))
         wordcloud = WordCloud(width=800, height=400, max_words=50,
-                              font_path='LDA/Songti.ttc').generate_from_frequencies(
+                              font_path=os.path.join(segment.DICT_DIR, 'Songti.ttc')).generate_from_frequencies(
             word_freq)
         plt.imshow(wordcloud, interpolation='bilinear')
         plt.axis('off')
@@ -87,35 +52,97 @@ def translate_html_to_chinese(html_content):
     return html_content
 
 
+# 训练好的模型按（数据表、列、分词方式、主题数、训练方式、权重）缓存，页面重跑（如点击按钮）时不再重新训练
+@st.cache_resource(max_entries=4, show_spinner="正在训练 LDA 模型...")
+def train_lda(dataset_path, column, segmenter_name, n_topics, streaming, weights, rows):
+    # 分词结果按数据表缓存为整数 ID 的 CSR 数组，LDA 直接读取，不再拼接成字符串
+    segmenter = segment.get_segmenter(segmenter_name)
+    with metrics.stage("分词", rows=rows):
+        store = token_store.for_column(dataset_path, column, segmenter)
+    with metrics.stage("LDA 训练", rows=rows):
+        if streaming:
+            # 磁盘上已有同一语料的词典和词袋文件时直接复用
+            return topic_model.perform_topic_modeling_stream(
+                topic_model.StoreDocuments(store),
+                topic_model.corpus_path(os.path.basename(dataset_path), column, segmenter.cache_name,
+                                        token_store.CACHE_VERSION),
+                n_topics=n_topics)
+        return topic_model.perform_topic_modeling_store(store, n_topics=n_topics, weights=weights)
+
+
 # Streamlit应用
 st.title("主题建模工具")
 
-uploaded_file = st.file_uploader("上传数据表", type=["csv", "xlsx"])
-
-if uploaded_file:
-    if uploaded_file.name.endswith('.csv'):
-        df = pd.read_csv(uploaded_file)
-    else:
-        df = pd.read_excel(uploaded_file)
+dataset = dataset_session.dataset_picker()
 
-    st.write("数据预览：", df.head())
+if dataset is not None:
+    st.write("数据预览：", dataset_session.preview())
 
     # 添加列选择器，供用户选择进行分析的列
-    selected_column = st.selectbox("选择用于分析的列", df.columns)
+    selected_column = dataset_session.role_column('comment', "选择用于分析的列")
 
     if selected_column:
-        # 提取关键词
-        df['关键词'] = df[selected_column].apply(extract_keywords)
-
-        st.write("关键词提取结果：", df[[selected_column, '关键词']].head())
+        # 用模型库中已保存的模型为当前数据表的评论推断主题，无需重新训练
+        with st.expander("用已保存的模型推断主题"):
+            models = lda_registry.list_models()
+            if not models:
+                st.info("模型库中还没有模型，训练后可在页面下方保存")
+            else:
+                chosen = st.selectbox("选择模型", models, format_func=lambda meta: (
+                    f"{meta['name']}（{meta['topics']} 个主题，{segment.backend_label(meta['segmenter'])}，"
+                    f"{pd.Timestamp(meta['created'], unit='s', tz='Asia/Shanghai'):%Y-%m-%d %H:%M}）"))
+                if st.button("推断主题"):
+                    with metrics.stage("加载模型"):
+                        saved_lda, saved_dictionary, meta = lda_registry.load_model(chosen['id'])
+                    # 按模型训练时的分词方式分词（结果同样按数据表缓存）
+                    with metrics.stage("分词", rows=dataset['rows']):
+                        store = token_store.for_column(dataset['path'], selected_column,
+                                                       segment.get_segmenter(meta['segmenter']))
+                    with metrics.stage("主题推断", rows=len(store)):
+                        counts = lda_registry.project(store, saved_dictionary)
+                        topics = lda_registry.topic_frame(lda_registry.infer(saved_lda, counts), counts)
+                    topics.insert(0, selected_column, dataset_session.load_frame([selected_column])[selected_column])
+                    st.write("各主题的评论数：", topics['主导主题'].value_counts().sort_index())
+                    st.write("主题推断结果：", topics.head(20))
+                    st.download_button("下载主题推断结果", topics.to_csv(index=False, encoding='utf-8-sig'),
+                                       file_name=f"{dataset['name']}_主题推断.csv", mime='text/csv')
+
+        # 关键词提取只用于预览：只读取并处理开头几条评论，语料很大时不把整列读入内存
+        preview = dataset_session.preview()[[selected_column]].copy()
+        with metrics.stage("关键词提取", rows=len(preview)):
+            preview['关键词'] = preview[selected_column].apply(extract_keywords)
+
+        st.write("关键词提取结果：", preview[[selected_column, '关键词']])
 
         n_topics = st.slider("选择主题数目", 2, 20, 5)
-        lda_model, id2word, corpus = perform_topic_modeling_gensim(df[selected_column], n_topics=n_topics)
+        segmenter_name = segment.segmenter_picker()
+        # 语料大于内存时，词典、词袋语料和训练都按流从磁盘读取
+        streaming = st.checkbox("磁盘流式训练（语料大于内存时使用）", value=False)
+        duplicate_weights = None if streaming else near_duplicates.weight_picker(dataset['path'], selected_column)
+        lda_model, id2word, corpus = train_lda(dataset['path'], selected_column, segmenter_name, n_topics, streaming,
+                                               duplicate_weights, dataset['rows'])
+
+        # 保存到模型库：连同词典和分词方式一起保存，之后可直接为新评论推断主题。
+        # 保存在按钮回调中进行，回调参数绑定的是本次显示的模型对象，点击后的重跑不会先重新训练
+        def save_trained(lda, dictionary, **meta):
+            saved = lda_registry.save_model(lda, dictionary, st.session_state.lda_model_name, **meta)
+            st.session_state.lda_saved_id = saved['id']
+
+        with st.expander("保存到模型库"):
+            st.text_input("模型名称", f"{dataset['name']} {n_topics} 个主题", key="lda_model_name")
+            st.button("保存模型", on_click=save_trained, args=(lda_model, id2word),
+                      kwargs={'segmenter': segmenter_name, 'dataset': dataset['name'], 'column': selected_column,
+                              'rows': dataset['rows'], 'streaming': streaming})
+            if 'lda_saved_id' in st.session_state:
+                st.success(f"模型已保存（ID: {st.session_state.pop('lda_saved_id')}）")
 
         # 显示LDA可视化
         st.write("LDA 模型可视化：")
-        lda_vis_data = gensimvis.prepare(lda_model, corpus, id2word)
-        pyLDAvis_html = pyLDAvis.prepared_data_to_html(lda_vis_data)
+        with metrics.stage("pyLDAvis 可视化"):
+            pyLDAvis = metrics.import_module("pyLDAvis")
+            gensimvis = metrics.import_module("pyLDAvis.gensim_models")
+            lda_vis_data = gensimvis.prepare(lda_model, corpus, id2word)
+            pyLDAvis_html = pyLDAvis.prepared_data_to_html(lda_vis_data)
 
         # 保存 LDA 可视化的按钮
         if st.button("保存 LDA 可视化结果"):
@@ -128,6 +155,9 @@ if uploaded_file:
 
         # 显示主题词云
         st.write("主题词云：")
-        display_word_cloud(lda_model, id2word)
+        with metrics.stage("主题词云"):
+            display_word_cloud(lda_model, id2word)
     else:
         st.error("请选择一个用于分析的列。")
+
+metrics.render_sidebar()
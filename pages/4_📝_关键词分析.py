@@ -4,12 +4,13 @@ from io import BytesIO
 import plotly.express as px
 import plotly.graph_objects as go
 
+from utils import dataset_session, inverted_index, keyword_discovery, keyword_stats, metrics, visual_ratio
+
+metrics.sidebar_toggle("关键词分析")
+
 # 设置 Streamlit 标题
 st.title("视觉类评论关键词关联分析")
 
-# 上传 CSV 文件
-uploaded_file = st.file_uploader("上传数据表", type=["csv", "xlsx"])
-
 # 初始化 session_state，防止每次刷新时重置用户的选择
 if 'classification_column' not in st.session_state:
     st.session_state.classification_column = None
@@ -17,16 +18,6 @@ if 'comment_column' not in st.session_state:
     st.session_state.comment_column = None
 if 'likes_column' not in st.session_state:
     st.session_state.likes_column = None
-if 'data' not in st.session_state:
-    st.session_state.data = None
-
-# 缓存文件读取函数
-@st.cache_data
-def read_file(uploaded_file):
-    if uploaded_file.name.endswith('.csv'):
-        return pd.read_csv(uploaded_file)
-    else:
-        return pd.read_excel(uploaded_file)
 
 # 添加条形图生成函数
 def generate_bar_chart(x_values, y_values, title, x_label, y_label):
@@ -41,69 +32,71 @@ def generate_pie_chart(labels, values, title):
     fig.update_traces(textinfo='percent+label', hoverinfo='label+value')
     return fig
 
-# 如果用户上传了文件，读取文件并显示列选择器
-if uploaded_file:
-    try:
-        # 读取上传的文件并保存到 session_state
-        st.session_state.data = read_file(uploaded_file)
-        st.write("CSV 文件读取完毕")
-    except Exception as e:
-        st.error(f"文件读取失败：{e}")
-        st.stop()
-
-    # 动态选择用户上传文件中的列
-    columns = list(st.session_state.data.columns)
-
-    # 让用户选择"分类"列、"评论内容"列、"点赞数"列
-    st.session_state.classification_column = st.selectbox(
-        "选择分类列", columns, index=columns.index(st.session_state.classification_column) if st.session_state.classification_column in columns else 0)
-    st.session_state.comment_column = st.selectbox(
-        "选择评论内容列", columns, index=columns.index(st.session_state.comment_column) if st.session_state.comment_column in columns else 0)
-    st.session_state.likes_column = st.selectbox(
-        "选择点赞数列", columns, index=columns.index(st.session_state.likes_column) if st.session_state.likes_column in columns else 0)
+# 使用各页面共享的数据表（上传一次即可），加载后显示列选择器
+try:
+    dataset = dataset_session.dataset_picker()
+except Exception as e:
+    st.error(f"文件读取失败：{e}")
+    st.stop()
+
+if dataset is not None:
+    # 让用户选择"分类"列、"评论内容"列、"点赞数"列，选择结果在各页面间共享
+    st.session_state.classification_column = dataset_session.role_column('classification')
+    st.session_state.comment_column = dataset_session.role_column('comment')
+    st.session_state.likes_column = dataset_session.role_column('likes')
 
     # 确认用户选择了正确的列，并提示用户可以启动分析
     if st.session_state.classification_column and st.session_state.comment_column and st.session_state.likes_column:
         st.success("列选择完毕，现在可以输入关键词并启动分析")
 
+        # 对比视觉类评论与其他评论，推荐关键词并可填入下方的关键词输入框
+        keyword_discovery.suggestion_panel(dataset['path'], st.session_state.comment_column,
+                                           st.session_state.classification_column, 'association_keywords',
+                                           likes_column=st.session_state.likes_column)
+
         # 输入关键词
-        keywords = st.text_input("输入关键词（多个关键词用空格分隔）", "数据 可视化")
+        st.session_state.setdefault('association_keywords', "数据 可视化")
+        keywords = st.text_input("输入关键词（多个关键词用空格分隔）", key='association_keywords')
 
         # 输入保存文件名
         file_name = st.text_input("输入要保存的文件名（不包括扩展名）", "分析结果")
 
+        # 倒排索引每个数据表只建一次，之后修改关键词可立即得到结果，无需再点击“启动分析”
+        live = st.checkbox("修改关键词后立即更新结果（使用倒排索引）", value=True)
+
         # 只有在用户输入了关键词并完成列选择后，才显示“启动分析”按钮
-        if keywords and st.button("启动分析"):
+        if keywords and (st.button("启动分析") or live):
+            # 只读取分类、评论内容、点赞数三列
+            with metrics.stage("读取所需列") as s:
+                data = dataset_session.load_frame([
+                    st.session_state.classification_column, st.session_state.comment_column, st.session_state.likes_column])
+                s.rows = len(data)
+
             # 获取视觉类评论
-            visual_comments = st.session_state.data[st.session_state.data[st.session_state.classification_column] == '是']
+            visual_comments = data[visual_ratio.is_visual(data[st.session_state.classification_column])]
 
             # 如果没有视觉类评论，提示用户
             if visual_comments.empty:
                 st.error("没有找到分类为 '是' 的视觉类评论")
                 st.stop()
 
+            # 整张数据表的单字、两字倒排索引（首次建立后缓存到磁盘）
+            with metrics.stage("倒排索引", rows=len(data)):
+                index = inverted_index.for_column(dataset['path'], st.session_state.comment_column)
+
             total_likes = visual_comments[st.session_state.likes_column].sum()  # 总点赞数
             keywords_list = keywords.split()  # 分割关键词
 
-            # 初始化关键词关联统计
-            match_count = 0
-            keyword_counts = {keyword: 0 for keyword in keywords_list}
-            keyword_likes = {keyword: 0 for keyword in keywords_list}
-            matched_comments = []
-            output_data = []
-
-            # 查找包含关键词的评论
-            for _, row in visual_comments.iterrows():
-                comment = row[st.session_state.comment_column]
-                likes = row[st.session_state.likes_column]
-                matched_keywords = [keyword for keyword in keywords_list if keyword in comment]
-                if matched_keywords:
-                    match_count += 1
-                    matched_comments.append(comment)
-                    output_data.append({"评论内容": comment, "包含的关键词": ", ".join(matched_keywords), "点赞数": likes})
-                    for keyword in matched_keywords:
-                        keyword_counts[keyword] += 1
-                        keyword_likes[keyword] += likes
+            # 查找包含关键词的评论（每个关键词只读取几个倒排列表）
+            with metrics.stage("关键词匹配", rows=len(visual_comments)):
+                association = keyword_stats.keyword_association(visual_comments[st.session_state.comment_column],
+                                                                visual_comments[st.session_state.likes_column],
+                                                                keywords_list, index=index)
+            match_count = association['match_count']
+            keyword_counts = association['keyword_counts']
+            keyword_likes = association['keyword_likes']
+            output_df = association['matched']
+            matched_comments = output_df["评论内容"].tolist()
 
             # 关键词统计和占比计算
             keyword_percentages = {keyword: count / len(visual_comments) * 100 for keyword, count in keyword_counts.items()}
@@ -149,16 +142,41 @@ if uploaded_file:
             st.write("关键词加权占比条形图:")
             st.plotly_chart(generate_bar_chart(list(keyword_weighted_percentages.keys()), list(keyword_weighted_percentages.values()), '关键词评论的加权占比', '关键词', '加权占比 (%)'))
 
+            # 关键词共现：稀疏的评论 × 关键词矩阵做一次矩阵乘法，得到共现次数与点赞加权共现
+            with metrics.stage("关键词共现", rows=len(visual_comments)):
+                co_counts, co_likes = keyword_stats.cooccurrence(visual_comments[st.session_state.comment_column],
+                                                                 visual_comments[st.session_state.likes_column],
+                                                                 keywords_list, index=index)
+            if len(co_counts) > 1:
+                st.write("关键词共现热力图（对角线为单个关键词）:")
+                count_tab, likes_tab = st.tabs(["共现评论数", "共现评论点赞数"])
+                with count_tab:
+                    st.plotly_chart(px.imshow(co_counts, text_auto=True, color_continuous_scale='Blues',
+                                              labels={'color': '共现评论数'}))
+                with likes_tab:
+                    st.plotly_chart(px.imshow(co_likes, text_auto='.0f', color_continuous_scale='Reds',
+                                              labels={'color': '共现评论点赞数'}))
+
+                st.write("共现最多的关键词对:")
+                st.dataframe(keyword_stats.top_pairs(co_counts, co_likes), hide_index=True)
+
+                cooccurrence_csv = BytesIO()
+                pd.concat({'共现评论数': co_counts, '共现评论点赞数': co_likes}).to_csv(cooccurrence_csv, encoding='utf-8-sig')
+                cooccurrence_csv.seek(0)
+                st.download_button(label="下载关键词共现矩阵", data=cooccurrence_csv,
+                                   file_name=f'{file_name}_共现.csv', mime='text/csv')
+
             # 评论预览
             st.write("包含关键词的视觉类评论预览:")
             st.write(matched_comments[:10])
 
             # 提供下载链接
             if matched_comments:
-                output_df = pd.DataFrame(output_data)
                 csv = BytesIO()
                 output_df.to_csv(csv, index=False, encoding='utf-8-sig')
                 csv.seek(0)
                 st.download_button(label="下载分析结果", data=csv, file_name=f'{file_name}.csv', mime='text/csv')
 else:
-    st.info("请先上传数据表")
\ No newline at end of file
+    st.info("请先上传数据表")
+
+metrics.render_sidebar()
@@ -1,8 +1,11 @@
 import streamlit as st
-from openai import OpenAI
-import pandas as pd
+import os
 import re
-import time
+
+from utils import (compress, dataset_session, hedging, incremental, jobs, llm, llm_pool, metrics, tokens,
+                   visual_ratio)
+
+metrics.sidebar_toggle("关键词划分")
 
 # 设置 Streamlit 标题
 st.title("视觉评论关键词分析工具")
@@ -11,8 +14,8 @@ st.title("视觉评论关键词分析工具")
 api_key = st.text_input("API 密钥", type="password")
 base_url = st.text_input("Base URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
 
-# 上传 CSV 文件
-uploaded_file = st.file_uploader("上传评论数据表", type="csv")
+# 使用各页面共享的分类结果数据表
+dataset = dataset_session.dataset_picker()
 
 # 输入模型名称
 model_name = st.text_input("模型名称", "qwen-turbo")
@@ -27,100 +30,164 @@ keyword_prompt_template = st.text_area("关键词分析提示语",
 # 输入其他参数
 temperature = st.slider("Temperature", 0.0, 1.0, 0.8)
 top_p = st.slider("Top P", 0.0, 1.0, 0.8)
-max_comment_length = st.number_input("最大评论长度", value=1000, step=1)
+max_comment_tokens = st.number_input("最大评论 Token 数", value=500, min_value=1, step=1)
+compress_labels = st.multiselect("发送前移除或压缩的内容", compress.rule_labels(), default=compress.rule_labels())
+compress_rules = compress.rules_from_labels(compress_labels)
+concurrency = st.number_input("并发请求数", min_value=1, max_value=64, value=1, step=1)
+retries = st.number_input("限流/超时重试次数", min_value=0, max_value=10, value=3, step=1)
+request_timeout = st.number_input("单次请求超时（秒）", min_value=1.0, value=60.0, step=5.0)
+rpm = st.number_input("每分钟请求数上限（0 表示不限）", min_value=0, value=0, step=10)
+tpm = st.number_input("每分钟 Token 数上限（0 表示不限）", min_value=0, value=0, step=1000)
+# 多个端点分担请求时，并发请求数为各端点并发上限之和
+endpoints = llm_pool.endpoint_editor(api_key, base_url, model_name)
+if endpoints:
+    concurrency = sum(spec[3] for spec in endpoints)
+# 启用多端点时请求的模型由各端点决定
+request_model = None if endpoints else model_name
+hedge = hedging.hedge_settings()
 
 # 输入输出文件名
 output_filename = st.text_input("输出文件名", "keyword_analysis_results.csv")
 
 
-def preprocess_comment(comment):
+def preprocess_comment(comment, rules=None):
     if not isinstance(comment, str):
         comment = str(comment)
+    comment = compress.compress(comment, compress_rules if rules is None else rules)  # 表情、@、链接等不再发送
     comment = re.sub(r'[^\w\s,.:?!]', '', comment)  # 移除除了字母、数字、空格和基本标点符号外的所有字符
     comment = comment.strip()  # 去除前后空格
-    return comment[:max_comment_length]
-
-
-def analyze_keywords(client, comment, retries=3):
-    messages = [
-        {'role': 'system', 'content': system_prompt},
-        {'role': 'user', 'content': keyword_prompt_template.format(comment=comment)}
-    ]
-
-    for attempt in range(retries):
-        try:
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p
-            )
-            analysis_result = completion.choices[0].message.content.strip()
-            return analysis_result
-        except Exception as e:
-            if "data_inspection_failed" in str(e):
-                st.warning(f"分析关键词时内容审查失败，重试中... ({attempt + 1}/{retries})")
-                time.sleep(5)  # 等待5秒后重试
-            else:
-                st.error(f"分析关键词时出错: {e}")
-                return "无法分析"
-    return "无法分析"
+    return tokens.truncate_to_tokens(comment, max_comment_tokens)  # 按 token 预算截断
 
 
-@st.cache_resource
-def init_client(api_key, base_url):
-    return OpenAI(api_key=api_key, base_url=base_url)
+def prepare_comments(texts):
+    # 预处理待分析的评论；压缩后为空的评论不再发送，返回 {下标: 发送内容} 和压缩报告
+    rows = [i for i, text in enumerate(texts) if not llm.is_skippable(text)]
+    prepared = {i: preprocess_comment(texts[i]) for i in rows}
+    baseline = [preprocess_comment(texts[i], rules=()) for i in rows]
+    return {i: text for i, text in prepared.items() if text}, compress.report(baseline, list(prepared.values()))
 
 
-if uploaded_file is not None:
-    data = pd.read_csv(uploaded_file)
-    data['评论内容'] = data['评论内容'].fillna('')  # 用空字符串填充缺失值
-    data['评论内容'] = data['评论内容'].astype(str)  # 转换为字符串
-    comments = data['评论内容'].tolist()  # 假设评论列名为'评论内容'
-    classifications = data.get('classification', [])  # 获取分类结果列，如果没有则为空列表
+def report_line(report):
+    return (f"提示压缩：{report['comments']} 条评论的输入 Token 从 {report['tokens_before']} 降至 "
+            f"{report['tokens_after']}（节省 {report['saved_ratio']:.1%}），{report['emptied']} 条压缩后为空不再发送")
 
-    st.write("CSV 文件读取完毕，预览数据：")
-    st.dataframe(data.head())  # 显示前五行数据
 
-    client = init_client(api_key, base_url)
+# 请求出错信息先收集起来
+errors = []
 
-    if st.button("运行关键词分析"):
-        if api_key and base_url:
-            st.write("初始化 OpenAI 客户端...")
 
-            # 处理视觉评论并显示进度条
-            keyword_analysis_results = []
-            log_window = st.empty()  # 创建一个占位符窗口
-            st.write("开始处理视觉评论...")
-            progress_bar = st.progress(0)
+def analyze_keywords(client, comment):
+    return llm.analyze_keywords(client, comment, request_model, system_prompt, keyword_prompt_template,
+                                temperature, top_p, retries=retries, limiter=limiter,
+                                on_error=errors.append)
+
+
+@st.cache_resource
+def init_client(api_key, base_url, timeout):
+    return llm.init_client(api_key, base_url, timeout=timeout)
 
-            # 筛选视觉类评论
-            visual_comments = data[data['classification'] == '是']
 
-            for i, comment in enumerate(visual_comments['评论内容']):
-                if not comment.strip() or comment == ',,,,':  # 如果评论为空或仅包含逗号，则跳过
-                    keyword_analysis_results.append("未处理")
-                    continue
+def get_client():
+    # 启用多端点时使用客户端池，由池选择端点和模型；启用对冲时每次运行单独统计对冲请求（用完后关闭）
+    client = llm_pool.get_pool(endpoints, request_timeout) if endpoints else init_client(
+        api_key, base_url, request_timeout)
+    if hedge:
+        client = hedging.HedgedClient(client, *hedge, max_workers=2 * concurrency)
+    return client
 
-                log_window.text(f"正在预处理评论 {i + 1}/{len(visual_comments)}: {comment[:50]}...")
-                clean_comment = preprocess_comment(comment)
-                log_window.text(f"正在分析评论 {i + 1}/{len(visual_comments)}: {clean_comment[:50]}...")
-                analysis_result = analyze_keywords(client, clean_comment)
-                keyword_analysis_results.append(analysis_result)
-                log_window.text(f"评论 {i + 1}/{len(visual_comments)} 的关键词分析结果: {analysis_result}")
-                progress_bar.progress((i + 1) / len(visual_comments))
 
-            st.write("关键词分析完成，正在保存分析结果...")
+if dataset is not None:
+    comment_column = dataset_session.role_column('comment')
+    classification_column = dataset_session.role_column('classification')
 
-            # 将关键词分析结果添加到数据表中
-            visual_comments['keyword_analysis'] = keyword_analysis_results
+    with metrics.stage("读取数据表") as s:
+        # 结果需要保留全部列；共享的数据需要复制后再修改
+        data = dataset_session.load_frame().copy()
+        s.rows = len(data)
+    data[comment_column] = data[comment_column].fillna('')  # 用空字符串填充缺失值
+    data[comment_column] = data[comment_column].astype(str)  # 转换为字符串
 
-            # 保存分析结果到新的数据表
-            visual_comments.to_csv(output_filename, index=False)
-            st.success(f"关键词分析结果已保存到: {output_filename}")
+    st.write("CSV 文件读取完毕，预览数据：")
+    st.dataframe(data.head())  # 显示前五行数据
 
-            st.write("关键词分析结果预览：")
-            st.dataframe(visual_comments.head())  # 显示前五行分析结果数据
+    # OpenAI 客户端在提交任务时才创建（openai 模块导入较慢）
+    limiter = llm.RateLimiter(rpm, tpm)
+
+    # 运行前预估 token、费用与耗时
+    with st.expander("费用与耗时预估"):
+        price_input = st.number_input("输入单价（元/千 Token）", value=0.0003, min_value=0.0, format="%.4f")
+        price_output = st.number_input("输出单价（元/千 Token）", value=0.0006, min_value=0.0, format="%.4f")
+        output_tokens = st.number_input("每条评论预计输出 Token 数", value=100, min_value=1, step=1)
+        expected_latency = st.number_input("单次请求平均耗时（秒）", value=1.0, min_value=0.01)
+        if st.button("计算预估"):
+            visual_texts = data.loc[visual_ratio.is_visual(data[classification_column]), comment_column]
+            prepared, report = prepare_comments(visual_texts.tolist())
+            st.write(report_line(report))
+            estimate = tokens.estimate_run(tokens.count_tokens_batch(list(prepared.values())),
+                                           tokens.prompt_overhead(system_prompt, keyword_prompt_template),
+                                           output_tokens, price_input, price_output,
+                                           concurrency, rpm, tpm, expected_latency)
+            st.write(f"请求数: {estimate['requests']}")
+            st.write(f"输入 Token: {estimate['input_tokens']}，输出 Token: {estimate['output_tokens']}")
+            st.write(f"预计费用: {estimate['cost']:.2f} 元")
+            st.write(f"预计耗时: {estimate['eta_seconds'] / 60:.1f} 分钟（瓶颈：{estimate['bottleneck']}）")
+
+    def run_job(job):
+        # 在后台线程中运行，不能调用 Streamlit 组件；进度和说明写入任务表，由页面定时读取
+        # 筛选视觉类评论
+        visual_comments = data[visual_ratio.is_visual(data[classification_column])].copy()
+        visual_texts = visual_comments[comment_column].tolist()
+        # 空评论、仅包含逗号或压缩后为空的评论，以及取消任务后未发送的评论保持“未处理”
+        keyword_analysis_results = [llm.LABEL_SKIPPED] * len(visual_texts)
+        prepared, report = prepare_comments(visual_texts)
+        job.log(report_line(report))
+        # 合并模式的分类结果已带关键词分析，只补发缺少分析或上次失败的评论
+        if 'keyword_analysis' in visual_comments:
+            reused = 0
+            for i, analysis in enumerate(visual_comments['keyword_analysis'].tolist()):
+                if isinstance(analysis, str) and analysis and analysis not in incremental.RETRY_LABELS:
+                    keyword_analysis_results[i] = analysis
+                    prepared.pop(i, None)
+                    reused += 1
+            job.log(f"复用已有的关键词分析 {reused} 条，需要发送 {len(prepared)} 条")
+        pending = list(prepared)
+
+        def on_done(done, index, analysis_result):
+            i = pending[index]
+            keyword_analysis_results[i] = analysis_result
+            job.progress(done, len(pending), f"评论 {i + 1}/{len(visual_texts)} 的关键词分析结果: {analysis_result}")
+
+        with metrics.stage("模型关键词分析", rows=len(pending)):
+            llm.run_concurrent(lambda i: analyze_keywords(client, prepared[i]),
+                               pending, concurrency=concurrency, on_done=on_done, cancelled=job.cancelled)
+
+        for e in errors[:5]:
+            job.log(f"分析关键词时出错: {e}")
+        if len(errors) > 5:
+            job.log(f"另有 {len(errors) - 5} 条请求出错")
+        if hedge:
+            job.log(hedging.describe(client.stats()))
+
+        # 将关键词分析结果添加到数据表中
+        visual_comments['keyword_analysis'] = keyword_analysis_results
+
+        # 保存分析结果到新的数据表
+        visual_comments.to_csv(output_filename, index=False)
+        job.log(f"关键词分析结果已保存到: {output_filename}")
+        return os.path.abspath(output_filename)
 
+    if st.button("运行关键词分析"):
+        if endpoints or (api_key and base_url):
+            # 提交到后台任务队列，页面重跑或切换页面不会中断分析
+            client = get_client()
+            job = jobs.get_manager().submit(f"关键词分析 {dataset['name']}", "关键词划分",
+                                            hedging.releasing(client, run_job))
+            st.success(f"已提交后台任务 {job.id}，可在下方查看进度")
         else:
             st.error("请提供 API 密钥和 Base URL")
+
+    jobs.job_panel("关键词划分")
+    if endpoints:
+        llm_pool.stats_panel(llm_pool.get_pool(endpoints, request_timeout))
+
+metrics.render_sidebar()
@@ -1,57 +1,30 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib import font_manager
-from wordcloud import WordCloud
-import jieba
-from jieba import analyse
+import os
 import io
 
-# 缓存加载自定义词典
-@st.cache_resource
-def load_custom_dict():
-    user_dicts = [
-        "/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/SogouLabDic.txt",
-        "/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/dict_baidu_utf8.txt",
-        "/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/dict_pangu.txt",
-        "/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/dict_sougou_utf8.txt",
-        "/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/dict_tencent_utf8.txt",
-        "/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/my_dict.txt"
-    ]
-    for dict_path in user_dicts:
-        jieba.load_userdict(dict_path)
-
-# 加载自定义词典
-load_custom_dict()
-
-# 缓存加载停用词
-@st.cache_resource
-def load_stopwords():
-    with open('/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/Stopword.txt') as f:
-        return set(line.strip() for line in f)
+from utils import dataset_session, metrics, segment, token_store
 
-stopwords = load_stopwords()
+# matplotlib、wordcloud 和 jieba 词典都在用到它们的阶段才加载，打开页面时不再等待
+metrics.sidebar_toggle("关键词占比")
+
+FONT_PATH = os.path.join(segment.DICT_DIR, "Songti.ttc")
 
 # 缓存加载字体
 @st.cache_resource
 def load_font():
-    return font_manager.FontProperties(fname='/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/Songti.ttc')
-
-my_font = load_font()
-
-# 分词和停用词过滤
-def preprocess_text(text):
-    seg = jieba.cut(text)
-    return ' '.join([i for i in seg if i not in stopwords])
+    return metrics.import_module("matplotlib.font_manager").FontProperties(fname=FONT_PATH)
 
 # 关键词提取
 def extract_keywords(text):
-    keywords = analyse.extract_tags(text)
+    keywords = segment.extract_tags(text)
     return keywords
 
 # 生成词云
 def display_word_cloud(keywords):
-    wordcloud = WordCloud(width=800, height=400, font_path='/Users/liuhaoran/LHR/PycharmProjects/Comment analysis/LDA/Songti.ttc').generate_from_frequencies(keywords)
+    plt = metrics.import_module("matplotlib.pyplot")
+    WordCloud = metrics.import_module("wordcloud").WordCloud
+    wordcloud = WordCloud(width=800, height=400, font_path=FONT_PATH).generate_from_frequencies(keywords)
     plt.figure(figsize=(10, 6))
     plt.imshow(wordcloud, interpolation='bilinear')
     plt.axis('off')
@@ -64,35 +37,34 @@ def display_word_cloud(keywords):
 # Streamlit应用
 st.title("关键词占比分析工具")
 
-uploaded_file = st.file_uploader("上传数据表", type=["csv", "xlsx"])
-
-if uploaded_file:
-    try:
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
-        st.write("数据预览：", df.head())
-    except Exception as e:
-        st.error(f"文件读取失败：{e}")
-        st.stop()
+try:
+    dataset = dataset_session.dataset_picker()
+except Exception as e:
+    st.error(f"文件读取失败：{e}")
+    st.stop()
+
+if dataset is not None:
+    st.write("数据预览：", dataset_session.preview())
 
     # 检查文件是否有必要的列
-    if df.empty:
+    if dataset['rows'] == 0:
         st.error("数据表为空，请上传有效的数据表。")
         st.stop()
 
     # 选择分析的列
-    selected_column = st.selectbox("选择用于分析的列", df.columns)
+    selected_column = dataset_session.role_column('comment', "选择用于分析的列")
 
     if selected_column:
-        # 提取关键词
-        df['关键词'] = df[selected_column].apply(lambda x: ' '.join(extract_keywords(str(x))))
-        st.write("关键词提取结果：", df[[selected_column, '关键词']].head())
+        # 提取关键词：结果按数据表缓存为整数 ID 的 CSR 数组，之后直接内存映射读取
+        with metrics.stage("关键词提取", rows=dataset['rows']):
+            store = token_store.for_column(dataset['path'], selected_column,
+                                           segment.Segmenter("jieba-extract_tags", extract_keywords, stopwords=False))
+        preview = dataset_session.load_frame([selected_column]).head()
+        st.write("关键词提取结果：", preview.assign(关键词=[' '.join(store.tokens(i)) for i in range(len(preview))]))
 
         # 统计关键词出现频率
-        keyword_list = df['关键词'].str.split().explode()
-        keyword_count = keyword_list.value_counts()
+        keyword_count = pd.Series(store.term_counts(), index=store.vocab).sort_values(ascending=False, kind='stable')
+        keyword_count = keyword_count[keyword_count > 0]
         keyword_count_df = keyword_count.reset_index()
         keyword_count_df.columns = ['关键词', '出现次数']
 
@@ -109,6 +81,8 @@ if uploaded_file:
         top_n = st.slider("选择要显示的关键词数量", 5, 50, 30)
         keyword_count_df = keyword_count_df.head(top_n)
 
+        plt = metrics.import_module("matplotlib.pyplot")
+        my_font = load_font()
         fig, ax = plt.subplots(figsize=(12, 8))  # 增大图形尺寸
 
         # 绘制条形图
@@ -130,4 +104,6 @@ if uploaded_file:
         st.pyplot(fig)
 
     else:
-        st.error("请选择一个用于分析的列。")
\ No newline at end of file
+        st.error("请选择一个用于分析的列。")
+
+metrics.render_sidebar()
@@ -1,16 +1,15 @@
 import streamlit as st
-import pandas as pd
-import pkuseg
 from io import BytesIO
 
-# 初始化 pkuseg 分词器，使用细领域模型（例如 'medicine'）
-seg = pkuseg.pkuseg(model_name='web')
+from utils import dataset_session, keyword_stats, metrics, segment, token_store, visual_ratio
+
+metrics.sidebar_toggle("关键词密度_2")
 
 # 设置 Streamlit 标题
 st.title("视觉类评论关键词密度分析")
 
-# 上传 CSV 文件
-uploaded_file = st.file_uploader("上传分类结果数据表", type="csv")
+# 使用各页面共享的分类结果数据表
+dataset = dataset_session.dataset_picker()
 
 # 输入关键词
 keywords = st.text_input("输入关键词（多个关键词用空格分隔）", "数据 可视化")
@@ -20,56 +19,39 @@ file_name = st.text_input("输入要保存的文件名（不包括扩展名）",
 
 # 分析按钮
 if st.button("启动分析"):
-    if uploaded_file is not None:
-        # 读取上传的 CSV 文件
-        st.write("正在读取上传的 CSV 文件...")
-        data = pd.read_csv(uploaded_file)
-        st.write("CSV 文件读取完毕")
+    if dataset is not None:
+        # 只读取分类列和评论内容列
+        with metrics.stage("读取所需列") as s:
+            data = dataset_session.load_frame(['classification', '评论内容'])
+            s.rows = len(data)
 
         # 获取视觉类评论
-        visual_comments = data[data['classification'] == '是']
+        visual_comments = data[visual_ratio.is_visual(data['classification'])]
 
         # 分割关键词
         keywords_list = keywords.split()
 
-        # 初始化计数
-        keyword_density = {keyword: 0 for keyword in keywords_list}
-        total_words = 0
-        extracted_keywords_list = []  # 用于保存提取的关键词
-
-        # 计算关键词密度
-        for _, row in visual_comments.iterrows():
-            comment = row['评论内容']
-            # 使用 pkuseg 分词器进行细领域分词
-            words = seg.cut(comment)
-            extracted_keywords_list.append(' '.join(words))  # 保存分词结果
-            total_words += len(words)
-            for keyword in keywords_list:
-                # 计算不完全匹配的词段（如只要包含关键词的一部分即为相关）
-                for word in words:
-                    if keyword in word:
-                        keyword_density[keyword] += 1
-
-        # 计算并显示每个关键词的密度
-        keyword_density_percentage = {keyword: (count / total_words) * 100 for keyword, count in
-                                      keyword_density.items()}
+        # 分词结果按数据表缓存为整数 ID 的 CSR 数组；只对视觉类评论分词（已有整列缓存时直接从中取出）
+        st.write("正在分析关键词密度，请稍候...")
+        is_visual = visual_ratio.is_visual(data['classification']).to_numpy()
+        # pkuseg 分词器（细领域模型 'web'）只在需要分词时才加载；分词结果已缓存时不再加载模型
+        with metrics.stage("分词", rows=int(is_visual.sum())):
+            store = token_store.for_column(dataset['path'], '评论内容', segment.get_segmenter('pkuseg', stopwords=False),
+                                           rows=is_visual)
+        # 包含关键词的词段也计入（如只要包含关键词的一部分即为相关），按词表统计一次即可
+        with metrics.stage("关键词计数", rows=len(store)):
+            density_data, total_words = keyword_stats.keyword_density(store, keywords_list, partial=True)
 
         st.write(f"总视觉类评论数: {len(visual_comments)}")
         st.write(f"总关键词数: {total_words}")
 
         st.write("关键词密度分析结果:")
-        density_data = pd.DataFrame({
-            "关键词": list(keyword_density.keys()),
-            "出现次数": list(keyword_density.values()),
-            "关键词密度 (%)": [f"{density:.2f}" for density in keyword_density_percentage.values()]
-        })
-
         st.write(density_data)
 
         # 显示提取的关键词结果
         st.write("分词结果预览（前10条）:")
-        for i, keywords in enumerate(extracted_keywords_list[:10], 1):
-            st.write(f"评论 {i}: {keywords}")
+        for i in range(min(len(store), 10)):
+            st.write(f"评论 {i + 1}: {' '.join(store.tokens(i))}")
 
         # 提供下载链接
         csv = BytesIO()
@@ -79,3 +61,5 @@ if st.button("启动分析"):
 
     else:
         st.error("请先上传数据表")
+
+metrics.render_sidebar()
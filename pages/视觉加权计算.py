@@ -1,71 +1,122 @@
 import streamlit as st
 import pandas as pd
+import os
+import glob
+
+from utils import dataset_cache, dataset_session, metrics, visual_ratio
+
+metrics.sidebar_toggle("视觉加权计算")
+
+
+# 多视频汇总结果按 (文件哈希, 列名) 缓存，新增视频时只处理新文件
+@st.cache_resource
+def get_summary_cache():
+    return {}
+
 
 # 设置 Streamlit 标题
 st.title("评论数据统计工具")
 
-# 上传文件，支持 CSV 和 Excel 格式
-uploaded_file = st.file_uploader("上传评论数据表", type=["csv", "xlsx"])
+mode = st.radio("统计模式", ["单个数据表", "多个视频"], horizontal=True)
 
-if uploaded_file is not None:
-    # 读取上传的文件并处理不同格式
-    st.write("正在读取上传的文件...")
-    if uploaded_file.name.endswith('.csv'):
-        data = pd.read_csv(uploaded_file)
-    else:
-        data = pd.read_excel(uploaded_file)
+if mode == "单个数据表":
+    # 使用各页面共享的数据表，支持 CSV 和 Excel 格式
+    dataset = dataset_session.dataset_picker()
 
-    # 显示文件中的列名，供用户选择评论内容和点赞数所在的列
-    st.write("请选择评论内容和点赞数所在的列：")
-    comment_column = st.selectbox("选择评论内容所在的列", data.columns)
-    likes_column = st.selectbox("选择点赞数所在的列", data.columns)
+    if dataset is not None:
+        # 显示文件中的列名，供用户选择评论内容和点赞数所在的列
+        st.write("请选择评论内容和点赞数所在的列：")
+        comment_column = dataset_session.role_column('comment', "选择评论内容所在的列")
+        likes_column = dataset_session.role_column('likes', "选择点赞数所在的列")
 
-    # 清洗评论内容列，填充缺失值并转换为字符串类型
-    data[comment_column] = data[comment_column].fillna('')  # 用空字符串填充缺失值
-    data[comment_column] = data[comment_column].astype(str)  # 转换为字符串
+        with metrics.stage("读取所需列") as s:
+            needed_columns = [comment_column, likes_column] + (['classification'] if 'classification' in dataset['columns'] else [])
+            data = dataset_session.load_frame(needed_columns)
+            s.rows = len(data)
 
-    st.write("文件读取完毕，预览数据：")
-    st.dataframe(data.head())  # 显示前五行数据
+        st.write("文件读取完毕，预览数据：")
+        st.dataframe(dataset_session.preview())  # 显示前五行数据
 
-    # 筛选视觉类评论
-    st.write("正在计算视觉类评论的加权占比...")
-    if 'classification' not in data.columns:
-        st.error("文件中没有找到 'classification' 列，无法继续分析。")
-    else:
-        # 只保留 classification 为“是”的视觉类评论
-        visual_comments = data[
-            (data['classification'] == '是') & (data[comment_column].str.strip() != '') & (data[comment_column] != ',,,,')]
+        # 筛选视觉类评论
+        st.write("正在计算视觉类评论的加权占比...")
+        if 'classification' not in data.columns:
+            st.error("文件中没有找到 'classification' 列，无法继续分析。")
+        else:
+            # 有效评论与视觉类评论的掩码只计算一次
+            with metrics.stage("计算加权占比", rows=len(data)):
+                summary = visual_ratio.summarize_single(data, comment_column, likes_column)
+                visual_comments = data[visual_ratio.visual_mask(data, comment_column)]
+
+            # 显示详细数据
+            st.write(f"总评论数: {summary['总评论数']}")
+            st.write(f"视觉类评论数: {summary['视觉类评论数']}")
+            st.write(f"总点赞数: {summary['总点赞数']}")
+            st.write(f"视觉类评论点赞数: {summary['视觉类评论点赞数']}")
+            st.write(f"视觉类评论加权占比: {summary['视觉类评论加权占比']:.2%}")
 
-        # 计算视觉类评论的总点赞数
-        visual_likes = visual_comments[likes_column].sum()
+            # 获取点赞数前十的视觉类评论
+            st.write("点赞数前十的视觉类评论：")
+            top_10_visual_comments = visual_comments.nlargest(10, likes_column)[[comment_column, likes_column]]
+            st.dataframe(top_10_visual_comments)
 
-        # 计算所有有效评论的总点赞数
-        filtered_data = data[(data[comment_column].str.strip() != '') & (data[comment_column] != ',,,,')]
-        total_likes = filtered_data[likes_column].sum()
+            # 提供下载按钮，允许用户下载筛选后的数据（完整列从 Parquet 缓存读取）
+            full_visual_comments = dataset_session.load_frame().loc[visual_comments.index]
+            st.download_button(
+                label="下载筛选后的结果",
+                data=full_visual_comments.to_csv(index=False).encode('utf-8'),
+                file_name="filtered_visual_comments.csv",
+                mime='text/csv'
+            )
+else:
+    # 多个分类结果文件：上传或指定服务器目录
+    uploaded_files = st.file_uploader("上传多个分类结果数据表", type=["csv", "xlsx"], accept_multiple_files=True)
+    directory = st.text_input("或输入服务器上的目录（读取其中所有 CSV/Excel 文件）", "")
 
-        # 计算视觉类评论加权占比
-        weighted_visual_ratio = visual_likes / total_likes if total_likes != 0 else 0
+    comment_column = st.text_input("评论内容列名", "评论内容")
+    likes_column = st.text_input("点赞数列名", "点赞数")
+    classification_column = st.text_input("分类列名", "classification")
 
-        # 计算详细数据
-        total_comments = len(filtered_data)
-        visual_comments_count = len(visual_comments)
+    # 收集所有文件对应的 Parquet 缓存，视频名取文件名
+    datasets = {}
+    with metrics.stage("转换/命中 Parquet 缓存") as s:
+        sources = [(uploaded_file.name, uploaded_file) for uploaded_file in uploaded_files or []]
+        if directory:
+            if os.path.isdir(directory):
+                paths = sorted(glob.glob(os.path.join(directory, "*.csv")) + glob.glob(os.path.join(directory, "*.xlsx")))
+                sources += [(path, path) for path in paths]
+            else:
+                st.error(f"找不到目录：{directory}")
+        for name, source in sources:
+            video = visual_ratio.video_name(name)
+            while video in datasets:  # 同名文件加后缀区分
+                video += "_"
+            try:
+                datasets[video] = (dataset_cache.cache_file(source) if isinstance(source, str)
+                                   else dataset_cache.cache_upload(source))
+            except Exception as e:
+                st.error(f"文件 {name} 读取失败：{e}")
+        s.rows = len(datasets)
 
-        # 显示详细数据
-        st.write(f"总评论数: {total_comments}")
-        st.write(f"视觉类评论数: {visual_comments_count}")
-        st.write(f"总点赞数: {total_likes}")
-        st.write(f"视觉类评论点赞数: {visual_likes}")
-        st.write(f"视觉类评论加权占比: {weighted_visual_ratio:.2%}")
+    if datasets:
+        try:
+            with metrics.stage("多视频汇总", rows=len(datasets)):
+                table = visual_ratio.summarize_videos(datasets, comment_column, likes_column, classification_column,
+                                                      cache=get_summary_cache())
+        except Exception as e:
+            st.error(f"汇总失败，请检查各文件是否包含所填列名：{e}")
+            st.stop()
 
-        # 获取点赞数前十的视觉类评论
-        st.write("点赞数前十的视觉类评论：")
-        top_10_visual_comments = visual_comments.nlargest(10, likes_column)[[comment_column, likes_column]]
-        st.dataframe(top_10_visual_comments)
+        table = pd.concat([table, pd.DataFrame([visual_ratio.total_row(table)])], ignore_index=True)
+        st.write(f"共 {len(datasets)} 个视频：")
+        st.dataframe(table.style.format({'视觉类评论加权占比': '{:.2%}'}), hide_index=True)
 
-        # 提供下载按钮，允许用户下载筛选后的数据
         st.download_button(
-            label="下载筛选后的结果",
-            data=visual_comments.to_csv(index=False).encode('utf-8'),
-            file_name="filtered_visual_comments.csv",
+            label="下载各视频统计结果",
+            data=table.to_csv(index=False).encode('utf-8-sig'),
+            file_name="visual_ratio_by_video.csv",
             mime='text/csv'
-        )
\ No newline at end of file
+        )
+    else:
+        st.info("请上传文件或输入目录")
+
+metrics.render_sidebar()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量分析一个目录下的所有视频评论导出文件（每个视频一个 CSV/Excel），按进程池并行处理。
+
+每个文件依次做：分词、关键词关联、关键词密度、LDA 主题建模；单个文件失败不影响其他文件。
+输出目录中每个视频一个子目录，另有 summary.csv（逐文件报告）和 rollup.json（全语料汇总）。
+
+用法：
+    python -m tools.batch_runner 导出目录 --output batch_output --keywords "数据 可视化" --topics 5 --workers 8 \
+        --segmenter jieba
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from utils import dataset_cache, keyword_stats, segment, visual_ratio
+from utils.token_store import TokenStore
+
+
+def init_worker(segmenter_name):
+    # 每个工作进程只加载一次词典、停用词和分词模型
+    segment.get_segmenter(segmenter_name)
+
+
+def analyze_file(path, options):
+    started = time.perf_counter()
+    video = visual_ratio.video_name(path)
+    data = dataset_cache.parse_table(path, path)
+    comment_column, likes_column = options['comment_column'], options['likes_column']
+    classification_column = options['classification_column']
+    data[comment_column] = data[comment_column].fillna('').astype(str)
+    valid = visual_ratio.validity_mask(data[comment_column])
+    out_dir = os.path.join(options['output'], video)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 分词：每条评论只切一次，以整数 ID 的 CSR 数组保存，供密度统计和 LDA 共用
+    segmenter = segment.get_segmenter(options['segmenter'])
+    texts = [comment if ok else '' for comment, ok in zip(data[comment_column], valid)]
+    store = TokenStore.build(segmenter.cut_batch(texts))
+    result = {'视频': video, '文件': path, '状态': '成功', '评论数': int(valid.sum())}
+
+    keyword_counts, keyword_likes = {}, {}
+    if classification_column in data.columns:
+        visual = visual_ratio.visual_mask(data, comment_column, classification_column, valid)
+        summary = visual_ratio.summarize_single(data, comment_column, likes_column, classification_column)
+        result.update({k: summary[k] for k in ['视觉类评论数', '总点赞数', '视觉类评论点赞数', '视觉类评论加权占比']})
+
+        # 关键词密度（视觉类评论分词结果中的精确匹配）
+        density, total_words = keyword_stats.keyword_density(store, options['keywords'], rows=visual.to_numpy())
+        density.to_csv(os.path.join(out_dir, '关键词密度.csv'), index=False, encoding='utf-8-sig')
+        result['视觉类评论词数'] = total_words
+
+        # 关键词关联（视觉类评论原文中的子串匹配）
+        visual_comments = data[visual]
+        association = keyword_stats.keyword_association(visual_comments[comment_column],
+                                                        visual_comments[likes_column], options['keywords'])
+        association['matched'].to_csv(os.path.join(out_dir, '关键词关联.csv'), index=False, encoding='utf-8-sig')
+        result['包含关键词的视觉类评论数'] = association['match_count']
+        keyword_counts, keyword_likes = association['keyword_counts'], association['keyword_likes']
+        for keyword in options['keywords']:
+            result[f'{keyword}_评论数'] = keyword_counts[keyword]
+
+    # LDA：文档过少时 min_df=2 可能得到空词表，此时只记录原因
+    if options['topics'] > 0:
+        from utils.topic_model import perform_topic_modeling_store, topic_table
+
+        try:
+            lda, _, _ = perform_topic_modeling_store(store, n_topics=options['topics'])
+            pd.DataFrame(topic_table(lda)).to_csv(os.path.join(out_dir, '主题.csv'), index=False, encoding='utf-8-sig')
+        except ValueError as e:
+            result['LDA'] = f'跳过：{e}'
+
+    result['耗时 (s)'] = round(time.perf_counter() - started, 2)
+    word_counts = Counter(dict(zip(store.vocab, store.term_counts().tolist())))
+    return result, keyword_counts, keyword_likes, word_counts
+
+
+def safe_analyze_file(path, options):
+    # 单个文件的异常只记录在报告中，不影响其他文件
+    try:
+        return analyze_file(path, options)
+    except Exception as e:
+        result = {'视频': visual_ratio.video_name(path), '文件': path, '状态': '失败',
+                  '错误': f'{type(e).__name__}: {e}', '详情': traceback.format_exc(limit=3)}
+        return result, {}, {}, Counter()
+
+
+def rollup(results, keyword_counts, keyword_likes, word_counts, keywords):
+    succeeded = [r for r in results if r['状态'] == '成功']
+    total_likes = sum(r.get('总点赞数', 0) for r in succeeded)
+    visual_likes = sum(r.get('视觉类评论点赞数', 0) for r in succeeded)
+    return {
+        '文件数': len(results),
+        '成功': len(succeeded),
+        '失败': len(results) - len(succeeded),
+        '评论数': sum(r.get('评论数', 0) for r in succeeded),
+        '视觉类评论数': sum(r.get('视觉类评论数', 0) for r in succeeded),
+        '总点赞数': total_likes,
+        '视觉类评论点赞数': visual_likes,
+        '视觉类评论加权占比': visual_likes / total_likes if total_likes else 0,
+        '关键词评论数': {k: keyword_counts[k] for k in keywords},
+        '关键词点赞数': {k: keyword_likes[k] for k in keywords},
+        '高频词': word_counts.most_common(50),
+    }
+
+
+def to_builtin(value):
+    # numpy 数值转换为 json 可序列化的 Python 类型
+    return value.item() if hasattr(value, 'item') else value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量分析目录中的视频评论文件")
+    parser.add_argument('directory')
+    parser.add_argument('--output', default='batch_output')
+    parser.add_argument('--pattern', default='*.csv', help="文件匹配模式，如 *.csv 或 *_评论.csv")
+    parser.add_argument('--keywords', default='数据 可视化')
+    parser.add_argument('--topics', type=int, default=5, help="LDA 主题数，0 表示不做主题建模")
+    parser.add_argument('--comment-column', default='评论内容')
+    parser.add_argument('--likes-column', default='点赞数')
+    parser.add_argument('--classification-column', default='classification')
+    parser.add_argument('--segmenter', default=segment.DEFAULT_BACKEND, choices=list(segment.BACKENDS),
+                        help="分词方式")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, args.pattern)))
+    if not paths:
+        parser.error(f"目录中没有匹配 {args.pattern} 的文件")
+    os.makedirs(args.output, exist_ok=True)
+    options = {
+        'output': args.output,
+        'keywords': args.keywords.split(),
+        'topics': args.topics,
+        'comment_column': args.comment_column,
+        'likes_column': args.likes_column,
+        'classification_column': args.classification_column,
+        'segmenter': args.segmenter,
+    }
+
+    results = []
+    keyword_counts, keyword_likes, word_counts = Counter(), Counter(), Counter()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.segmenter,)) as executor:
+        futures = {executor.submit(safe_analyze_file, path, options): path for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                result, counts, likes, words = future.result()
+            except Exception as e:  # 工作进程崩溃等无法在进程内捕获的错误
+                result, counts, likes, words = ({'视频': visual_ratio.video_name(path), '文件': path, '状态': '失败',
+                                                 '错误': f'{type(e).__name__}: {e}'}, {}, {}, Counter())
+            results.append(result)
+            keyword_counts.update(counts)
+            keyword_likes.update(likes)
+            word_counts.update(words)
+            print(f"[{done}/{len(paths)}] {result['状态']} {path}")
+
+    summary = pd.DataFrame(results).sort_values('视频')
+    summary.to_csv(os.path.join(args.output, 'summary.csv'), index=False, encoding='utf-8-sig')
+    report = rollup(results, keyword_counts, keyword_likes, word_counts, options['keywords'])
+    report['总耗时 (s)'] = round(time.perf_counter() - started, 2)
+    with open(os.path.join(args.output, 'rollup.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=to_builtin)
+
+    print(f"完成：成功 {report['成功']}，失败 {report['失败']}，耗时 {report['总耗时 (s)']}s")
+    print(f"报告已保存到 {os.path.join(args.output, 'summary.csv')} 和 rollup.json")
+
+
+if __name__ == '__main__':
+    main()
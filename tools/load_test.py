@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对评论分类/关键词分析流程做离线压测，通常配合 tools/mock_llm_server.py 使用。
+
+用法：
+    python -m tools.load_test --base-url http://127.0.0.1:8000/v1 --count 500 --concurrency 16
+    python -m tools.load_test --base-url http://127.0.0.1:8000/v1 --file comments.csv --column 评论内容 --mode keywords
+    python -m tools.load_test --endpoint http://127.0.0.1:8000/v1 --endpoint http://127.0.0.1:8001/v1,qwen-plus,4
+    python -m tools.load_test --base-url http://127.0.0.1:8000/v1 --count 1000 --hedge-quantile 0.95 --hedge-budget 0.05
+"""
+import argparse
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+from utils import hedging, llm, llm_pool
+
+DEFAULT_TEMPLATE = "请你帮我分类每一条评论是否与画面信息相关。只需回答‘是’or‘否’。\n\n评论：{comment}\n分类："
+DEFAULT_KEYWORD_TEMPLATE = "以下内容出自网络视频评论区。请你根据以下提示语对评论进行逐条关键词分析。\n\n评论：{comment}\n分析结果："
+
+
+def load_comments(args):
+    if args.file:
+        data = pd.read_csv(args.file)
+        comments = data[args.column].fillna('').astype(str).tolist()
+        return comments[:args.count] if args.count else comments
+    return [f"第{i}条测试评论，数据可视化做得很好" for i in range(args.count or 200)]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评论分析流程压测")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000/v1')
+    parser.add_argument('--api-key', default='mock')
+    parser.add_argument('--model', default='qwen-turbo')
+    parser.add_argument('--mode', choices=['classify', 'keywords'], default='classify')
+    parser.add_argument('--file', help="评论 CSV 文件，不提供时生成测试评论")
+    parser.add_argument('--column', default='评论内容')
+    parser.add_argument('--count', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=10.0, help="单次请求超时（秒）")
+    parser.add_argument('--endpoint', action='append', default=[],
+                        help="多端点负载均衡：Base URL[,模型[,并发]]，可重复指定；指定后忽略 --base-url")
+    parser.add_argument('--hedge-quantile', type=float, default=0.0,
+                        help="请求超过最近耗时的该分位数仍未返回时发送对冲请求，0 表示不对冲")
+    parser.add_argument('--hedge-budget', type=float, default=0.05, help="对冲请求数占请求数的上限")
+    args = parser.parse_args()
+
+    if args.endpoint:
+        endpoints = []
+        for spec in args.endpoint:
+            base_url, model, concurrency = (spec.split(',') + [args.model, 4])[:3]
+            endpoints.append(llm_pool.Endpoint(args.api_key, base_url, model or args.model, int(concurrency),
+                                               timeout=args.timeout))
+        client = llm_pool.ClientPool(endpoints)
+        args.concurrency = client.capacity()
+    else:
+        client = llm.init_client(args.api_key, args.base_url, timeout=args.timeout)
+    if args.hedge_quantile:
+        client = hedging.HedgedClient(client, args.hedge_quantile, args.hedge_budget, max_workers=2 * args.concurrency)
+    model = None if args.endpoint else args.model  # 多端点时由各端点决定模型
+    comments = [c for c in load_comments(args) if not llm.is_skippable(c)]
+    latencies = []
+    lock = threading.Lock()
+
+    def run_one(comment):
+        start = time.perf_counter()
+        if args.mode == 'classify':
+            result = llm.classify_comment(client, comment, model, "You are a helpful assistant.",
+                                          DEFAULT_TEMPLATE, 0.8, 0.8, retries=args.retries)
+        else:
+            result = llm.analyze_keywords(client, comment, model, "You are a helpful assistant.",
+                                          DEFAULT_KEYWORD_TEMPLATE, 0.8, 0.8, retries=args.retries,
+                                          inspection_wait=0)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+        return result
+
+    started = time.perf_counter()
+    results = llm.run_concurrent(run_one, comments, concurrency=args.concurrency)
+    elapsed = time.perf_counter() - started
+
+    print(f"评论数: {len(comments)}  并发: {args.concurrency}  总耗时: {elapsed:.2f}s")
+    print(f"吞吐: {len(comments) / elapsed:.1f} 条/s" if elapsed else "吞吐: -")
+    print(f"单条耗时 p50={percentile(latencies, 0.5):.3f}s p95={percentile(latencies, 0.95):.3f}s "
+          f"p99={percentile(latencies, 0.99):.3f}s max={max(latencies, default=0):.3f}s")
+    counts = Counter(r if r in (llm.LABEL_INAPPROPRIATE, llm.LABEL_UNCLASSIFIED, llm.LABEL_UNANALYZED, '是', '否')
+                     else '其他' for r in results)
+    print("结果分布:", dict(counts))
+    if args.hedge_quantile:
+        print("对冲:", client.stats())
+        client = client.client
+    if args.endpoint:
+        print(pd.DataFrame(client.stats()).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 OpenAI 兼容的模拟服务，用于离线压测评论分类与关键词分析流程。
+
+用法：
+    python -m tools.mock_llm_server --port 8000 --latency lognormal:-1.5,0.6 --rate-429 0.05
+
+然后在页面中把 Base URL 设为 http://127.0.0.1:8000/v1，API 密钥随意填写。
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 从用户提示语中取出评论正文
+COMMENT_PATTERN = re.compile(r'评论：(.*?)(?:\n|$)', re.S)
+
+
+def parse_latency(spec):
+    # 支持 fixed:0.2 / uniform:0.1,0.5 / lognormal:mu,sigma / exp:mean
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',')] if args else []
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f"无法识别的延迟分布: {spec}")
+
+
+def extract_comment(messages):
+    user_messages = [m.get('content', '') for m in messages if m.get('role') == 'user']
+    prompt = user_messages[-1] if user_messages else ''
+    match = COMMENT_PATTERN.search(prompt)
+    return prompt, (match.group(1).strip() if match else prompt)
+
+
+def stable_fraction(text):
+    # 同一条评论总是得到同一个 [0, 1) 的值，保证回答可复现
+    digest = hashlib.md5(text.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+# 不够规范的分类回答：附带解释、标点，或含糊其辞
+LOOSE_ANSWERS = {'是': ['是的。', '是，评论提到了画面', '可能是'], '否': ['否。', '不是，评论只讨论了配音', '无法判断']}
+
+
+def keywords_for(comment):
+    words = re.findall(r'\w{2}', comment)[:3]
+    return '关键词：' + ('、'.join(words) if words else '无')
+
+
+def answer_for(prompt, comment, visual_ratio, loose_rate=0.0):
+    if '关键词' in prompt and '分类' not in prompt:
+        return keywords_for(comment)
+    label = '是' if stable_fraction(comment) < visual_ratio else '否'
+    if 'JSON' in prompt:
+        # 合并请求：分类和关键词分析放在同一个 JSON 中
+        return json.dumps({'分类': label, '关键词分析': keywords_for(comment) if label == '是' else ''},
+                          ensure_ascii=False)
+    loose = stable_fraction('loose' + comment)
+    if loose < loose_rate:
+        variants = LOOSE_ANSWERS[label]
+        return variants[int(loose / loose_rate * len(variants))]
+    return label
+
+
+def count_tokens(text):
+    # 粗略估计：中文按字计，其余按 4 个字符一个 token
+    cjk = len(re.findall(r'[一-鿿]', text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.latency = parse_latency(args.latency)
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'ok': 0, '429': 0, 'timeout': 0, 'data_inspection_failed': 0}
+
+    def draw(self):
+        # 随机数生成器非线程安全，统一加锁抽样
+        with self.lock:
+            self.stats['requests'] += 1
+            return self.rng.random(), self.latency(self.rng)
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        if not self.state.args.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_error_json(self, status, code, message, headers=None):
+        self.send_json(status, {'error': {'code': code, 'message': message, 'type': code}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self.send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model'}]})
+        elif self.path.rstrip('/').endswith('/stats'):
+            with self.state.lock:
+                self.send_json(200, dict(self.state.stats))
+        else:
+            self.send_error_json(404, 'not_found', self.path)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error_json(404, 'not_found', self.path)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        args = self.state.args
+
+        with self.state.lock:
+            over_capacity = args.max_concurrency and self.state.in_flight >= args.max_concurrency
+            self.state.in_flight += 1
+        try:
+            self.handle_completion(request, args, over_capacity)
+        finally:
+            with self.state.lock:
+                self.state.in_flight -= 1
+
+    def handle_completion(self, request, args, over_capacity):
+        roll, delay = self.state.draw()
+
+        # 按累积概率依次注入 429、超时和内容审查失败
+        if over_capacity or roll < args.rate_429:
+            self.state.count('429')
+            self.send_error_json(429, 'rate_limit_exceeded', 'Requests rate limit exceeded.',
+                                 {'Retry-After': str(args.retry_after)})
+            return
+        roll -= args.rate_429
+        if roll < args.rate_timeout:
+            self.state.count('timeout')
+            time.sleep(args.timeout_seconds)
+            self.send_error_json(504, 'timeout', 'Upstream request timed out.')
+            return
+        roll -= args.rate_timeout
+
+        prompt, comment = extract_comment(request.get('messages', []))
+        if roll < args.rate_inspection or (args.inspection_word and args.inspection_word in comment):
+            self.state.count('data_inspection_failed')
+            self.send_error_json(400, 'data_inspection_failed', 'Input data may contain inappropriate content.')
+            return
+
+        time.sleep(delay)
+        loose_rate = 0.0 if request.get('model') == args.strict_model else args.loose_rate
+        content = answer_for(prompt, comment, args.visual_ratio, loose_rate)
+        if request.get('max_tokens'):
+            while count_tokens(content) > request['max_tokens']:
+                content = content[:-1]
+        prompt_tokens = sum(count_tokens(m.get('content', '')) for m in request.get('messages', []))
+        completion_tokens = count_tokens(content)
+        self.state.count('ok')
+        self.send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地模拟服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', default='fixed:0.05', help="延迟分布，如 fixed:0.2、uniform:0.1,0.5、lognormal:-1.5,0.6、exp:0.3")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="429 响应中的 Retry-After 秒数")
+    parser.add_argument('--rate-timeout', type=float, default=0.0, help="挂起后返回 504 的概率")
+    parser.add_argument('--timeout-seconds', type=float, default=30.0, help="模拟超时的挂起时长")
+    parser.add_argument('--rate-inspection', type=float, default=0.0, help="返回 data_inspection_failed 的概率")
+    parser.add_argument('--inspection-word', default='', help="评论包含该词时必定返回 data_inspection_failed")
+    parser.add_argument('--visual-ratio', type=float, default=0.3, help="回答“是”的评论比例")
+    parser.add_argument('--loose-rate', type=float, default=0.0, help="分类回答不规范（带解释或含糊）的比例")
+    parser.add_argument('--strict-model', default='', help="该模型的分类回答总是规范的“是”/“否”")
+    parser.add_argument('--max-concurrency', type=int, default=0, help="超过该并发数时返回 429，0 表示不限")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quiet', action='store_true', help="不打印访问日志")
+    return parser
+
+
+def make_server(args):
+    handler = type('BoundMockHandler', (MockHandler,), {'state': MockState(args)})
+    return ThreadingHTTPServer((args.host, args.port), handler)
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    server = make_server(args)
+    print(f"模拟服务已启动: http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
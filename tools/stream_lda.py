@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在大于内存的已分词语料上训练 LDA（每行一条评论、词之间用空格分隔，如 LDA/cut_words.py 生成的 data_full.dat）。
+
+词典一次流式遍历建立并按文档频率过滤（min_df=2、max_df=0.95），词袋语料写入 Matrix Market 文件，
+训练时按块从磁盘读取，内存占用与语料大小无关。输出目录中保存词典、语料文件、模型和 topics.csv；
+指定 --name 时模型同时保存到模型库，可在 LDA 页面直接为新评论推断主题。
+
+用法：
+    python -m tools.stream_lda LDA/data_full.dat --output lda_output --topics 10 --chunksize 2000 --passes 1 \
+        --name "全量评论 10 个主题"
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from utils import lda_registry, segment, topic_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="磁盘流式 LDA 主题建模")
+    parser.add_argument('corpus', help="已分词的文本文件，每行一条评论")
+    parser.add_argument('--output', default='lda_output')
+    parser.add_argument('--topics', type=int, default=10)
+    parser.add_argument('--chunksize', type=int, default=2000, help="每次从磁盘读取并更新模型的评论数")
+    parser.add_argument('--passes', type=int, default=1)
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--name', help="保存到模型库时使用的模型名称，不指定则不保存")
+    parser.add_argument('--segmenter', default=segment.DEFAULT_BACKEND, choices=list(segment.BACKENDS),
+                        help="语料的分词方式，推断新评论时按同样方式分词")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    started = time.perf_counter()
+    documents = topic_model.TokenFile(args.corpus, encoding=args.encoding)
+    lda, dictionary, corpus = topic_model.perform_topic_modeling_stream(
+        documents, os.path.join(args.output, 'corpus.mm'), n_topics=args.topics,
+        chunksize=args.chunksize, passes=args.passes)
+    lda.save(os.path.join(args.output, 'lda.model'))
+    pd.DataFrame(topic_model.topic_table(lda)).to_csv(os.path.join(args.output, 'topics.csv'), index=False,
+                                                      encoding='utf-8-sig')
+    print(f"评论数: {len(corpus)}，词表大小: {len(dictionary)}，主题数: {args.topics}，"
+          f"耗时 {time.perf_counter() - started:.1f} 秒")
+    print(f"结果已保存到: {args.output}")
+    if args.name:
+        meta = lda_registry.save_model(lda, dictionary, args.name, segmenter=args.segmenter,
+                                       dataset=os.path.basename(args.corpus), rows=len(corpus), streaming=True)
+        print(f"模型已保存到模型库（ID: {meta['id']}）")
+
+
+if __name__ == '__main__':
+    main()
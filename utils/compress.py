@@ -0,0 +1,44 @@
+import re
+
+from utils import tokens
+
+# 发送给模型前的压缩规则：名称 -> (说明, 正则, 替换)。按顺序执行，回复前缀需要在 @ 提及之前处理
+RULES = {
+    'reply': ("回复前缀（回复 @xxx :）", re.compile(r'^\s*回复\s*@[^\s:：]+\s*[:：]\s*'), ''),
+    'url': ("链接", re.compile(r'(?:https?://|www\.)[^\s一-鿿]+'), ' '),
+    'mention': ("@提及", re.compile(r'@[^\s@:：,，。!！?？]+'), ' '),
+    'emoji': ("中括号表情（[表情包]）", re.compile(r'\[[^\[\]\s]{1,12}\]'), ' '),
+    # 数字和英文字母不压缩：1000、2333、zzz 等重复有实际含义
+    'repeat': ("重复字符（哈哈哈哈 → 哈哈）", re.compile(r'([^0-9A-Za-z])\1{2,}'), r'\1\1'),
+}
+DEFAULT_RULES = tuple(RULES)
+
+
+def rule_labels(names=DEFAULT_RULES):
+    return [RULES[name][0] for name in names]
+
+
+def rules_from_labels(labels):
+    return tuple(name for name, (label, _, _) in RULES.items() if label in labels)
+
+
+def compress(text, rules=DEFAULT_RULES):
+    for name in rules:
+        _, pattern, replacement = RULES[name]
+        text = pattern.sub(replacement, text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def report(originals, compressed):
+    # 压缩前后的 token 数对比，以及压缩后为空（不再发送）的评论数
+    before = sum(tokens.count_tokens_batch(originals))
+    sent = [text for text in compressed if text]
+    after = sum(tokens.count_tokens_batch(sent))
+    return {
+        'comments': len(originals),
+        'emptied': len(compressed) - len(sent),
+        'tokens_before': before,
+        'tokens_after': after,
+        'tokens_saved': before - after,
+        'saved_ratio': (before - after) / before if before else 0,
+    }
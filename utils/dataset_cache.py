@@ -0,0 +1,108 @@
+import hashlib
+import io
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 上传的数据表按内容哈希转换为 Parquet 存放在这里，之后按列读取不再解析原文件
+CACHE_DIR = os.environ.get("COMMENT_TOOL_CACHE_DIR", os.path.join(".cache", "datasets"))
+
+# 同一个上传文件或未修改的本地文件在多次重跑之间只计算一次哈希
+_upload_hashes = {}
+_file_hashes = {}
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(digest):
+    return os.path.join(CACHE_DIR, f"{digest}.parquet")
+
+
+def parse_table(source, name):
+    if name.lower().endswith(('.xlsx', '.xls')):
+        return pd.read_excel(source)
+    return pd.read_csv(source)
+
+
+def to_arrow(df):
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # 同一列混有数字和字符串时统一转为字符串，缺失值保持为空
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def write_cache(df, digest, name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    table = to_arrow(df)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'source_name': name.encode('utf-8')})
+    # 先写临时文件再改名，避免并发读取到写了一半的缓存
+    path = cache_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def cache_upload(uploaded_file):
+    # 返回上传文件对应的 Parquet 路径，内容相同的文件只解析一次
+    key = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, 'file_id', None))
+    digest = _upload_hashes.get(key)
+    if digest is None:
+        digest = content_hash(uploaded_file.getvalue())
+        _upload_hashes[key] = digest
+    path = cache_path(digest)
+    if not os.path.exists(path):
+        write_cache(parse_table(io.BytesIO(uploaded_file.getvalue()), uploaded_file.name), digest, uploaded_file.name)
+    return path
+
+
+def cache_file(file_path):
+    # 服务器本地文件同样按内容哈希缓存；文件未修改时不重复计算哈希
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    digest = _file_hashes.get(key)
+    if digest is None:
+        digest = file_hash(file_path)
+        _file_hashes[key] = digest
+    path = cache_path(digest)
+    if not os.path.exists(path):
+        write_cache(parse_table(file_path, file_path), digest, os.path.basename(file_path))
+    return path
+
+
+def column_names(path):
+    return pq.read_schema(path).names
+
+
+def row_count(path):
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def preview(path, n=5):
+    # 只读取开头几行用于预览
+    batch = next(pq.ParquetFile(path).iter_batches(batch_size=n), None)
+    return batch.to_pandas() if batch is not None else pd.DataFrame(columns=column_names(path))
+
+
+def read_columns(path, columns=None):
+    # 以内存映射方式只读取需要的列；columns 为 None 时读取全部列
+    if columns is not None:
+        columns = list(dict.fromkeys(columns))
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
@@ -0,0 +1,87 @@
+import os
+
+import streamlit as st
+
+from utils import dataset_cache
+
+# 各页面共用的列角色，选择一次后在所有页面保持
+ROLE_LABELS = {
+    'comment': "选择评论内容列",
+    'likes': "选择点赞数列",
+    'classification': "选择分类列",
+}
+ROLE_GUESSES = {
+    'comment': ['评论内容', '评论', 'comment', 'content'],
+    'likes': ['点赞数', '点赞', 'like'],
+    'classification': ['classification', '分类'],
+}
+
+
+def current():
+    return st.session_state.get('dataset')
+
+
+def set_dataset(path, name):
+    st.session_state.dataset = {
+        'path': path,
+        'name': name,
+        'rows': dataset_cache.row_count(path),
+        'columns': dataset_cache.column_names(path),
+    }
+    # 新数据表中仍然存在的列保留原来的角色选择
+    roles = st.session_state.get('dataset_roles', {})
+    st.session_state.dataset_roles = {role: column for role, column in roles.items()
+                                      if column in st.session_state.dataset['columns']}
+
+
+def dataset_picker(types=("csv", "xlsx")):
+    # 在页面顶部调用：已有数据表时直接复用，否则上传文件或指定服务器路径
+    dataset = current()
+    title = f"数据表：{dataset['name']}（{dataset['rows']} 行）" if dataset else "数据表：未加载"
+    with st.expander(title, expanded=dataset is None):
+        uploaded_file = st.file_uploader("上传数据表（所有页面共用）", type=list(types))
+        server_path = st.text_input("或输入服务器上的文件路径", "")
+        if uploaded_file is not None and st.session_state.get('dataset_upload_id') != uploaded_file.file_id:
+            # 每个上传文件只处理一次，之后切换页面不再重复上传和解析
+            st.session_state.dataset_upload_id = uploaded_file.file_id
+            set_dataset(dataset_cache.cache_upload(uploaded_file), uploaded_file.name)
+            st.rerun()
+        if server_path and st.button("加载服务器文件"):
+            if os.path.isfile(server_path):
+                set_dataset(dataset_cache.cache_file(server_path), os.path.basename(server_path))
+                st.rerun()
+            else:
+                st.error(f"找不到文件：{server_path}")
+    return current()
+
+
+def guess_column(role, columns):
+    for candidate in ROLE_GUESSES[role]:
+        for column in columns:
+            if candidate.lower() in str(column).lower():
+                return column
+    return columns[0] if columns else None
+
+
+def role_column(role, label=None):
+    # 列选择框：默认值取自其他页面已选的列或按列名猜测，选择结果写回共享状态
+    columns = current()['columns']
+    roles = st.session_state.setdefault('dataset_roles', {})
+    chosen = roles.get(role) or guess_column(role, columns)
+    index = columns.index(chosen) if chosen in columns else 0
+    roles[role] = st.selectbox(label or ROLE_LABELS[role], columns, index=index)
+    return roles[role]
+
+
+@st.cache_resource(max_entries=4)
+def _load_frame(path, columns):
+    return dataset_cache.read_columns(path, list(columns) if columns is not None else None)
+
+
+def load_frame(columns=None):
+    # 同一数据表、同一组列在所有页面和会话间共享一份；返回的 DataFrame 不可原地修改，需要修改时先 copy()
+    return _load_frame(current()['path'], tuple(columns) if columns is not None else None)
+
+
+def preview(n=5):
+    return dataset_cache.preview(current()['path'], n)
@@ -0,0 +1,126 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils import llm, metrics
+
+# 对冲请求：请求在最近成功请求耗时的 p95 之前还没有回答时，再发送一份相同的请求，取先返回的回答。
+# 额外请求数不超过请求数 × budget，少数卡住的请求不再决定整次运行的耗时。
+# 同步的 openai 客户端无法中途取消已发出的 HTTP 请求：落后的请求在后台继续，结果直接丢弃，
+# 最长等到单次请求超时
+MIN_SAMPLES = 20
+WINDOW = 500
+
+
+class HedgedClient:
+    def __init__(self, client, quantile=0.95, budget=0.05, max_workers=64):
+        # client 可以是 openai 客户端或多端点客户端池
+        self.client = client
+        self.quantile = quantile
+        self.budget = budget
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=WINDOW)  # 最近成功请求的耗时
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def threshold(self):
+        # 发送对冲请求前等待的时间；样本不足时不对冲
+        with self.lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            return metrics.percentile(list(self.latencies), self.quantile)
+
+    def _within_budget(self):
+        with self.lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _call(self, model, messages, temperature, top_p, retries, limiter, kwargs):
+        start = time.perf_counter()
+        result = llm.chat(self.client, model, messages, temperature, top_p, retries=retries,
+                          limiter=limiter, **kwargs)
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+        return result
+
+    def complete(self, messages, temperature, top_p, retries=3, limiter=None, model=None, **kwargs):
+        # 与 llm.chat 相同的接口语义；两份请求都失败时抛出原请求的错误
+        with self.lock:
+            self.requests += 1
+        primary = self.executor.submit(contextvars.copy_context().run, self._call, model, messages, temperature,
+                                      top_p, retries, limiter, kwargs)
+        delay = self.threshold()
+        if delay is None or wait([primary], timeout=delay).done or not self._within_budget():
+            return primary.result()
+
+        hedge = self.executor.submit(contextvars.copy_context().run, self._call, model, messages, temperature,
+                                   top_p, retries, limiter, kwargs)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 另一份请求还没发出时直接取消，已发出的结果丢弃
+                    for other in pending:
+                        other.cancel()
+                    if future is hedge:
+                        with self.lock:
+                            self.hedge_wins += 1
+                    return future.result()
+        return primary.result()
+
+    def stats(self):
+        with self.lock:
+            requests, hedges, wins = self.requests, self.hedges, self.hedge_wins
+        threshold = self.threshold()
+        return {
+            '请求数': requests,
+            '对冲请求数': hedges,
+            '对冲占比': hedges / requests if requests else 0.0,
+            '对冲请求先返回': wins,
+            '对冲阈值 (s)': None if threshold is None else round(threshold, 3),
+        }
+
+    def shutdown(self):
+        # 不等待落后的请求结束
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def release(client):
+    # 用完后关闭对冲客户端的线程池；普通客户端与客户端池在进程内共用，不做处理
+    if isinstance(client, HedgedClient):
+        client.shutdown()
+
+
+def releasing(client, fn):
+    # 包装后台任务函数 fn(job)：任务结束（包括出错和取消）后关闭本次运行创建的对冲客户端
+    def run(job):
+        try:
+            return fn(job)
+        finally:
+            release(client)
+    return run
+
+
+def describe(stats):
+    return (f"对冲请求：{stats['请求数']} 次请求中 {stats['对冲请求数']} 次发送了对冲请求（{stats['对冲占比']:.1%}），"
+            f"其中 {stats['对冲请求先返回']} 次对冲请求先返回；对冲阈值 {stats['对冲阈值 (s)']} 秒")
+
+
+def hedge_settings():
+    # 页面上的对冲设置：启用后返回 (分位数, 额外请求比例)，否则返回 None
+    import streamlit as st
+
+    with st.expander("对冲请求（降低长尾延迟）"):
+        if not st.checkbox("启用对冲请求", value=False):
+            return None
+        st.caption(f"先积累 {MIN_SAMPLES} 次请求的耗时；之后请求超过该分位数仍未返回时再发送一份，取先返回的回答")
+        quantile = st.slider("对冲阈值（最近请求耗时的分位数）", 0.5, 0.99, 0.95)
+        budget = st.number_input("对冲请求上限（占请求数的百分比）", value=5.0, min_value=0.0, max_value=100.0, step=1.0)
+        return quantile, budget / 100
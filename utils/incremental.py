@@ -0,0 +1,55 @@
+import hashlib
+import re
+
+import pandas as pd
+
+from utils import llm
+
+# 上次结果中这些标签不复用：请求失败的评论需要重新分析，未处理的评论本来就不会发送
+RETRY_LABELS = {llm.LABEL_UNCLASSIFIED, llm.LABEL_UNANALYZED, llm.LABEL_SKIPPED}
+INTEGRAL_FLOAT = re.compile(r'^(-?\d+)\.0+$')
+
+
+def normalize_text(text):
+    # 忽略首尾空白、连续空白和大小写的差异
+    return re.sub(r'\s+', ' ', str(text)).strip().lower()
+
+
+def _digest(*parts):
+    return hashlib.md5('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def id_key(value):
+    # 评论 ID 转为字符串键：ID 列有缺失值时会被读成浮点，123 与 123.0（或 "123.0"）视为同一条评论
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, str):
+        return INTEGRAL_FLOAT.sub(r'\1', value.strip())
+    return str(value)
+
+
+def row_keys(data, comment_column, id_column=None, author_column=None):
+    # 行的稳定键：有评论 ID 时直接使用，否则用规范化后的评论内容 + 作者计算哈希
+    if id_column:
+        return data[id_column].map(id_key)
+    texts = data[comment_column].fillna('').map(normalize_text)
+    authors = data[author_column].fillna('').astype(str) if author_column else pd.Series('', index=data.index)
+    return pd.Series([_digest(t, a) for t, a in zip(texts, authors)], index=data.index)
+
+
+def content_hashes(data, comment_column):
+    return data[comment_column].fillna('').map(lambda text: _digest(normalize_text(text)))
+
+
+def reuse_labels(data, previous, comment_column, label_column='classification', id_column=None, author_column=None):
+    # 返回与 data 逐行对应的上次分类结果；新增、内容被修改或上次失败的评论为 None，需要重新发送
+    previous = previous[previous[label_column].notna() & ~previous[label_column].isin(RETRY_LABELS)]
+    previous = previous.assign(_key=row_keys(previous, comment_column, id_column, author_column).to_numpy(),
+                               _content=content_hashes(previous, comment_column).to_numpy())
+    previous = previous.drop_duplicates('_key', keep='last').set_index('_key')
+
+    keys = row_keys(data, comment_column, id_column, author_column).to_numpy()
+    # 按评论 ID 匹配时，评论被编辑过（内容哈希变化）也需要重新分类
+    unchanged = previous['_content'].reindex(keys).to_numpy() == content_hashes(data, comment_column).to_numpy()
+    labels = previous[label_column].reindex(keys).where(unchanged)
+    return [None if pd.isna(label) else label for label in labels]
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+
+from utils import dataset_cache, dataset_session, metrics
+
+# 任务表保存在这里，服务重启后仍能看到历史任务和结果文件
+JOB_DIR = os.environ.get("COMMENT_TOOL_JOB_DIR", os.path.join(".cache", "jobs"))
+
+STATUS_QUEUED = "排队中"
+STATUS_RUNNING = "运行中"
+STATUS_DONE = "已完成"
+STATUS_CANCELLED = "已取消"
+STATUS_FAILED = "失败"
+STATUS_INTERRUPTED = "已中断"
+FINAL_STATUSES = {STATUS_DONE, STATUS_CANCELLED, STATUS_FAILED, STATUS_INTERRUPTED}
+
+# 进度写盘的最小间隔（秒），避免每条评论都写一次任务表
+PERSIST_INTERVAL = 1.0
+# 任务面板只列出最近的任务数
+RECENT_JOBS = 20
+
+
+class Job:
+    def __init__(self, manager, job_id, name, page):
+        self.manager = manager
+        self.id = job_id
+        self.name = name
+        self.page = page
+        self.status = STATUS_QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = 0
+        self.total = 0
+        self.message = ""
+        self.messages = []
+        self.error = None
+        self.result = None
+        self.metrics = None  # 本任务的性能统计（提交时开启了记录才有），只保存在内存中
+        self._cancel = threading.Event()
+
+    def progress(self, done, total, message=None):
+        # 工作线程中调用：只更新内存中的状态，写盘由管理器节流
+        self.done, self.total = done, total
+        if message is not None:
+            self.message = message
+        self.manager.save(force=False)
+
+    def log(self, message):
+        # 任务完成后在页面上展示的说明信息
+        self.messages.append(message)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in
+                ('id', 'name', 'page', 'status', 'created', 'started', 'finished', 'done', 'total',
+                 'message', 'messages', 'error', 'result')}
+
+    @classmethod
+    def from_dict(cls, manager, record):
+        job = cls(manager, record['id'], record['name'], record['page'])
+        for key, value in record.items():
+            setattr(job, key, value)
+        return job
+
+
+class JobManager:
+    def __init__(self, job_dir=JOB_DIR, workers=1):
+        self.job_dir = job_dir
+        self.table_path = os.path.join(job_dir, "jobs.json")
+        self.lock = threading.Lock()
+        self.last_saved = 0.0
+        self.jobs = {}
+        if os.path.exists(self.table_path):
+            with open(self.table_path, encoding='utf-8') as f:
+                for record in json.load(f):
+                    job = Job.from_dict(self, record)
+                    if job.status not in FINAL_STATUSES:
+                        job.status = STATUS_INTERRUPTED  # 上次服务退出时未完成的任务
+                    self.jobs[job.id] = job
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def save(self, force=True):
+        now = time.monotonic()
+        if not force and now - self.last_saved < PERSIST_INTERVAL:
+            return
+        with self.lock:
+            self.last_saved = now
+            os.makedirs(self.job_dir, exist_ok=True)
+            records = [job.to_dict() for job in list(self.jobs.values())]
+            tmp_path = f"{self.table_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.table_path)
+
+    def submit(self, name, page, fn):
+        # fn(job) 在后台线程中运行，返回结果文件路径（或 None）；任务按提交顺序排队执行
+        job = Job(self, uuid.uuid4().hex[:8], name, page)
+        if metrics.is_enabled():
+            job.metrics = metrics.RunMetrics(page)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.save()
+        self.executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        if job.cancelled():
+            job.status = STATUS_CANCELLED
+            self.save()
+            return
+        job.status, job.started = STATUS_RUNNING, time.time()
+        self.save()
+        # 任务中的阶段耗时与模型请求记到任务自己的统计里，不受页面重跑和其他会话影响
+        token = metrics.bind(job.metrics)
+        try:
+            job.result = fn(job)
+            job.status = STATUS_CANCELLED if job.cancelled() else STATUS_DONE
+        except Exception as e:
+            job.status, job.error = STATUS_FAILED, f"{type(e).__name__}: {e}"
+        finally:
+            metrics.unbind(token)
+        job.finished = time.time()
+        self.save()
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        job.cancel()
+        if job.status == STATUS_QUEUED:
+            job.status = STATUS_CANCELLED
+        self.save()
+
+    def list(self, page=None):
+        return sorted((job for job in self.jobs.values() if page is None or job.page == page),
+                      key=lambda job: job.created, reverse=True)
+
+
+@st.cache_resource
+def get_manager():
+    # 整个服务进程共用一个任务管理器，页面重跑或切换页面不会中断任务
+    return JobManager()
+
+
+def _elapsed(job):
+    if job.started is None:
+        return ""
+    return f"{(job.finished or time.time()) - job.started:.0f}s"
+
+
+def job_panel(page, poll_seconds=2.0, limit=RECENT_JOBS):
+    # 只在本页面有排队或运行中的任务时定时刷新；任务全部结束后整页重跑一次，之后不再轮询
+    manager = get_manager()
+    polling = any(job.status not in FINAL_STATUSES for job in manager.list(page))
+
+    @st.fragment(run_every=poll_seconds if polling else None)
+    def panel():
+        page_jobs = manager.list(page)[:limit]
+        if polling and all(job.status in FINAL_STATUSES for job in page_jobs):
+            st.rerun()
+        if not page_jobs:
+            st.caption("暂无后台任务")
+            return
+        st.dataframe(pd.DataFrame([{
+            '任务': job.id,
+            '名称': job.name,
+            '状态': job.status,
+            '进度': f"{job.done}/{job.total}",
+            '提交时间': time.strftime('%m-%d %H:%M:%S', time.localtime(job.created)),
+            '耗时': _elapsed(job),
+            '当前': job.message,
+        } for job in page_jobs]), hide_index=True)
+
+        job = manager.jobs[st.selectbox("查看任务", [job.id for job in page_jobs])]
+        if job.status == STATUS_RUNNING and job.total:
+            st.progress(job.done / job.total)
+        if job.status not in FINAL_STATUSES and st.button("取消任务"):
+            manager.cancel(job.id)
+        if job.error:
+            st.error(job.error)
+        for message in job.messages:
+            st.write(message)
+        if job.metrics is not None:
+            with st.expander("性能统计"):
+                metrics.render_run(job.metrics, key=f"metrics_{job.id}")
+        if job.result and os.path.exists(job.result):
+            # 结果文件只在点击后读取并发送给浏览器，不随页面刷新反复传输
+            if st.button("准备下载", key=f"prepare_{job.id}"):
+                with open(job.result, 'rb') as f:
+                    st.download_button("下载结果", f.read(), file_name=os.path.basename(job.result))
+            if st.button("设为共享数据表"):
+                dataset_session.set_dataset(dataset_cache.cache_file(job.result), os.path.basename(job.result))
+                st.rerun()
+
+    st.subheader("后台任务")
+    panel()
@@ -0,0 +1,109 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils import dataset_cache, dataset_session, metrics, segment, token_store, visual_ratio
+
+# 自动推荐关键词：比较视觉类评论（classification 为“是”）与其他评论，找出在视觉类评论中明显更常出现的词。
+# 整列评论的 评论 × 词 稀疏矩阵只与权重向量相乘一次，得到每个词在两类评论中的文档数和出现次数，
+# 之后换排序方法或筛选条件都只是对词表长度的数组做向量运算
+METHODS = {'chi2': "卡方检验", 'log_odds': "对数几率比（带先验）"}
+
+
+class ClassCounts:
+    def __init__(self, vocab, doc_freq, term_freq, docs, positive_docs):
+        self.vocab = vocab
+        self.doc_freq = doc_freq  # 词 × 2：视觉类、其他评论中包含该词的（加权）评论数
+        self.term_freq = term_freq  # 词 × 2：两类评论中该词的（加权）出现次数
+        self.docs = docs  # 两类评论的（加权）评论数
+        self.positive_docs = positive_docs  # 包含该词的视觉类评论数（不加权），用于筛选
+
+
+def class_counts(store, positive, weights=None):
+    # positive 为每条评论是否为视觉类；weights 为每条评论的权重（如 1 + 点赞数），为空时每条评论计 1
+    positive = np.asarray(positive, dtype=bool)
+    weights = np.ones(len(store)) if weights is None else np.asarray(weights, dtype=np.float64)
+    vectors = np.column_stack([weights * positive, weights * ~positive, positive]).astype(np.float64)
+    matrix = store.to_csr()
+    term_freq = matrix.T @ vectors[:, :2]
+    matrix.data[:] = 1  # 同一评论中重复出现的词只计一次
+    doc_freq = matrix.T @ vectors
+    return ClassCounts(store.vocab, doc_freq[:, :2], term_freq, vectors[:, :2].sum(axis=0), doc_freq[:, 2])
+
+
+def chi_square(counts):
+    # 2 × 2 列联表（是否视觉类 × 是否包含该词）的卡方统计量；只保留在视觉类评论中偏多的词
+    a, b = counts.doc_freq[:, 0], counts.doc_freq[:, 1]
+    n1, n0 = counts.docs
+    c, d = n1 - a, n0 - b
+    denominator = (a + b) * (c + d) * (a + c) * (b + d)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(denominator > 0, (n1 + n0) * (a * d - b * c) ** 2 / denominator, 0.0)
+    return np.where(a * n0 > b * n1, score, 0.0)
+
+
+def log_odds(counts):
+    # 带信息先验的对数几率比 z 值（Monroe 等，2008）：以两类合计的词频为先验，低频词的差异被收缩
+    y1, y0 = counts.term_freq[:, 0], counts.term_freq[:, 1]
+    prior = y1 + y0
+    prior_total = prior.sum()
+    n1, n0 = y1.sum(), y0.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = (np.log((y1 + prior) / (n1 + prior_total - y1 - prior))
+                 - np.log((y0 + prior) / (n0 + prior_total - y0 - prior)))
+        score = delta / np.sqrt(1 / (y1 + prior) + 1 / (y0 + prior))
+    return np.where(np.isfinite(score) & (score > 0), score, 0.0)
+
+
+def rank(counts, method='chi2', min_count=5, top_n=30, min_length=2):
+    # 得分最高的 top_n 个词；至少出现在 min_count 条视觉类评论中、长度不少于 min_length 的词才参与排序
+    score = chi_square(counts) if method == 'chi2' else log_odds(counts)
+    lengths = np.fromiter((len(word) for word in counts.vocab), dtype=np.int64, count=len(counts.vocab))
+    candidates = np.flatnonzero((counts.positive_docs >= min_count) & (lengths >= min_length) & (score > 0))
+    top = candidates[np.argsort(-score[candidates], kind='stable')[:top_n]]
+    n1, n0 = counts.docs
+    return pd.DataFrame({
+        '关键词': [counts.vocab[i] for i in top],
+        '视觉类评论数': counts.positive_docs[top].astype(np.int64),
+        '视觉类评论占比 (%)': np.round(counts.doc_freq[top, 0] / n1 * 100 if n1 else 0.0, 2),
+        '其他评论占比 (%)': np.round(counts.doc_freq[top, 1] / n0 * 100 if n0 else 0.0, 2),
+        '得分': np.round(score[top], 2),
+    })
+
+
+@lru_cache(maxsize=4)
+def for_column(dataset_path, comment_column, classification_column, segmenter_name, likes_column=None):
+    # 每个数据表（及列、分词方式、是否加权）只统计一次；分词结果来自磁盘缓存
+    columns = [classification_column] + ([likes_column] if likes_column else [])
+    frame = dataset_cache.read_columns(dataset_path, columns)
+    store = token_store.for_column(dataset_path, comment_column, segment.get_segmenter(segmenter_name))
+    weights = 1 + visual_ratio.numeric_likes(frame[likes_column]).to_numpy() if likes_column else None
+    return class_counts(store, visual_ratio.is_visual(frame[classification_column]).to_numpy(), weights)
+
+
+def suggestion_panel(dataset_path, comment_column, classification_column, target_key, likes_column=None,
+                     segmenter_name=segment.DEFAULT_BACKEND):
+    # 页面上的关键词推荐：需在关键词输入框（key 为 target_key）之前调用，点击按钮后把选中的词填入输入框
+    import streamlit as st
+
+    with st.expander("自动推荐关键词（对比视觉类评论与其他评论）"):
+        method = st.radio("排序方法", list(METHODS), format_func=METHODS.get, horizontal=True)
+        weighted = st.checkbox("按点赞数加权（每条评论计 1 + 点赞数）", value=False)
+        if weighted and likes_column is None:
+            likes_column = dataset_session.role_column('likes')
+        min_count = st.number_input("至少出现在多少条视觉类评论中", value=5, min_value=1, step=1)
+        top_n = st.number_input("推荐关键词数", value=30, min_value=5, max_value=500, step=5)
+        if not st.checkbox("显示推荐关键词", value=False):
+            return
+        with metrics.stage("关键词推荐"):
+            counts = for_column(dataset_path, comment_column, classification_column, segmenter_name,
+                                likes_column if weighted else None)
+            table = rank(counts, method, min_count, top_n)
+        if table.empty:
+            st.write("没有找到在视觉类评论中明显更常出现的词，可以降低最少出现次数")
+            return
+        st.dataframe(table, hide_index=True)
+        chosen = st.multiselect("要填入的关键词", table['关键词'].tolist(), default=table['关键词'].head(5).tolist())
+        if st.button("填入关键词框"):
+            st.session_state[target_key] = ' '.join(chosen)
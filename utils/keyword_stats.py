@@ -0,0 +1,100 @@
+from itertools import compress
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def keyword_density(store, keywords, rows=None, partial=False, weights=None):
+    # 关键词在分词结果（TokenStore）中的出现次数及其占总词数的比例；rows 选取部分评论。
+    # partial=True 时包含关键词的词也计入（如“可视化”计入“数据可视化”），只需扫描一遍词表；
+    # weights 为每条评论的权重（如近似重复评论降权），此时次数为加权后的值
+    counts = store.term_counts(rows, weights)
+    as_number = int if weights is None else lambda value: round(float(value), 2)
+    total_words = as_number(counts.sum())
+    keyword_counts = {}
+    for keyword in keywords:
+        if partial:
+            keyword_counts[keyword] = as_number(sum(counts[i] for i, word in enumerate(store.vocab) if keyword in word))
+        else:
+            word_id = store.word_id(keyword)
+            keyword_counts[keyword] = as_number(counts[word_id]) if word_id >= 0 else 0
+    table = pd.DataFrame({
+        "关键词": list(keyword_counts.keys()),
+        "出现次数": list(keyword_counts.values()),
+        "关键词密度 (%)": [f"{count / total_words * 100:.2f}" if total_words else "0.00"
+                          for count in keyword_counts.values()]
+    })
+    return table, total_words
+
+
+def keyword_hits(comments, keywords, index=None):
+    # 评论 × 关键词的包含关系（子串匹配），每个关键词一次向量化扫描；
+    # 提供整张数据表的倒排索引（inverted_index.InvertedIndex）时直接查索引，comments 的索引为行号
+    comments = comments.fillna('').astype(str)
+    if index is not None:
+        rows = comments.index.to_numpy()
+        return pd.DataFrame({keyword: index.contains(keyword)[rows] for keyword in keywords},
+                            index=comments.index, columns=list(dict.fromkeys(keywords)))
+    return pd.DataFrame({keyword: comments.str.contains(keyword, regex=False) for keyword in keywords},
+                        index=comments.index, columns=list(dict.fromkeys(keywords)))
+
+
+def keyword_association(comments, likes, keywords, index=None):
+    # 统计包含各关键词的评论数与点赞数，并给出命中的评论明细
+    hits = keyword_hits(comments, keywords, index)
+    numeric_likes = pd.to_numeric(likes, errors='coerce').fillna(0)
+    matched = hits.any(axis=1)
+
+    names = list(hits.columns)
+    matched_keywords = [", ".join(compress(names, row)) for row in hits[matched].to_numpy().tolist()]
+    matched_comments = pd.DataFrame({
+        "评论内容": comments[matched].to_numpy(),
+        "包含的关键词": matched_keywords,
+        "点赞数": likes[matched].to_numpy()
+    })
+    return {
+        'match_count': int(matched.sum()),
+        'keyword_counts': {keyword: int(count) for keyword, count in hits.sum().items()},
+        'keyword_likes': hits.mul(numeric_likes, axis=0).sum().to_dict(),
+        'matched': matched_comments
+    }
+
+
+def incidence_matrix(comments, keywords, index=None):
+    # 评论 × 关键词的稀疏 0/1 矩阵（CSR），只保存命中的位置
+    comments = comments.fillna('').astype(str)
+    keywords = list(dict.fromkeys(keywords))
+    hits = keyword_hits(comments, keywords, index)
+    rows, cols = [], []
+    for j, keyword in enumerate(keywords):
+        hit_rows = np.flatnonzero(hits[keyword].to_numpy())
+        rows.append(hit_rows)
+        cols.append(np.full(len(hit_rows), j, dtype=np.int32))
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int32)
+    data = np.ones(len(rows), dtype=np.float64)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(comments), len(keywords))), keywords
+
+
+def cooccurrence(comments, likes, keywords, index=None):
+    # 共现次数 XᵀX 与点赞加权共现 Xᵀ diag(likes) X，各一次稀疏矩阵乘法；对角线为单个关键词的统计
+    matrix, keywords = incidence_matrix(comments, keywords, index)
+    weights = pd.to_numeric(likes, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    counts = (matrix.T @ matrix).toarray()
+    weighted = (matrix.T @ sparse.diags(weights) @ matrix).toarray()
+    return (pd.DataFrame(counts.astype(np.int64), index=keywords, columns=keywords),
+            pd.DataFrame(weighted, index=keywords, columns=keywords))
+
+
+def top_pairs(counts, weighted, n=20):
+    # 共现次数最多的关键词对（上三角，不含对角线）
+    i, j = np.triu_indices(len(counts), k=1)
+    pairs = pd.DataFrame({
+        "关键词 A": counts.index[i],
+        "关键词 B": counts.columns[j],
+        "共现评论数": counts.to_numpy()[i, j],
+        "共现评论点赞数": weighted.to_numpy()[i, j],
+    })
+    pairs = pairs[pairs["共现评论数"] > 0]
+    return pairs.sort_values(["共现评论数", "共现评论点赞数"], ascending=False).head(n).reset_index(drop=True)
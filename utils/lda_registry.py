@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils import metrics
+
+# 训练好的 LDA 模型（连同词典和预处理配置）保存在这里，之后无需重新训练即可为新评论推断主题
+MODEL_DIR = os.environ.get("COMMENT_TOOL_MODEL_DIR", os.path.join(".cache", "models"))
+
+
+def save_model(lda, dictionary, name, **config):
+    # config 记录推断时需要复现的预处理：分词方式（segmenter）、训练数据表与列等
+    model_id = uuid.uuid4().hex[:8]
+    tmp_path = os.path.join(MODEL_DIR, f".{model_id}.tmp")
+    os.makedirs(tmp_path, exist_ok=True)
+    lda.save(os.path.join(tmp_path, "lda.model"))
+    dictionary.save(os.path.join(tmp_path, "dictionary"))
+    meta = {'id': model_id, 'name': name, 'topics': lda.num_topics, 'vocab': len(dictionary),
+            'created': time.time(), **config}
+    with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(MODEL_DIR, model_id))
+    return meta
+
+
+def list_models():
+    # 模型库中的所有模型，最新的在前
+    if not os.path.isdir(MODEL_DIR):
+        return []
+    metas = []
+    for model_id in os.listdir(MODEL_DIR):
+        path = os.path.join(MODEL_DIR, model_id, "meta.json")
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                metas.append(json.load(f))
+    return sorted(metas, key=lambda meta: meta['created'], reverse=True)
+
+
+def delete_model(model_id):
+    shutil.rmtree(os.path.join(MODEL_DIR, model_id), ignore_errors=True)
+    load_model.cache_clear()
+
+
+@lru_cache(maxsize=4)
+def load_model(model_id):
+    # 返回 (lda, dictionary, meta)；同一模型只从磁盘加载一次
+    LdaModel = metrics.import_module("gensim.models").LdaModel
+    Dictionary = metrics.import_module("gensim.corpora").Dictionary
+    path = os.path.join(MODEL_DIR, model_id)
+    with open(os.path.join(path, "meta.json"), encoding='utf-8') as f:
+        meta = json.load(f)
+    return LdaModel.load(os.path.join(path, "lda.model")), Dictionary.load(os.path.join(path, "dictionary")), meta
+
+
+def project(store, dictionary):
+    # 把分词缓存（TokenStore）的评论 × 词计数矩阵映射到模型词典的词 ID 上，模型词典之外的词丢弃
+    model_ids = np.array([dictionary.token2id.get(word, -1) for word in store.vocab], dtype=np.int64)
+    known = np.flatnonzero(model_ids >= 0)
+    mapping = sparse.csr_matrix((np.ones(len(known)), (known, model_ids[known])),
+                                shape=(len(store.vocab), len(dictionary)))
+    return (store.to_csr() @ mapping).tocsr()
+
+
+def _dirichlet_expectation(alpha):
+    psi = metrics.import_module("scipy.special").psi
+    return psi(alpha) - psi(alpha.sum(axis=1, keepdims=True))
+
+
+def infer(lda, counts, iterations=50, tol=1e-3, chunk_size=20000):
+    # 变分推断（与 LdaModel.inference 的 E 步相同），对稀疏的评论 × 词矩阵整体向量化计算，
+    # 不再逐条评论循环。返回每条评论的主题分布（行和为 1）
+    exp_elog_beta = np.exp(_dirichlet_expectation(lda.state.get_lambda()))  # 主题 × 词
+    alpha = np.asarray(lda.alpha, dtype=np.float64)
+    result = np.empty((counts.shape[0], lda.num_topics))
+    for start in range(0, counts.shape[0], chunk_size):
+        chunk = counts[start:start + chunk_size].tocoo()
+        rows, cols, values = chunk.row, chunk.col, chunk.data
+        beta_cols = exp_elog_beta[:, cols].T  # 非零位置 × 主题
+        gamma = np.random.default_rng(0).gamma(100.0, 0.01, (chunk.shape[0], lda.num_topics))
+        exp_elog_theta = np.exp(_dirichlet_expectation(gamma))
+        for _ in range(iterations):
+            previous = gamma
+            phinorm = np.einsum('ij,ij->i', exp_elog_theta[rows], beta_cols) + 1e-100
+            ratio = sparse.csr_matrix((values / phinorm, (rows, cols)), shape=chunk.shape)
+            gamma = alpha + exp_elog_theta * (ratio @ exp_elog_beta.T)
+            exp_elog_theta = np.exp(_dirichlet_expectation(gamma))
+            if np.abs(gamma - previous).mean() < tol:
+                break
+        result[start:start + chunk.shape[0]] = gamma / gamma.sum(axis=1, keepdims=True)
+    return result
+
+
+def topic_frame(theta, counts):
+    # 每条评论的主题分布、主导主题及其概率；没有任何模型词典中词语的评论主导主题为空
+    frame = pd.DataFrame(theta, columns=[f"主题{k + 1}" for k in range(theta.shape[1])])
+    empty = np.asarray(counts.sum(axis=1)).ravel() == 0
+    frame['主导主题'] = pd.Series(theta.argmax(axis=1) + 1, dtype='Int64').mask(empty)
+    frame['主导主题概率'] = pd.Series(theta.max(axis=1)).mask(empty)
+    return frame
@@ -0,0 +1,244 @@
+import contextvars
+import json
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils import metrics, tokens
+
+# 分类与关键词分析在出错时写入结果列的占位值
+LABEL_INAPPROPRIATE = "不适当内容"
+LABEL_UNCLASSIFIED = "无法分类"
+LABEL_UNANALYZED = "无法分析"
+LABEL_SKIPPED = "未处理"
+LABEL_YES, LABEL_NO = "是", "否"
+
+# 分类回答的规范化：模型常回答“是的”“否。”“不是”或附带解释，统一为“是”/“否”；
+# 含糊（“可能是”“无法判断”）或无法解析的回答视为无效
+EXPLICIT_PATTERN = re.compile(r"(?:分类|答案|结论|回答)(?:结果)?(?:\s*(?:[:：]|为))+\s*[‘“'\"「]?(不是|是|否)")
+UNCERTAIN_PATTERN = re.compile(r'可能|也许|不确定|无法判断|难以判断|不好说|不清楚|maybe|not sure|unsure')
+NO_PATTERN = re.compile(r'(?:不是|否|不相关|无关|no\b)')
+YES_PATTERN = re.compile(r'(?:是(?!否)|相关|有关|yes\b)')
+
+# 合并模式：一次请求在 JSON 中同时返回分类和关键词分析
+COMBINED_LABEL_KEY = "分类"
+COMBINED_ANALYSIS_KEY = "关键词分析"
+JSON_PATTERN = re.compile(r'\{.*\}', re.S)
+
+
+def retryable_errors():
+    # 可重试的错误：限流、超时、连接中断；openai 在第一次请求时才导入
+    openai = metrics.import_module("openai")
+    return openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError
+
+
+def init_client(api_key, base_url, timeout=60.0):
+    # 关闭 SDK 自带的重试，由 chat() 统一控制重试次数
+    openai = metrics.import_module("openai")
+    return openai.OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+
+
+def is_inspection_failed(error):
+    return "data_inspection_failed" in str(error)
+
+
+def normalize_label(answer):
+    # 返回“是”/“否”，无法解析或含糊的回答返回 None
+    text = re.sub(r"^[\s‘’“”'\"「」【】\[\]()（）*:：]+", '', str(answer)).lower()
+    match = EXPLICIT_PATTERN.search(text)
+    if match:
+        return LABEL_YES if match.group(1) == '是' else LABEL_NO
+    if UNCERTAIN_PATTERN.search(text):
+        return None
+    if NO_PATTERN.match(text):
+        return LABEL_NO
+    if YES_PATTERN.match(text):
+        return LABEL_YES
+    return None
+
+
+def is_skippable(comment):
+    # 评论为空或仅包含逗号时不送入模型
+    return not comment.strip() or comment == ',,,,'
+
+
+class RateLimiter:
+    # 按 60 秒滑动窗口限制每分钟请求数与 token 数，0 表示不限
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.lock = threading.Lock()
+        self.events = deque()
+        self.window_tokens = 0
+
+    def acquire(self, request_tokens=0):
+        if not self.rpm and not self.tpm:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.events and now - self.events[0][0] >= 60:
+                    self.window_tokens -= self.events.popleft()[1]
+                rpm_ok = not self.rpm or len(self.events) < self.rpm
+                # 单个请求超过 tpm 时，窗口清空后仍然放行，避免永久阻塞
+                tpm_ok = not self.tpm or not self.events or self.window_tokens + request_tokens <= self.tpm
+                if rpm_ok and tpm_ok:
+                    self.events.append((now, request_tokens))
+                    self.window_tokens += request_tokens
+                    return
+                wait = 60 - (now - self.events[0][0])
+            time.sleep(min(max(wait, 0.01), 1.0))
+
+
+def chat(client, model, messages, temperature, top_p, retries=3, backoff=1.0, limiter=None, **kwargs):
+    # 对限流/超时做指数退避重试，其余错误直接抛出。
+    # client 为多端点客户端池（llm_pool.ClientPool）时由池选择端点和模型、切换端点重试；
+    # 为对冲客户端（hedging.HedgedClient）时由它决定是否再发送一份相同的请求
+    if hasattr(client, 'complete'):
+        return client.complete(messages, temperature, top_p, retries=retries, limiter=limiter, model=model,
+                               **kwargs)
+    request_tokens = sum(tokens.count_tokens(m['content']) for m in messages) if limiter is not None else 0
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire(request_tokens)
+        start = time.perf_counter()
+        try:
+            completion = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                top_p=top_p,
+                **kwargs
+            )
+        except retryable_errors():
+            if attempt == retries:
+                metrics.record_llm(time.perf_counter() - start, retries=attempt, error=True)
+                raise
+            time.sleep(backoff * (2 ** attempt))
+        except Exception:
+            metrics.record_llm(time.perf_counter() - start, retries=attempt, error=True)
+            raise
+        else:
+            metrics.record_llm(time.perf_counter() - start, retries=attempt, usage=completion.usage)
+            return completion.choices[0].message.content.strip()
+
+
+def build_messages(system_prompt, user_prompt_template, comment):
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_prompt_template.format(comment=comment)}
+    ]
+
+
+def classify_comment(client, comment, model, system_prompt, user_prompt_template, temperature, top_p,
+                     retries=3, limiter=None, on_error=None, max_tokens=None, fallback_model=None, on_escalate=None):
+    # 回答统一为“是”/“否”。无法解析或含糊的回答在指定 fallback_model 时交给更强的模型重新分类，
+    # on_escalate(原回答, 重新分类结果) 用于统计；仍无法解析时记为“无法分类”
+    messages = build_messages(system_prompt, user_prompt_template, comment)
+    try:
+        answer = chat(client, model, messages, temperature, top_p, retries=retries, limiter=limiter,
+                      **({'max_tokens': max_tokens} if max_tokens else {}))
+        label = normalize_label(answer)
+        if label is None and fallback_model:
+            label = normalize_label(chat(client, fallback_model, messages, temperature, top_p, retries=retries,
+                                         limiter=limiter))
+            if on_escalate is not None:
+                on_escalate(answer, label)
+    except Exception as e:
+        if is_inspection_failed(e):
+            return LABEL_INAPPROPRIATE
+        if on_error is not None:
+            on_error(e)
+        return LABEL_UNCLASSIFIED
+    return label or LABEL_UNCLASSIFIED
+
+
+def parse_combined(answer):
+    # 解析合并请求的回答，返回 (分类, 关键词分析)：分类无法解析时为 (None, None)；
+    # 分类为“否”的评论关键词分析为空，分类为“是”却没有分析结果时记为“无法分析”
+    match = JSON_PATTERN.search(answer)
+    try:
+        result = json.loads(match.group(0)) if match else None
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        return None, None
+    label = normalize_label(result.get(COMBINED_LABEL_KEY, ''))
+    if label != LABEL_YES:
+        return label, '' if label else None
+    analysis = result.get(COMBINED_ANALYSIS_KEY)
+    if isinstance(analysis, (list, tuple)):
+        analysis = '、'.join(map(str, analysis))
+    return label, str(analysis or '').strip() or LABEL_UNANALYZED
+
+
+def classify_and_analyze(client, comment, model, system_prompt, combined_prompt_template, temperature, top_p,
+                         retries=3, limiter=None, on_error=None, fallback_model=None, on_escalate=None):
+    # 合并模式：一次请求得到 (分类, 关键词分析)，出错时与 classify_comment / analyze_keywords 使用相同的占位值
+    messages = build_messages(system_prompt, combined_prompt_template, comment)
+    try:
+        answer = chat(client, model, messages, temperature, top_p, retries=retries, limiter=limiter)
+        label, analysis = parse_combined(answer)
+        if label is None and fallback_model:
+            label, analysis = parse_combined(chat(client, fallback_model, messages, temperature, top_p,
+                                                  retries=retries, limiter=limiter))
+            if on_escalate is not None:
+                on_escalate(answer, label)
+    except Exception as e:
+        if is_inspection_failed(e):
+            return LABEL_INAPPROPRIATE, LABEL_UNANALYZED
+        if on_error is not None:
+            on_error(e)
+        return LABEL_UNCLASSIFIED, LABEL_UNANALYZED
+    if label is None:
+        return LABEL_UNCLASSIFIED, LABEL_UNANALYZED
+    return label, analysis
+
+
+def analyze_keywords(client, comment, model, system_prompt, keyword_prompt_template, temperature, top_p,
+                     retries=3, inspection_retries=3, inspection_wait=5, limiter=None, on_error=None):
+    messages = build_messages(system_prompt, keyword_prompt_template, comment)
+    for attempt in range(inspection_retries):
+        try:
+            return chat(client, model, messages, temperature, top_p, retries=retries, limiter=limiter)
+        except Exception as e:
+            if is_inspection_failed(e):
+                # 内容审查失败时等待后重试
+                time.sleep(inspection_wait)
+                continue
+            if on_error is not None:
+                on_error(e)
+            return LABEL_UNANALYZED
+    return LABEL_UNANALYZED
+
+
+def run_concurrent(fn, items, concurrency=1, on_done=None, cancelled=None):
+    # 并发执行 fn(item)，结果按输入顺序返回；on_done(完成数, 下标, 结果) 在调用线程中回调，
+    # 因此可以直接在回调里更新 Streamlit 组件。cancelled() 返回 True 时不再发送新的请求，
+    # 未执行的条目结果为 None
+    results = [None] * len(items)
+    if concurrency <= 1:
+        for i, item in enumerate(items):
+            if cancelled is not None and cancelled():
+                break
+            results[i] = fn(item)
+            if on_done is not None:
+                on_done(i + 1, i, results[i])
+        return results
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 工作线程继承调用方的上下文（如所在后台任务的性能统计）
+        futures = {executor.submit(contextvars.copy_context().run, fn, item): i for i, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), 1):
+            if cancelled is not None and cancelled():
+                for pending in futures:
+                    pending.cancel()
+            if future.cancelled():
+                continue
+            i = futures[future]
+            results[i] = future.result()
+            if on_done is not None:
+                on_done(done, i, results[i])
+    return results
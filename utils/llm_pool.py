@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from itertools import takewhile
+
+from utils import llm, metrics, tokens
+
+# 多端点（API 密钥、Base URL、模型）负载均衡：每个端点有自己的并发上限和限流，
+# 请求发往当前空闲且预计最快的端点；端点限流或出错时暂停一段时间并切换到其他端点
+EWMA_WEIGHT = 0.2
+COOLDOWN_BASE = 2.0
+COOLDOWN_MAX = 60.0
+# 编辑表格的列名，与 Endpoint 的参数一一对应
+EDITOR_COLUMNS = {'API 密钥': 'api_key', 'Base URL': 'base_url', '模型': 'model', '并发': 'concurrency',
+                  '每分钟请求数': 'rpm', '每分钟 Token 数': 'tpm'}
+
+
+class Endpoint:
+    def __init__(self, api_key, base_url, model, concurrency=4, rpm=0, tpm=0, timeout=60.0):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.concurrency = max(int(concurrency), 1)
+        self.limiter = llm.RateLimiter(int(rpm), int(tpm))
+        self.timeout = timeout
+        self.client = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.latency = None  # 指数加权平均延迟
+        self.failures = 0  # 连续失败次数，决定暂停时长
+        self.cooldown_until = 0.0
+
+    @property
+    def name(self):
+        return f"{self.model} @ {self.base_url} (…{self.api_key[-4:]})"
+
+    def get_client(self):
+        if self.client is None:
+            self.client = llm.init_client(self.api_key, self.base_url, timeout=self.timeout)
+        return self.client
+
+    def expected_wait(self, default_latency):
+        # 排队到本端点时预计的完成时间：平均延迟 × (进行中 + 1) / 并发上限
+        return (self.latency or default_latency) * (self.in_flight + 1) / self.concurrency
+
+
+class ClientPool:
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+        self.condition = threading.Condition()
+        self.waiting = deque()  # (标记, 可用端点)：按先来后到分配端点，避免个别请求一直抢不到空闲名额
+
+    def capacity(self):
+        # 所有端点的并发上限之和，作为页面上的并发请求数
+        return sum(endpoint.concurrency for endpoint in self.endpoints)
+
+    def serving(self, model):
+        # 提供指定模型的端点；model 为 None 时为全部端点
+        return [e for e in self.endpoints if model is None or e.model == model]
+
+    def _acquire(self, exclude, candidates):
+        # 从 candidates 中选出有空闲并发、不在暂停期、预计完成最快的端点；都不可用时等待。
+        # exclude 为本次请求已失败过的端点，其他端点可用时不再选它们。
+        # 排在前面、也能使用这些空闲端点的请求先分配；只能用其他端点的请求不挡住本请求
+        ticket = (object(), candidates)
+        with self.condition:
+            self.waiting.append(ticket)
+            while True:
+                now = time.monotonic()
+                ready = [e for e in candidates if e.in_flight < e.concurrency and e.cooldown_until <= now]
+                preferred = [e for e in ready if e not in exclude] or ready
+                ahead = takewhile(lambda other: other is not ticket, self.waiting)
+                if preferred and not any(e in other for _, other in ahead for e in ready):
+                    known = [e.latency for e in self.endpoints if e.latency is not None]
+                    default = sum(known) / len(known) if known else 1.0
+                    endpoint = min(preferred, key=lambda e: e.expected_wait(default))
+                    endpoint.in_flight += 1
+                    self.waiting.remove(ticket)
+                    self.condition.notify_all()
+                    return endpoint
+                resume = [e.cooldown_until for e in self.endpoints if e.cooldown_until > now]
+                self.condition.wait(timeout=min(resume) - now if resume else 1.0)
+
+    def _release(self, endpoint, latency=None, throttled=False, failed=False):
+        with self.condition:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            if latency is not None:
+                endpoint.latency = latency if endpoint.latency is None else (
+                    EWMA_WEIGHT * latency + (1 - EWMA_WEIGHT) * endpoint.latency)
+            if throttled or failed:
+                endpoint.errors += failed
+                endpoint.throttled += throttled
+                endpoint.failures += 1
+                endpoint.cooldown_until = time.monotonic() + min(COOLDOWN_BASE * 2 ** (endpoint.failures - 1),
+                                                                 COOLDOWN_MAX)
+            else:
+                endpoint.failures = 0
+            self.condition.notify_all()
+
+    def complete(self, messages, temperature, top_p, retries=3, limiter=None, model=None, **kwargs):
+        # 与 llm.chat 相同的接口语义：返回回答文本；限流、超时和端点故障（鉴权失败、模型不存在、5xx）
+        # 会切换端点重试，最多 retries 次；内容审查等与端点无关的错误直接抛出。
+        # model 为 None 时由各端点决定模型；指定 model（如模型级联的升级模型）时只发往提供该模型的端点，
+        # 没有这样的端点时用各端点的密钥和地址请求该模型
+        candidates = self.serving(model) or self.endpoints
+        request_tokens = sum(tokens.count_tokens(m['content']) for m in messages)
+        failed = set()
+        for attempt in range(retries + 1):
+            # 每次尝试（包括重试和切换端点）都是一次新请求，全局与端点限流都要各计一次
+            if limiter is not None:
+                limiter.acquire(request_tokens)
+            endpoint = self._acquire(failed, candidates)
+            outcome = {}  # 无论以何种方式结束，都归还端点的并发名额
+            try:
+                endpoint.limiter.acquire(request_tokens)
+                start = time.perf_counter()
+                try:
+                    completion = endpoint.get_client().chat.completions.create(
+                        model=model or endpoint.model, messages=messages, temperature=temperature, top_p=top_p,
+                        **kwargs)
+                except Exception as e:
+                    latency = time.perf_counter() - start
+                    outcome['throttled'] = isinstance(e, llm.retryable_errors())
+                    outcome['failed'] = not outcome['throttled'] and is_endpoint_failure(e)
+                    if not (outcome['throttled'] or outcome['failed']) or attempt == retries:
+                        metrics.record_llm(latency, retries=attempt, error=True)
+                        raise
+                    failed.add(endpoint)
+                    continue
+                outcome['latency'] = time.perf_counter() - start
+                metrics.record_llm(outcome['latency'], retries=attempt, usage=completion.usage)
+                return completion.choices[0].message.content.strip()
+            finally:
+                self._release(endpoint, **outcome)
+
+    def stats(self):
+        now = time.monotonic()
+        return [{
+            '端点': endpoint.name,
+            '并发上限': endpoint.concurrency,
+            '进行中': endpoint.in_flight,
+            '请求数': endpoint.requests,
+            '限流/超时': endpoint.throttled,
+            '失败': endpoint.errors,
+            '平均延迟 (s)': None if endpoint.latency is None else round(endpoint.latency, 3),
+            '暂停剩余 (s)': round(max(endpoint.cooldown_until - now, 0), 1),
+        } for endpoint in self.endpoints]
+
+
+def is_endpoint_failure(error):
+    # 只与端点本身有关的错误：鉴权失败、无权限、模型不存在、服务端错误；换一个端点可能成功
+    openai = metrics.import_module("openai")
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError, openai.NotFoundError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+@lru_cache(maxsize=4)
+def get_pool(specs, timeout=60.0):
+    # specs 为端点参数元组的元组；同一组端点在各次页面运行和后台任务间共用一个池，统计随之保留
+    return ClientPool([Endpoint(*spec, timeout=timeout) for spec in specs])
+
+
+def endpoint_specs(rows):
+    # 编辑表格的行 → 端点参数元组，缺少密钥、地址或模型的行忽略
+    specs = []
+    for row in rows:
+        values = {EDITOR_COLUMNS[column]: value for column, value in row.items() if column in EDITOR_COLUMNS}
+        if all(str(values.get(key) or '').strip() for key in ('api_key', 'base_url', 'model')):
+            specs.append((str(values['api_key']).strip(), str(values['base_url']).strip(), str(values['model']).strip(),
+                          int(values.get('concurrency') or 1), int(values.get('rpm') or 0),
+                          int(values.get('tpm') or 0)))
+    return tuple(specs)
+
+
+def endpoint_editor(api_key, base_url, model):
+    # 页面上的多端点设置：启用后返回端点参数元组（第一行为页面上方填写的端点），否则返回 None
+    import pandas as pd
+    import streamlit as st
+
+    with st.expander("多端点负载均衡"):
+        if not st.checkbox("启用多端点（多个 API 密钥、Base URL 或模型分担请求）", value=False):
+            return None
+        st.caption("第一行默认为上方填写的端点；请求优先发往空闲且延迟最低的端点，限流或出错时自动切换")
+        default = pd.DataFrame([{'API 密钥': api_key, 'Base URL': base_url, '模型': model, '并发': 4,
+                                 '每分钟请求数': 0, '每分钟 Token 数': 0}], columns=list(EDITOR_COLUMNS))
+        table = st.data_editor(default, num_rows="dynamic", hide_index=True, key="llm_endpoints")
+        specs = endpoint_specs(table.to_dict('records'))
+        if not specs:
+            st.error("请至少填写一个完整的端点（API 密钥、Base URL、模型）")
+            return None
+        st.caption(f"共 {len(specs)} 个端点，总并发 {sum(spec[3] for spec in specs)}")
+        return specs
+
+
+def stats_panel(pool, poll_seconds=2.0):
+    # 以固定间隔刷新各端点的请求统计
+    import pandas as pd
+    import streamlit as st
+
+    @st.fragment(run_every=poll_seconds)
+    def panel():
+        st.dataframe(pd.DataFrame(pool.stats()), hide_index=True)
+
+    with st.expander("端点统计"):
+        panel()
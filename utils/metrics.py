@@ -0,0 +1,235 @@
+import contextvars
+import importlib
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，峰值内存不可用
+    resource = None
+
+
+def peak_rss_mb():
+    # 进程峰值常驻内存（MB）；Linux 单位为 KB，macOS 单位为字节
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _NullStage:
+    # 关闭统计时所有阶段共用这个空对象，不计时也不分配内存
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    def __init__(self, run, name, rows=None):
+        self.run = run
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.run.add_stage(self.name, time.perf_counter() - self.start, self.rows, failed=exc_type is not None)
+        return False
+
+
+class RunMetrics:
+    def __init__(self, page):
+        self.page = page
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.stages = []
+        self.llm_latencies = []
+        self.llm_requests = 0
+        self.llm_retries = 0
+        self.llm_errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add_stage(self, name, seconds, rows=None, failed=False):
+        with self.lock:
+            self.stages.append({
+                'stage': name,
+                'seconds': round(seconds, 4),
+                'rows': rows,
+                'rows_per_s': round(rows / seconds, 1) if rows and seconds > 0 else None,
+                'peak_rss_mb': round(peak_rss_mb(), 1) if resource is not None else None,
+                'failed': failed
+            })
+
+    def add_llm(self, latency, retries=0, usage=None, error=False):
+        with self.lock:
+            self.llm_requests += 1
+            self.llm_retries += retries
+            if error:
+                self.llm_errors += 1
+            else:
+                self.llm_latencies.append(latency)
+            if usage is not None:
+                self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+                self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+
+    def summary(self):
+        with self.lock:
+            latencies = list(self.llm_latencies)
+            return {
+                'page': self.page,
+                'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+                'stages': list(self.stages),
+                'llm': {
+                    'requests': self.llm_requests,
+                    'retries': self.llm_retries,
+                    'errors': self.llm_errors,
+                    'latency_p50': percentile(latencies, 0.50),
+                    'latency_p95': percentile(latencies, 0.95),
+                    'latency_p99': percentile(latencies, 0.99),
+                    'prompt_tokens': self.prompt_tokens,
+                    'completion_tokens': self.completion_tokens
+                },
+                'peak_rss_mb': peak_rss_mb()
+            }
+
+
+# 当前的统计对象：页面脚本线程中为本次页面运行（各浏览器会话互不影响），后台任务线程中为该任务自己的统计；
+# 并发请求的工作线程通过 copy_context 继承所在任务的统计
+_current = contextvars.ContextVar("metrics_run", default=None)
+
+# 重型模块的导入耗时（秒），按进程记录，每个模块只在第一次导入时计时
+_import_times = {}
+
+
+def enable(page):
+    _current.set(RunMetrics(page))
+
+
+def disable():
+    _current.set(None)
+
+
+def is_enabled():
+    return _current.get() is not None
+
+
+def current():
+    return _current.get()
+
+
+def bind(run):
+    # 在后台任务线程中使用任务自己的统计（run 为 None 时不记录），返回用于 unbind 的令牌
+    return _current.set(run)
+
+
+def unbind(token):
+    _current.reset(token)
+
+
+def stage(name, rows=None):
+    # 用法：with metrics.stage("分词", rows=len(df)) as s: ...；行数也可以在块内通过 s.rows 补充
+    run = _current.get()
+    if run is None:
+        return _NULL_STAGE
+    return Stage(run, name, rows)
+
+
+def import_module(name):
+    # 用于延迟导入重型模块：在真正需要的阶段才导入，并记录首次导入的耗时
+    # 其他线程正在导入时 sys.modules 中是未初始化完的模块，此时经 importlib 等待导入完成
+    module = sys.modules.get(name)
+    if module is None or getattr(module.__spec__, '_initializing', False):
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        _import_times.setdefault(name, round(time.perf_counter() - start, 4))
+    return module
+
+
+def import_times():
+    return dict(_import_times)
+
+
+def record_llm(latency, retries=0, usage=None, error=False):
+    run = _current.get()
+    if run is not None:
+        run.add_llm(latency, retries, usage, error)
+
+
+def summary(run=None):
+    run = run or _current.get()
+    if run is None:
+        return {}
+    return {**run.summary(), 'imports': import_times()}
+
+
+def export_json(run=None):
+    return json.dumps(summary(run), ensure_ascii=False, indent=2)
+
+
+def sidebar_toggle(page):
+    # 在页面顶部调用：侧边栏开关决定本次运行是否记录统计；提交的后台任务另有自己的统计
+    import streamlit as st
+
+    if st.sidebar.checkbox("记录性能统计", key="metrics_enabled"):
+        enable(page)
+    else:
+        disable()
+
+
+def render_sidebar():
+    # 在页面末尾调用：在侧边栏展示本次运行的阶段耗时与模型请求统计
+    run = _current.get()
+    if run is None:
+        return
+    import streamlit as st
+
+    with st.sidebar.expander("性能统计", expanded=True):
+        render_run(run)
+
+
+def render_run(run, key=None):
+    # 展示一次运行（页面运行或后台任务）的阶段耗时与模型请求统计
+    import pandas as pd
+    import streamlit as st
+
+    data = summary(run)
+    if data['stages']:
+        st.dataframe(pd.DataFrame(data['stages']), hide_index=True)
+    llm_stats = data['llm']
+    if llm_stats['requests']:
+        st.write(f"模型请求: {llm_stats['requests']}，重试: {llm_stats['retries']}，失败: {llm_stats['errors']}")
+        st.write(f"延迟 p50/p95/p99: {llm_stats['latency_p50']:.3f}s / "
+                 f"{llm_stats['latency_p95']:.3f}s / {llm_stats['latency_p99']:.3f}s"
+                 if llm_stats['latency_p50'] is not None else "延迟: -")
+        st.write(f"Token 用量: 输入 {llm_stats['prompt_tokens']}，输出 {llm_stats['completion_tokens']}")
+        with run.lock:
+            latencies = list(run.llm_latencies)
+        if latencies:
+            counts = pd.cut(pd.Series(latencies), bins=10).value_counts(sort=False)
+            st.bar_chart(pd.Series(counts.values, index=[f"{b.right:.2f}s" for b in counts.index]))
+    if data['imports']:
+        st.write("模块导入耗时（本进程首次导入）:")
+        st.dataframe(pd.DataFrame(list(data['imports'].items()), columns=['模块', '秒']), hide_index=True)
+    if data['peak_rss_mb'] is not None:
+        st.write(f"进程峰值内存: {data['peak_rss_mb']:.0f} MB")
+    st.download_button("导出统计 JSON", export_json(run), file_name=f"metrics_{int(run.started_at)}.json",
+                       mime='application/json', key=key)
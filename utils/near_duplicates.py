@@ -0,0 +1,157 @@
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from utils import dataset_cache, incremental
+
+# 近似重复评论（刷屏、复制粘贴的评论）聚类：字符 shingle 的 MinHash 签名 + LSH 分桶，
+# 只比较落入同一个桶的评论，整体耗时随评论数近似线性增长
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+MAX_SHINGLES = 1000000  # 每块片段数上限，中间数组内存与评论数无关
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    # 规范化后去掉空白和标点，取所有长度为 k 的连续字符片段；短评论整体作为一个片段
+    text = re.sub(r'[\W_]+', '', incremental.normalize_text(text))
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def _hash_params(num_perm, seed):
+    # 乘法-移位哈希 h(x) = ((a * x + b) mod 2^64) >> 32，a 取奇数；每个 (a, b) 相当于一个随机排列
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def _shingle_chunks(texts, k):
+    # 逐块返回 (片段哈希, 所属行号)，每块片段数约为 MAX_SHINGLES（同一条评论的片段不拆开）
+    hashes, owners = [], []
+    for row, text in enumerate(texts):
+        for shingle in shingles(text, k):
+            hashes.append(zlib.crc32(shingle.encode('utf-8')))
+            owners.append(row)
+        if len(hashes) >= MAX_SHINGLES:
+            yield np.array(hashes, dtype=np.uint64), np.array(owners, dtype=np.int64)
+            hashes, owners = [], []
+    if hashes:
+        yield np.array(hashes, dtype=np.uint64), np.array(owners, dtype=np.int64)
+
+
+def signatures(texts, num_perm=NUM_PERM, k=SHINGLE_SIZE, seed=0):
+    # 返回 (签名矩阵 评论数 × num_perm, 是否有内容)；没有任何文字的评论不参与聚类
+    a, b = _hash_params(num_perm, seed)
+    texts = list(texts)
+    result = np.full((len(texts), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    has_content = np.zeros(len(texts), dtype=bool)
+    for hashes, owners in _shingle_chunks(texts, k):
+        docs, first = np.unique(owners, return_index=True)
+        # 逐个排列原地计算，中间数组只有块内片段数那么长
+        permuted = np.empty_like(hashes)
+        for j in range(num_perm):
+            np.multiply(hashes, a[j], out=permuted)
+            permuted += b[j]
+            permuted >>= np.uint64(32)
+            result[docs, j] = np.minimum.reduceat(permuted, first)
+        has_content[docs] = True
+    return result, has_content
+
+
+def choose_bands(threshold, num_perm=NUM_PERM):
+    # LSH 分为 bands 段、每段 rows 行，两条评论在 Jaccard 相似度约 (1 / bands) ^ (1 / rows) 以上时
+    # 大概率至少有一段完全相同；选取最接近目标阈值的划分
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+def cluster(texts, threshold=0.8, num_perm=NUM_PERM, k=SHINGLE_SIZE, seed=0):
+    # 返回每条评论所在簇的编号（簇内最靠前的行号）。LSH 给出候选对后再用签名估计的 Jaccard 相似度
+    # 过滤误报，最后按连通分量合并成簇
+    sig, has_content = signatures(texts, num_perm, k, seed)
+    n = len(sig)
+    bands, rows = choose_bands(threshold, num_perm)
+    candidates = np.flatnonzero(has_content)
+    pairs_i, pairs_j = [], []
+    for band in range(bands):
+        keys = sig[candidates, band * rows:(band + 1) * rows]
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        leaders = first[inverse]
+        linked = leaders != np.arange(len(candidates))
+        pairs_i.append(candidates[linked])
+        pairs_j.append(candidates[leaders[linked]])
+    i = np.concatenate(pairs_i) if pairs_i else np.empty(0, dtype=np.int64)
+    j = np.concatenate(pairs_j) if pairs_j else np.empty(0, dtype=np.int64)
+    if len(i):
+        similar = (sig[i] == sig[j]).mean(axis=1) >= threshold
+        i, j = i[similar], j[similar]
+    graph = sparse.coo_matrix((np.ones(len(i), dtype=np.int8), (i, j)), shape=(n, n))
+    _, components = csgraph.connected_components(graph, directed=False)
+    # 以每个连通分量中最靠前的行号作为簇编号
+    first_row = np.full(components.max() + 1 if n else 0, n, dtype=np.int64)
+    np.minimum.at(first_row, components, np.arange(n))
+    return first_row[components]
+
+
+def representatives(cluster_ids, likes=None, rows=None):
+    # 每个簇选一条代表评论（点赞最多的一条，相同时取最靠前的）；rows 限定候选行。
+    # 返回 {行号: 代表行号}，只包含 rows 中的行
+    rows = np.arange(len(cluster_ids)) if rows is None else np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return {}
+    likes = np.zeros(len(cluster_ids)) if likes is None else np.asarray(likes, dtype=np.float64)
+    frame = pd.DataFrame({'row': rows, 'cluster': np.asarray(cluster_ids)[rows], 'likes': likes[rows]})
+    best = frame.sort_values(['likes', 'row'], ascending=[False, True]).drop_duplicates('cluster')
+    return dict(zip(frame['row'], frame['cluster'].map(best.set_index('cluster')['row'])))
+
+
+def cluster_sizes(cluster_ids):
+    # 每条评论所在簇的评论数
+    _, inverse, counts = np.unique(cluster_ids, return_inverse=True, return_counts=True)
+    return counts[inverse.ravel()]
+
+
+def weights(cluster_ids):
+    # 降权系数：簇内每条评论计 1 / 簇大小，整个簇合计只相当于一条评论
+    return 1.0 / cluster_sizes(cluster_ids)
+
+
+def summary(cluster_ids, comments, likes=None):
+    # 评论数大于 1 的簇：代表评论、评论数与点赞数合计，按评论数从多到少排列
+    likes = np.zeros(len(cluster_ids)) if likes is None else pd.to_numeric(
+        pd.Series(likes), errors='coerce').fillna(0).to_numpy()
+    frame = pd.DataFrame({'簇编号': cluster_ids, '点赞数': likes})
+    table = frame.groupby('簇编号').agg(评论数=('点赞数', 'size'), 点赞数=('点赞数', 'sum')).reset_index()
+    table = table[table['评论数'] > 1].sort_values(['评论数', '点赞数'], ascending=False)
+    table.insert(1, '代表评论', [comments[i] for i in table['簇编号']])
+    return table.reset_index(drop=True)
+
+
+@lru_cache(maxsize=8)
+def for_column(dataset_path, column, threshold=0.8):
+    # 数据表某一列的聚类结果，同一数据表和阈值只计算一次
+    comments = dataset_cache.read_columns(dataset_path, [column])[column].fillna('').astype(str).tolist()
+    cluster_ids = cluster(comments, threshold)
+    cluster_ids.setflags(write=False)
+    return cluster_ids
+
+
+def weight_picker(dataset_path, column):
+    # 页面上的“近似重复评论降权”选项；启用时返回每条评论的降权系数，否则返回 None
+    import streamlit as st
+
+    if not st.checkbox("近似重复评论降权（刷屏、复制粘贴的评论整簇只计一条）", value=False):
+        return None
+    threshold = st.slider("近似重复相似度阈值", 0.5, 1.0, 0.8, 0.05)
+    cluster_ids = for_column(dataset_path, column, threshold)
+    duplicated = int((cluster_sizes(cluster_ids) > 1).sum())
+    st.caption(f"{duplicated} 条评论属于近似重复簇，共 {len(cluster_ids) - len(np.unique(cluster_ids))} 条被合并")
+    return weights(cluster_ids)
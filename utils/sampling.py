@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+# 分层抽样估算视觉类评论加权占比（视觉类评论点赞数 / 总点赞数），不必给每条评论分类。
+# 点赞数呈长尾分布：点赞最多的评论全部分类（普查层），其余有点赞的评论按点赞数分层随机抽样；
+# 没有点赞的评论不影响加权占比，不需要分类
+CENSUS_STRATUM = "点赞最高"
+# 只有明确回答“是/否”的评论计入估计；无法分类、不适当内容、未处理或回答无法解析的评论从样本中剔除
+# （相当于假定它们与同层其他评论的视觉类比例相同），剔除条数单独报告
+VALID_LABELS = ('是', '否')
+
+
+def strata(likes, census_size=100, n_strata=4):
+    # 返回每条评论所在的层：点赞最多的 census_size 条为普查层，其余有点赞的评论按 log(点赞数) 分位数
+    # 分成 n_strata 层；没有点赞的评论为 None
+    likes = np.asarray(likes, dtype=np.float64)
+    labels = np.full(len(likes), None, dtype=object)
+    positive = np.flatnonzero(likes > 0)
+    order = positive[np.argsort(-likes[positive], kind='stable')]
+    labels[order[:census_size]] = CENSUS_STRATUM
+    rest = order[census_size:]
+    if len(rest):
+        bins = pd.qcut(np.log1p(likes[rest]), q=n_strata, labels=False, duplicates='drop')
+        for i, b in zip(rest, bins):
+            labels[i] = f"第 {int(b) + 1} 层"
+    return labels
+
+
+class StratifiedEstimate:
+    # 各层已分类样本的点赞数 × 是否视觉类；估计量为 Σ_h 层点赞数 × 样本中视觉类点赞占比 / 总点赞数
+    # （分层比率估计：剔除的评论按其点赞数从分母中去掉）
+    def __init__(self, likes, stratum_labels, seed=0):
+        self.likes = np.asarray(likes, dtype=np.float64)
+        self.total_likes = self.likes.sum()
+        rng = np.random.default_rng(seed)
+        self.members = {}
+        names = {label for label in stratum_labels if label is not None}
+        # 普查层在前，其余按层号排列
+        for name in sorted(names, key=lambda name: (name != CENSUS_STRATUM, len(name), name)):
+            rows = np.flatnonzero(stratum_labels == name)
+            self.members[name] = rows if name == CENSUS_STRATUM else rng.permutation(rows)
+        self.taken = {name: 0 for name in self.members}
+        self.values = {name: [] for name in self.members}
+        self.weights = {name: [] for name in self.members}  # 样本中计入估计的评论的点赞数
+        self.excluded = {name: 0 for name in self.members}
+        self.rng = rng
+
+    def next_rows(self, name, count):
+        # 按随机顺序取出该层接下来的 count 条评论
+        start = self.taken[name]
+        rows = self.members[name][start:start + count]
+        self.taken[name] = start + len(rows)
+        return rows.tolist()
+
+    def record(self, name, rows, visual):
+        self.values[name].extend(self.likes[rows] * np.asarray(visual, dtype=np.float64))
+        self.weights[name].extend(self.likes[rows])
+
+    def exclude(self, name, count):
+        self.excluded[name] += count
+
+    def exhausted(self, name):
+        return self.taken[name] >= len(self.members[name])
+
+    def piloted(self, pilot=10):
+        # 每一层都已有至少 pilot 条样本（或已全部取出）时，区间估计才可信
+        return all(len(self.values[name]) >= pilot or self.exhausted(name) for name in self.members)
+
+    def _numerators(self, resample=0):
+        # 加权占比的分子（视觉类评论点赞数）的估计值；resample > 0 时返回层内自助重抽样的估计值
+        totals = np.zeros(resample) if resample else 0.0
+        for name, values in self.values.items():
+            values, weights = np.asarray(values), np.asarray(self.weights[name])
+            if len(values) == 0:
+                continue
+            stratum_likes = self.likes[self.members[name]].sum()
+            if not resample or self.exhausted(name):
+                # 已全部分类的层没有抽样误差（剔除的评论按比率估计补足），也不再做自助重抽样
+                totals = totals + values.sum() / weights.sum() * stratum_likes
+            else:
+                picks = self.rng.integers(0, len(values), size=(resample, len(values)))
+                totals = totals + values[picks].sum(axis=1) / weights[picks].sum(axis=1) * stratum_likes
+        return totals
+
+    def ratio(self):
+        return self._numerators() / self.total_likes if self.total_likes else 0.0
+
+    def interval(self, confidence=0.95, resamples=1000):
+        if not self.total_likes:
+            return 0.0, 0.0
+        ratios = self._numerators(resamples) / self.total_likes
+        alpha = (1 - confidence) / 2
+        return float(np.quantile(ratios, alpha)), float(np.quantile(ratios, 1 - alpha))
+
+    def allocation(self, batch_size, pilot=10):
+        # 下一批样本在各层的分配：样本不足 pilot 条的层先补足，其余按 Neyman 分配（N_h × 样本标准差）
+        open_strata = [name for name in self.members if not self.exhausted(name)]
+        counts = {name: max(pilot - len(self.values[name]), 0) for name in open_strata}
+        remaining = batch_size - sum(counts.values())
+        if remaining > 0 and open_strata:
+            scores = np.array([len(self.members[name]) * (np.std(self.values[name]) if self.values[name] else 1.0)
+                               for name in open_strata])
+            if scores.sum() == 0:
+                scores = np.array([len(self.members[name]) for name in open_strata], dtype=np.float64)
+            for name, share in zip(open_strata, scores / scores.sum()):
+                counts[name] += int(np.ceil(remaining * share))
+        return {name: count for name, count in counts.items() if count}
+
+    def table(self):
+        rows = []
+        for name, values in self.values.items():
+            rows.append({'层': name, '评论数': len(self.members[name]), '已分类': len(values),
+                         '已剔除': self.excluded[name],
+                         '点赞数': float(self.likes[self.members[name]].sum()),
+                         '视觉类点赞数（样本）': float(np.sum(values))})
+        return pd.DataFrame(rows)
+
+
+def estimate(likes, label_rows, census_size=100, n_strata=4, target_width=0.05, batch_size=100,
+             confidence=0.95, max_calls=None, cancelled=None, on_round=None, seed=0):
+    # label_rows(rows) 返回这些评论的分类结果（“是”计为视觉类，非“是/否”的结果剔除）。先分类普查层，
+    # 再按批抽样，直到置信区间宽度不超过 target_width、达到 max_calls 或所有评论都已分类
+    stratum_labels = strata(likes, census_size, n_strata)
+    state = StratifiedEstimate(likes, stratum_labels, seed)
+    labels = {}
+
+    def classify(plan):
+        for name, count in plan.items():
+            rows = state.next_rows(name, count)
+            if rows:
+                results = label_rows(rows)
+                labels.update(zip(rows, results))
+                kept = [(row, label) for row, label in zip(rows, results) if label in VALID_LABELS]
+                state.record(name, [row for row, _ in kept], [label == '是' for _, label in kept])
+                state.exclude(name, len(rows) - len(kept))
+
+    history = []
+    if CENSUS_STRATUM in state.members:
+        classify({CENSUS_STRATUM: len(state.members[CENSUS_STRATUM])})
+    while True:
+        low, high = state.interval(confidence)
+        history.append({'已分类': len(labels), '已剔除': sum(state.excluded.values()),
+                        '加权占比': state.ratio(), '下限': low, '上限': high})
+        if on_round is not None:
+            on_round(history[-1])
+        plan = state.allocation(batch_size)
+        if max_calls is not None:
+            plan = dict(zip(plan, _trim(list(plan.values()), max_calls - len(labels))))
+        if ((state.piloted() and high - low <= target_width) or not any(plan.values())
+                or (cancelled is not None and cancelled())):
+            break
+        classify(plan)
+
+    return {
+        'ratio': state.ratio(),
+        'low': low,
+        'high': high,
+        'labels': labels,
+        'excluded': sum(state.excluded.values()),
+        'strata': stratum_labels,
+        'table': state.table(),
+        'history': pd.DataFrame(history),
+    }
+
+
+def _trim(counts, budget):
+    # 按顺序截断各层的样本数，使总数不超过剩余预算
+    trimmed = []
+    for count in counts:
+        take = max(min(count, budget), 0)
+        trimmed.append(take)
+        budget -= take
+    return trimmed
@@ -0,0 +1,204 @@
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+import jieba
+
+from utils import metrics
+
+# 词典与停用词放在仓库的 LDA 目录下，按绝对路径加载，与启动目录无关
+DICT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "LDA")
+USER_DICTS = [
+    "SogouLabDic.txt",
+    "dict_baidu_utf8.txt",
+    "dict_pangu.txt",
+    "dict_sougou_utf8.txt",
+    "dict_tencent_utf8.txt",
+    "my_dict.txt",
+]
+STOPWORDS_FILE = "Stopword.txt"
+
+_loaded_dicts = set()
+_dicts_lock = threading.Lock()
+
+
+def load_user_dicts(dict_dir=DICT_DIR, names=USER_DICTS):
+    # 每个进程只加载一次；仓库中没有的词典文件（如 dict_sougou_utf8.txt）直接跳过。
+    # 预热线程与页面可能同时调用，加锁避免重复加载
+    with _dicts_lock:
+        for name in names:
+            path = os.path.join(dict_dir, name)
+            if path not in _loaded_dicts and os.path.exists(path):
+                jieba.load_userdict(path)
+                _loaded_dicts.add(path)
+
+
+@lru_cache(maxsize=None)
+def load_stopwords(dict_dir=DICT_DIR):
+    with open(os.path.join(dict_dir, STOPWORDS_FILE), encoding='utf-8') as f:
+        return frozenset(line.rstrip() for line in f)
+
+
+def ensure_dicts():
+    # 词典在第一次分词时才加载（或由预热线程提前加载）
+    if not _loaded_dicts:
+        load_user_dicts()
+
+
+class Segmenter:
+    # 分词方式的统一接口：cut 单条、cut_batch 批量，结果统一做停用词过滤
+    def __init__(self, name, tokenize, stopwords=True, batch_tokenize=None):
+        self.name = name
+        self.tokenize = tokenize
+        self.batch_tokenize = batch_tokenize
+        self.stopwords = load_stopwords() if stopwords else frozenset()
+        # 分词缓存（TokenStore）的键：分词方式、词典或停用词处理变化时需要得到不同的缓存
+        self.cache_name = f"{name}-stopwords" if stopwords else name
+
+    def _filter(self, words):
+        # 只在过滤停用词时同时去掉空白词；不过滤停用词的分词方式保持分词器的原始输出（与原先的 pkuseg 页面一致）
+        if not self.stopwords:
+            return list(words)
+        return [word for word in words if word.strip() and word not in self.stopwords]
+
+    def cut(self, text):
+        return self._filter(self.tokenize(text))
+
+    def cut_batch(self, texts, chunk_size=1000):
+        if self.batch_tokenize is None:
+            return [self.cut(text) for text in texts]
+        results = []
+        for start in range(0, len(texts), chunk_size):
+            results.extend(self._filter(words) for words in self.batch_tokenize(texts[start:start + chunk_size]))
+        return results
+
+
+def _jieba_batch(cut_function):
+    # 多条评论以换行连接后一次分词，再按换行拆回，省去逐条调用的开销。
+    # 评论中的空白（含 \r，jieba 会把 "\r\n" 当作一个词）先统一替换为空格，保证一条评论对应一行
+    def batch(texts):
+        results = [[]]
+        for word in cut_function('\n'.join(re.sub(r'\s', ' ', text) for text in texts)):
+            if word == '\n':
+                results.append([])
+            else:
+                results[-1].append(word)
+        if len(results) != len(texts):
+            raise ValueError(f"批量分词结果 {len(results)} 行与评论数 {len(texts)} 不一致")
+        return results
+    return batch
+
+
+def _jieba(cut_function):
+    def create():
+        ensure_dicts()
+        return cut_function, _jieba_batch(cut_function)
+    return create
+
+
+def _pkuseg():
+    model = metrics.import_module("pkuseg").pkuseg(model_name='web')
+    return model.cut, None
+
+
+def _char_ngrams(n=2):
+    # 不依赖词典的字符 n-gram：中文连续字符切成重叠的 n 元组，字母数字串整体保留
+    def tokenize(text):
+        words = []
+        for chunk in re.findall(r'[\u4e00-\u9fff]+|[A-Za-z0-9]+', text):
+            if not '\u4e00' <= chunk[0] <= '\u9fff' or len(chunk) <= n:
+                words.append(chunk)
+            else:
+                words.extend(chunk[i:i + n] for i in range(len(chunk) - n + 1))
+        return words
+    return tokenize, None
+
+
+# 可选的分词方式：名称 -> (说明, 创建函数)；创建函数返回 (单条分词函数, 批量分词函数或 None)
+BACKENDS = {
+    'jieba': ("jieba 精确模式", _jieba(jieba.cut)),
+    'jieba_search': ("jieba 搜索引擎模式", _jieba(jieba.cut_for_search)),
+    'pkuseg': ("pkuseg（web 领域模型）", _pkuseg),
+    'char_bigram': ("字符二元组（无需词典）", _char_ngrams),
+}
+DEFAULT_BACKEND = 'jieba'
+
+
+def backend_label(name):
+    return BACKENDS[name][0]
+
+
+@lru_cache(maxsize=None)
+def get_segmenter(name=DEFAULT_BACKEND, stopwords=True):
+    # 每种分词方式每个进程只创建一次（pkuseg 模型、jieba 词典只加载一次）
+    tokenize, batch_tokenize = BACKENDS[name][1]()
+    return Segmenter(name, tokenize, stopwords, batch_tokenize)
+
+
+def segmenter_picker(label="分词方式"):
+    # 页面上的分词方式选择框，选择结果在各页面间共享
+    import streamlit as st
+
+    names = list(BACKENDS)
+    chosen = st.session_state.get('segmenter', DEFAULT_BACKEND)
+    st.session_state.segmenter = st.selectbox(label, names, index=names.index(chosen), format_func=backend_label)
+    return st.session_state.segmenter
+
+
+def cut(text):
+    # 默认分词方式（jieba 精确模式）的分词和停用词过滤
+    return get_segmenter().cut(text)
+
+
+def preprocess_text(text):
+    # 供 CountVectorizer 使用的预处理：分词后以空格连接
+    return ' '.join(cut(text))
+
+
+def benchmark(texts, names=None, sample_size=2000):
+    # 在当前数据的样本上比较各分词方式：加载耗时、每秒词数与内存（tracemalloc 峰值）
+    import tracemalloc
+
+    import pandas as pd
+
+    texts = list(texts[:sample_size])
+    chars = sum(len(text) for text in texts)
+    rows = []
+    for name in names or list(BACKENDS):
+        row = {'分词方式': backend_label(name)}
+        try:
+            tracemalloc.start()
+            start = time.perf_counter()
+            segmenter = get_segmenter(name)
+            row['加载耗时 (s)'] = round(time.perf_counter() - start, 3)
+            results = segmenter.cut_batch(texts)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # 计时单独再跑一遍，避免 tracemalloc 拖慢分词
+            start = time.perf_counter()
+            segmenter.cut_batch(texts)
+            seconds = time.perf_counter() - start
+        except ImportError as e:
+            tracemalloc.stop()
+            row['说明'] = f"不可用：{e}"
+            rows.append(row)
+            continue
+        words = sum(len(words) for words in results)
+        row.update({
+            '评论数': len(texts),
+            '词数': words,
+            '平均词长': round(chars / words, 2) if words else None,
+            '词/秒': round(words / seconds) if seconds > 0 else None,
+            '字/秒': round(chars / seconds) if seconds > 0 else None,
+            '峰值内存 (MB)': round(peak / 1024 / 1024, 1),
+        })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def extract_tags(text, **kwargs):
+    # jieba.analyse 导入较慢，在第一次提取关键词时才导入
+    ensure_dicts()
+    return metrics.import_module("jieba.analyse").extract_tags(text, **kwargs)
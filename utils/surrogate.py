@@ -0,0 +1,102 @@
+import random
+
+from utils import metrics, segment
+
+POSITIVE, NEGATIVE = '是', '否'
+SOURCE_LLM, SOURCE_LOCAL = "大模型", "本地模型"
+
+
+def train(texts, labels):
+    # TF-IDF（jieba 分词）+ 逻辑回归；只用大模型给出的“是/否”标签训练
+    pairs = [(text, label) for text, label in zip(texts, labels) if label in (POSITIVE, NEGATIVE)]
+    if len({label for _, label in pairs}) < 2:
+        return None  # 只有一个类别时无法训练
+    # sklearn 只在启用两级分类时才导入
+    TfidfVectorizer = metrics.import_module("sklearn.feature_extraction.text").TfidfVectorizer
+    LogisticRegression = metrics.import_module("sklearn.linear_model").LogisticRegression
+    make_pipeline = metrics.import_module("sklearn.pipeline").make_pipeline
+    model = make_pipeline(TfidfVectorizer(tokenizer=segment.cut, token_pattern=None, lowercase=False),
+                          LogisticRegression(class_weight='balanced', max_iter=1000))
+    model.fit([text for text, _ in pairs], [label == POSITIVE for _, label in pairs])
+    return model
+
+
+def positive_proba(model, texts):
+    return model.predict_proba(texts)[:, 1] if texts else []
+
+
+def agreement(model, texts, labels):
+    # 本地模型与大模型在留出集上的一致率
+    pairs = [(text, label) for text, label in zip(texts, labels) if label in (POSITIVE, NEGATIVE)]
+    if model is None or not pairs:
+        return None
+    predicted = positive_proba(model, [text for text, _ in pairs]) >= 0.5
+    matches = sum(p == (label == POSITIVE) for p, (_, label) in zip(predicted, pairs))
+    return {'count': len(pairs), 'agreement': matches / len(pairs)}
+
+
+def two_tier(texts, label_with_llm, seed_size=300, holdout_size=100, low=0.2, high=0.8,
+             retrain_every=200, random_state=0, cancelled=None):
+    # texts: 待分类评论；label_with_llm(indices) 返回这些评论的大模型标签（未发送的评论为 None，不计入大模型分类数）。
+    # 先用随机种子样本训练本地模型，之后每轮把置信度落在 (low, high) 区间内、最不确定的
+    # retrain_every 条评论交给大模型，并用新标签重新训练，直到没有不确定的评论为止。
+    # cancelled() 为真时在下一轮开始前停止，未分类的评论标签保持 None
+    order = list(range(len(texts)))
+    random.Random(random_state).shuffle(order)
+    seed, holdout = order[:seed_size], order[seed_size:seed_size + holdout_size]
+
+    labels = [None] * len(texts)
+    sources = [None] * len(texts)
+
+    def ask_llm(indices):
+        # 返回实际得到回答的评论数
+        answered = 0
+        for i, label in zip(indices, label_with_llm(indices)):
+            if label is not None:
+                labels[i], sources[i] = label, SOURCE_LLM
+                answered += 1
+        return answered
+
+    ask_llm(seed + holdout)
+    train_indices = list(seed)
+    model = train([texts[i] for i in train_indices], [labels[i] for i in train_indices])
+    holdout_texts, holdout_labels = [texts[i] for i in holdout], [labels[i] for i in holdout]
+    seed_report = agreement(model, holdout_texts, holdout_labels)
+
+    rounds = 0
+    stopped = False
+    remaining = [i for i in order if labels[i] is None]
+    while remaining:
+        if cancelled is not None and cancelled():
+            stopped = True
+            break
+        if model is None:
+            ask_llm(remaining)  # 无法训练本地模型时全部交给大模型
+            break
+        proba = positive_proba(model, [texts[i] for i in remaining])
+        uncertain = sorted((abs(p - 0.5), i) for p, i in zip(proba, remaining) if low < p < high)
+        if not uncertain:
+            for i, p in zip(remaining, proba):
+                labels[i], sources[i] = (POSITIVE if p >= 0.5 else NEGATIVE), SOURCE_LOCAL
+            break
+        batch = [i for _, i in uncertain[:retrain_every]]
+        if not ask_llm(batch):
+            stopped = True  # 一条都没有发送（任务已取消）
+            break
+        train_indices += batch
+        model = train([texts[i] for i in train_indices], [labels[i] for i in train_indices])
+        remaining = [i for i in remaining if labels[i] is None]
+        rounds += 1
+
+    return {
+        'labels': labels,
+        'sources': sources,
+        'llm_calls': sources.count(SOURCE_LLM),
+        'local': sources.count(SOURCE_LOCAL),
+        'rounds': rounds,
+        'cancelled': stopped,
+        'model': model,  # 最终的本地模型；种子样本只有一种分类结果时为 None
+        # 留出集一致率：holdout 为最终（最后一次重新训练后）模型，seed_holdout 为只用种子样本训练的模型
+        'holdout': agreement(model, holdout_texts, holdout_labels),
+        'seed_holdout': seed_report,
+    }
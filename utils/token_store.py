@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import shutil
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+from utils import dataset_cache, metrics
+
+# 分词结果按（数据表、列、分词方式）保存在这里，之后各页面直接内存映射读取
+TOKEN_DIR = os.environ.get("COMMENT_TOOL_TOKEN_DIR", os.path.join(".cache", "tokens"))
+# 缓存格式版本：版本 1 的批量分词在评论以 \r 结尾时会错行；版本 2 不过滤停用词时也去掉了空白词。
+# 提高版本号后不再读取这些缓存
+CACHE_VERSION = 3
+
+
+class TokenStore:
+    # 分词后的语料：词表 vocab 中每个词只保存一次，第 i 条评论的词 ID 为 indices[indptr[i]:indptr[i + 1]]（int32）
+    def __init__(self, vocab, indptr, indices):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.indices = indices
+        self._word_ids = None
+
+    @classmethod
+    def build(cls, token_lists):
+        word_ids = {}
+        indices = array('i')
+        indptr = array('q', [0])
+        for words in token_lists:
+            for word in words:
+                indices.append(word_ids.setdefault(word, len(word_ids)))
+            indptr.append(len(indices))
+        return cls(list(word_ids), np.frombuffer(indptr, dtype=np.int64), np.frombuffer(indices, dtype=np.int32))
+
+    def save(self, path):
+        # 先写入临时目录再改名，避免并发读取到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, "indptr.npy"), self.indptr)
+        np.save(os.path.join(tmp_path, "indices.npy"), self.indices)
+        with open(os.path.join(tmp_path, "vocab.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        if os.path.exists(path):
+            shutil.rmtree(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, "vocab.json"), encoding='utf-8') as f:
+            vocab = json.load(f)
+        return cls(vocab, np.load(os.path.join(path, "indptr.npy"), mmap_mode=mode),
+                   np.load(os.path.join(path, "indices.npy"), mmap_mode=mode))
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def doc(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def tokens(self, i):
+        return [self.vocab[j] for j in self.doc(i)]
+
+    def subset(self, rows):
+        # 只含 rows（布尔掩码或行号）这些评论的新语料，第 i 条为选中的第 i 条评论；词表不变
+        rows = np.flatnonzero(rows) if np.asarray(rows).dtype == bool else np.asarray(rows, dtype=np.int64)
+        starts, lengths = self.indptr[rows], self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return TokenStore(self.vocab, indptr, np.asarray(self.indices[positions], dtype=np.int32))
+
+    def word_id(self, word):
+        if self._word_ids is None:
+            self._word_ids = {word: i for i, word in enumerate(self.vocab)}
+        return self._word_ids.get(word, -1)
+
+    def to_csr(self, rows=None, weights=None):
+        # 评论 × 词的计数矩阵；rows 为布尔掩码或行号时只取这些评论，
+        # weights（每条评论一个系数，如近似重复评论的降权系数）不为空时计数乘以对应系数
+        data = np.ones(len(self.indices), dtype=np.int32)
+        matrix = sparse.csr_matrix((data, self.indices, self.indptr), shape=(len(self), len(self.vocab)))
+        # 内存映射的数组只读，合并同一评论中的重复词之前先取出（复制）所需的行
+        matrix = matrix.copy() if rows is None else matrix[rows]
+        matrix.sum_duplicates()
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+            matrix = sparse.diags(weights if rows is None else weights[rows]) @ matrix
+        return matrix
+
+    def term_counts(self, rows=None, weights=None):
+        # 每个词的出现次数（长度为词表大小的数组）
+        if rows is None and weights is None:
+            return np.bincount(self.indices, minlength=len(self.vocab))
+        return np.asarray(self.to_csr(rows, weights).sum(axis=0)).ravel()
+
+    def to_gensim(self, rows=None, min_df=2, max_df=0.95, keep=None, weights=None):
+        # 供 gensim 训练的语料与词典：按文档频率过滤词表（与 CountVectorizer 的 min_df/max_df 相同），
+        # keep(word) 可进一步筛选词语；weights 为每条评论的权重（文档频率仍按评论数计算）
+        Dictionary = metrics.import_module("gensim.corpora").Dictionary
+        Sparse2Corpus = metrics.import_module("gensim.matutils").Sparse2Corpus
+
+        matrix = self.to_csr(rows, weights)
+        dfs = np.bincount(matrix.indices, minlength=len(self.vocab))
+        max_count = max_df * matrix.shape[0] if isinstance(max_df, float) else max_df
+        kept = np.flatnonzero((dfs >= min_df) & (dfs <= max_count))
+        if keep is not None:
+            kept = np.array([i for i in kept if keep(self.vocab[i])], dtype=np.int64)
+        if len(kept) == 0:
+            raise ValueError("按文档频率过滤后词表为空，请降低 min_df 或提高 max_df")
+        corpus = Sparse2Corpus(matrix[:, kept], documents_columns=False)
+        id2word = Dictionary.from_corpus(corpus, id2word={i: self.vocab[j] for i, j in enumerate(kept)})
+        return corpus, id2word
+
+
+def store_path(*key_parts):
+    digest = hashlib.blake2b('\x1f'.join(map(str, key_parts)).encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(TOKEN_DIR, digest)
+
+
+def for_column(dataset_path, column, segmenter, rows=None, chunk_size=10000):
+    # 数据表某一列的分词结果（segmenter 为 segment.Segmenter）：已有缓存时直接内存映射，
+    # 否则分批分词一次并写入缓存。dataset_path 为按内容哈希命名的 Parquet 缓存文件，内容变化时自然得到新的键。
+    # rows（布尔掩码）只需要部分评论时（如只统计视觉类评论），已有整列缓存则从中取出，
+    # 否则只对这些评论分词，按所选行另存一份缓存；返回的语料中第 i 条为选中的第 i 条评论
+    path = store_path(os.path.basename(dataset_path), column, segmenter.cache_name, CACHE_VERSION)
+    if rows is not None:
+        rows = np.asarray(rows, dtype=bool)
+        if os.path.exists(path):
+            return TokenStore.load(path).subset(rows)
+        path = store_path(os.path.basename(dataset_path), column, segmenter.cache_name, CACHE_VERSION,
+                          hashlib.blake2b(np.packbits(rows).tobytes(), digest_size=16).hexdigest())
+    if not os.path.exists(path):
+        comments = dataset_cache.read_columns(dataset_path, [column])[column].fillna('').astype(str)
+        comments = (comments if rows is None else comments[rows]).tolist()
+        TokenStore.build(words for start in range(0, len(comments), chunk_size)
+                         for words in segmenter.cut_batch(comments[start:start + chunk_size])).save(path)
+    return TokenStore.load(path)
@@ -0,0 +1,92 @@
+import re
+from functools import lru_cache
+
+# 通义千问等模型没有公开 tiktoken 编码，用 cl100k_base 近似计数
+DEFAULT_ENCODING = "cl100k_base"
+
+# chat 格式中每条消息的固定开销，以及回复开头的开销
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+CJK_PATTERN = re.compile(r'[一-鿿]')
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name=DEFAULT_ENCODING):
+    # tiktoken 首次使用需要下载编码文件，离线时退回按字符估算
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+
+def estimate_tokens(text):
+    # 无法使用 tiktoken 时的估算：中文按字计，其余按 4 个字符一个 token
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode_ordinary(text))
+
+
+def count_tokens_batch(texts):
+    encoding = get_encoding()
+    if encoding is None:
+        return [estimate_tokens(text) for text in texts]
+    return [len(ids) for ids in encoding.encode_ordinary_batch(list(texts))]
+
+
+def truncate_to_tokens(text, max_tokens):
+    encoding = get_encoding()
+    if encoding is None:
+        # 估算模式下二分查找不超过预算的最长前缀
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if estimate_tokens(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+    ids = encoding.encode_ordinary(text)
+    if len(ids) <= max_tokens:
+        return text
+    # 截断位置可能落在多字节字符中间，去掉解码出的替换字符
+    return encoding.decode(ids[:max_tokens]).rstrip('�')
+
+
+def prompt_overhead(system_prompt, user_prompt_template):
+    # 每个请求中除评论本身外的固定 token 数
+    return (count_tokens(system_prompt) + count_tokens(user_prompt_template.format(comment=''))
+            + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY)
+
+
+def estimate_run(comment_tokens, overhead, output_tokens, price_input=0.0, price_output=0.0,
+                 concurrency=1, rpm=0, tpm=0, latency=1.0):
+    # 根据评论 token 数、并发与限流配置估算总 token、费用（单价按每千 token）和耗时
+    requests = len(comment_tokens)
+    input_tokens = sum(comment_tokens) + overhead * requests
+    total_output = output_tokens * requests
+    cost = input_tokens / 1000 * price_input + total_output / 1000 * price_output
+
+    # 耗时取并发、每分钟请求数、每分钟 token 数三者中最紧的约束
+    bounds = {'并发': requests * latency / max(1, concurrency)}
+    if rpm:
+        bounds['每分钟请求数'] = requests / rpm * 60
+    if tpm:
+        bounds['每分钟 token 数'] = (input_tokens + total_output) / tpm * 60
+    bottleneck = max(bounds, key=bounds.get)
+
+    return {
+        'requests': requests,
+        'input_tokens': input_tokens,
+        'output_tokens': total_output,
+        'cost': cost,
+        'eta_seconds': bounds[bottleneck],
+        'bottleneck': bottleneck
+    }
@@ -0,0 +1,120 @@
+import os
+import re
+
+from utils import metrics, segment, token_store
+
+# 磁盘流式 LDA 的词典与 Matrix Market 语料文件
+LDA_DIR = os.environ.get("COMMENT_TOOL_LDA_DIR", os.path.join(".cache", "lda"))
+
+
+def keep_word(word):
+    # 至少包含两个连续文字的词（过滤单字和标点）
+    return re.search(r'\w\w', word)
+
+
+# 主题建模（gensim 与 sklearn 导入较慢，在训练时才导入）
+def perform_topic_modeling_gensim(data, n_topics=5, preprocessor=segment.preprocess_text):
+    CountVectorizer = metrics.import_module("sklearn.feature_extraction.text").CountVectorizer
+    Dictionary = metrics.import_module("gensim.corpora").Dictionary
+    Sparse2Corpus = metrics.import_module("gensim.matutils").Sparse2Corpus
+    LdaModel = metrics.import_module("gensim.models").LdaModel
+
+    vectorizer = CountVectorizer(preprocessor=preprocessor, max_df=0.95, min_df=2, stop_words='english')
+    doc_term_matrix = vectorizer.fit_transform(data)
+
+    # 转换为gensim可用的格式
+    corpus = Sparse2Corpus(doc_term_matrix, documents_columns=False)
+    id2word = Dictionary.from_corpus(corpus,
+                                     id2word=dict((i, s) for i, s in enumerate(vectorizer.get_feature_names_out())))
+
+    lda = LdaModel(corpus=corpus, num_topics=n_topics, id2word=id2word, random_state=0)
+
+    return lda, id2word, corpus
+
+
+def perform_topic_modeling_store(store, n_topics=5, rows=None, weights=None):
+    # 直接使用分词缓存（TokenStore）训练，不再把分词结果拼回字符串交给 CountVectorizer；
+    # 与上面相同：过滤文档频率过低/过高的词，以及不含两个以上连续文字的词（单字、标点）。
+    # weights 为每条评论的权重，近似重复的刷屏评论降权后不再主导主题
+    corpus, id2word = store.to_gensim(rows, min_df=2, max_df=0.95, keep=keep_word, weights=weights)
+    LdaModel = metrics.import_module("gensim.models").LdaModel
+    lda = LdaModel(corpus=corpus, num_topics=n_topics, id2word=id2word, random_state=0)
+    return lda, id2word, corpus
+
+
+class TokenFile:
+    # 逐行读取已分词的文本文件（每行一条评论，词之间用空格分隔，如 LDA/cut_words.py 生成的 data_full.dat），
+    # 可重复迭代，每次只在内存中保留一行
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+
+    def __iter__(self):
+        with open(self.path, encoding=self.encoding, errors='ignore') as f:
+            for line in f:
+                yield line.split()
+
+
+class StoreDocuments:
+    # 以词列表的形式逐条读取分词缓存（TokenStore），同样可重复迭代
+    def __init__(self, store, rows=None):
+        self.store = store
+        self.rows = range(len(store)) if rows is None else rows
+
+    def __iter__(self):
+        for i in self.rows:
+            yield self.store.tokens(i)
+
+
+def stream_dictionary(documents, no_below=2, no_above=0.95, keep=keep_word):
+    # 一次流式遍历建立词典，再按文档频率过滤（与 CountVectorizer 的 min_df=2、max_df=0.95 相同）；
+    # 词典本身在词数超过 prune_at 时会自动裁剪，内存占用有上限
+    Dictionary = metrics.import_module("gensim.corpora").Dictionary
+    dictionary = Dictionary(documents)
+    dictionary.filter_extremes(no_below=no_below, no_above=no_above, keep_n=None)
+    if keep is not None:
+        dictionary.filter_tokens(bad_ids=[i for i, word in dictionary.iteritems() if not keep(word)])
+    if len(dictionary) == 0:
+        raise ValueError("按文档频率过滤后词表为空，请降低 min_df 或提高 max_df")
+    return dictionary
+
+
+def serialize_corpus(documents, dictionary, path):
+    # 第二次流式遍历，把词袋写成 Matrix Market 文件；返回按需从磁盘读取的语料（不整体载入内存）
+    MmCorpus = metrics.import_module("gensim.corpora").MmCorpus
+    MmCorpus.serialize(path, (dictionary.doc2bow(words) for words in documents))
+    return MmCorpus(path)
+
+
+def perform_topic_modeling_stream(documents, path, n_topics=5, chunksize=2000, passes=1):
+    # 语料大于内存时使用：documents 为可重复迭代的词列表序列（TokenFile、StoreDocuments），
+    # 词典、语料文件和训练都按流处理，内存占用与语料大小无关。path 为语料文件路径（.mm），
+    # 词典一并保存为 path + '.dict'；两者都已存在时直接复用，不再遍历 documents
+    LdaModel = metrics.import_module("gensim.models").LdaModel
+    dictionary_path = f"{path}.dict"
+    if os.path.exists(dictionary_path):
+        dictionary = metrics.import_module("gensim.corpora").Dictionary.load(dictionary_path)
+        corpus = metrics.import_module("gensim.corpora").MmCorpus(path)
+    else:
+        dictionary = stream_dictionary(documents)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        corpus = serialize_corpus(documents, dictionary, path)
+        # 词典最后写入：语料写到一半中断时不会被当作完整的缓存
+        dictionary.save(dictionary_path)
+    lda = LdaModel(corpus=corpus, num_topics=n_topics, id2word=dictionary, chunksize=chunksize, passes=passes,
+                   random_state=0)
+    return lda, dictionary, corpus
+
+
+def corpus_path(*key_parts):
+    # 与分词缓存相同的键：数据表、列和分词方式
+    return os.path.join(LDA_DIR, os.path.basename(token_store.store_path(*key_parts)), "corpus.mm")
+
+
+def topic_table(lda, n_words=10):
+    # 每个主题的前若干个关键词及权重
+    rows = []
+    for topic_id in range(lda.num_topics):
+        for rank, (word, weight) in enumerate(lda.show_topic(topic_id, topn=n_words), 1):
+            rows.append({"主题": topic_id + 1, "排名": rank, "词语": word, "权重": float(weight)})
+    return rows
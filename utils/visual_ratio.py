@@ -0,0 +1,94 @@
+import os
+
+import pandas as pd
+
+from utils import dataset_cache, llm
+
+SUMMARY_COLUMNS = ['总评论数', '视觉类评论数', '总点赞数', '视觉类评论点赞数', '视觉类评论加权占比']
+
+
+def validity_mask(comments):
+    # 有效评论：非空且不只包含逗号（一次性向量化计算）
+    text = comments.fillna('').astype(str)
+    return (text.str.strip() != '') & (text != ',,,,')
+
+
+def is_visual(labels):
+    # 分类为“是”的行；兼容旧结果中“是的”“是。”等未规范化的回答。只对不同的取值各解析一次
+    labels = labels.fillna('').astype(str)
+    positive = [label for label in labels.unique() if llm.normalize_label(label) == llm.LABEL_YES]
+    return labels.isin(positive)
+
+
+def visual_mask(data, comment_column, classification_column='classification', valid=None):
+    if valid is None:
+        valid = validity_mask(data[comment_column])
+    return valid & is_visual(data[classification_column])
+
+
+def numeric_likes(likes):
+    return pd.to_numeric(likes, errors='coerce').fillna(0)
+
+
+def summarize(frame, group_column, comment_column, likes_column, classification_column='classification'):
+    # 对所有视频一次 groupby 汇总总评论数、视觉类评论数、点赞数和加权占比
+    valid = validity_mask(frame[comment_column])
+    visual = visual_mask(frame, comment_column, classification_column, valid)
+    likes = numeric_likes(frame[likes_column])
+    parts = pd.DataFrame({
+        group_column: frame[group_column],
+        '总评论数': valid,
+        '视觉类评论数': visual,
+        '总点赞数': likes.where(valid, 0),
+        '视觉类评论点赞数': likes.where(visual, 0),
+    })
+    table = parts.groupby(group_column, sort=False).sum()
+    table['视觉类评论加权占比'] = (table['视觉类评论点赞数'] / table['总点赞数'].where(table['总点赞数'] != 0)).fillna(0)
+    return table[SUMMARY_COLUMNS]
+
+
+def tidy(table):
+    # 按行取出结果时数值会统一成浮点，这里把计数和整数点赞数还原为整数
+    table = table.copy()
+    for column in SUMMARY_COLUMNS[:-1]:
+        if (table[column] % 1 == 0).all():
+            table[column] = table[column].astype('int64')
+    return table
+
+
+def summarize_single(data, comment_column, likes_column, classification_column='classification'):
+    frame = data.assign(_video=0)
+    table = tidy(summarize(frame, '_video', comment_column, likes_column, classification_column))
+    return {column: table[column].iloc[0] for column in SUMMARY_COLUMNS}
+
+
+def video_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def summarize_videos(datasets, comment_column, likes_column, classification_column='classification', cache=None):
+    # datasets: {视频名: Parquet 缓存路径}；cache 以 (缓存路径, 列名) 为键保存已汇总的结果，
+    # 新增视频时只读取和汇总新的文件
+    cache = {} if cache is None else cache
+    columns = (comment_column, likes_column, classification_column)
+    missing = {name: path for name, path in datasets.items() if (path, columns) not in cache}
+
+    if missing:
+        frames = []
+        for name, path in missing.items():
+            frame = dataset_cache.read_columns(path, list(columns))
+            frame['视频'] = name
+            frames.append(frame)
+        # 没有任何行的文件不会出现在 groupby 结果中，按全部视频补齐为 0
+        table = summarize(pd.concat(frames, ignore_index=True), '视频', *columns).reindex(list(missing), fill_value=0)
+        for name, path in missing.items():
+            cache[(path, columns)] = table.loc[name].to_dict()
+
+    rows = [{'视频': name, **cache[(path, columns)]} for name, path in datasets.items()]
+    return tidy(pd.DataFrame(rows, columns=['视频'] + SUMMARY_COLUMNS))
+
+
+def total_row(table):
+    totals = table[SUMMARY_COLUMNS[:-1]].sum()
+    ratio = totals['视觉类评论点赞数'] / totals['总点赞数'] if totals['总点赞数'] else 0
+    return {'视频': '合计', **totals.to_dict(), '视觉类评论加权占比': ratio}
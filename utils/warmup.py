@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+
+from utils import metrics, segment
+
+# 后台预热时导入的重型模块（未安装的可选依赖直接跳过）
+MODULES = [
+    "openai",
+    "jieba.analyse",
+    "scipy.sparse",
+    "sklearn.feature_extraction.text",
+    "gensim.corpora",
+    "gensim.matutils",
+    "gensim.models",
+    "matplotlib.pyplot",
+    "wordcloud",
+    "pyLDAvis",
+    "pyLDAvis.gensim_models",
+]
+
+_started = False
+_lock = threading.Lock()
+# 预热结果：名称 -> 耗时（秒）或出错信息
+status = {}
+
+
+def enabled():
+    # 设置环境变量 COMMENT_TOOL_WARMUP=0 可关闭预热
+    return os.environ.get("COMMENT_TOOL_WARMUP", "1") != "0"
+
+
+def warm_up(modules=MODULES):
+    start = time.perf_counter()
+    segment.get_segmenter()
+    status["jieba 词典"] = round(time.perf_counter() - start, 4)
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            metrics.import_module(name)
+        except ImportError as e:
+            status[name] = f"跳过：{e}"
+        else:
+            status[name] = round(time.perf_counter() - start, 4)
+
+
+def start():
+    # 每个进程只启动一次；在后台线程中运行，不阻塞页面
+    global _started
+    with _lock:
+        if _started or not enabled():
+            return
+        _started = True
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()